@@ -1,12 +1,13 @@
 
+import numpy as np
 import pandas as pd
-import datetime as dt
 import math
 
 
 def initialize(context):
 
     context.use_adjusted = False
+    context.adjusted_path = 'data/adjusted/%s.csv'
     context.active = [sid(22739), sid(22972), sid(22446), sid(23921), sid(23870)]
     context.cash = sid(23870)
     context.bill = sid(23870)
@@ -49,25 +50,22 @@ def initialize(context):
 
 
     if context.use_adjusted:
-        start_year = 2002
-        end_year = dt.datetime.today().year + 1
-        url_template = "http://real-chart.finance.yahoo.com/table.csv?s=%s&a=0&b=1&c=%d&d=0&e=1&f=%d&g=d&ignore=.csv"
-
+        # one <SYMBOL>.csv per asset with the Date and Adj Close columns of a Yahoo download
         for sym in context.active:
-            url = url_template % (sym.symbol, start_year, end_year)
-            print("Fetching %s adjusted prices: %s" % (sym.symbol, url))
+            path = context.adjusted_path % sym.symbol
+            print("Loading %s adjusted prices: %s" % (sym.symbol, path))
 
             fetch_csv(
-                url,
+                path,
                 date_column='Date',
                 date_format='%Y-%m-%d',
                 symbol=sym,
                 usecols=['Adj Close'],
-                pre_func=fetch_pre,
-                post_func=fetch_post
+                pre_func=fetch_pre
             )
 
 
+
 def handle_data(context, data):
     record(leverage=context.portfolio.positions_value / context.portfolio.portfolio_value)
 
@@ -79,70 +77,33 @@ def rebalance(context, data):
 
 
 def reallocate(context, data):
-    h = make_history(context, data).ix[-280:]
-    h_low = history(300, '1d', 'low').ix[-280:]
-    h_high = history(300, '1d', 'high').ix[-280:]
-
-    hm = h.resample('M', how='last')[context.active]
-    hb = h.resample('M', how='last')[context.bill]
-    ret = hm.pct_change().ix[-12:]
+    h = make_history(context, data).iloc[-280:]
+    h_low = history(300, '1d', 'low').iloc[-280:]
+    h_high = history(300, '1d', 'high').iloc[-280:]
 
-    N = len(context.active)
-
-    non_cash_assets = list(context.active)
-    non_cash_assets.remove(context.cash)
+    monthly = h.groupby([h.index.year, h.index.month]).last()
+    hm = monthly[context.active]
+    hb = monthly[context.bill]
 
     print("---")
 
 
-    # excess return momentum
-    mom = (hm.ix[-1] / hm.ix[-2] - hb.ix[-1] / hb.ix[-2] + \
-           hm.ix[-1] / hm.ix[-4] - hb.ix[-1] / hb.ix[-4] + \
-           hm.ix[-1] / hm.ix[-7] - hb.ix[-1] / hb.ix[-7] + \
-           hm.ix[-1] / hm.ix[-13] - hb.ix[-1] / hb.ix[-13]) / 22
-
-    # nominal return correlation to equi-weight portfolio
-    ew_index = ret.mean(axis=1)
-    corr = pd.Series([0.0] * N, index=context.active)
-    for s in corr.index:
-        corr[s] = ret[s].corr(ew_index)
-
-    vol = ret.std()
-
-    ivol = (h_high[context.active].ix[-10:] - h_low[context.active].ix[-10:]).mean() / (
+    ivol = (h_high[context.active].iloc[-10:] - h_low[context.active].iloc[-10:]).mean() / (
                 h_high[context.active] - h_low[context.active]).mean()
 
-    # Generalized Momentum
-    # wi ~ zi = ( ri^wR * (1-ci)^wC / vi^wV / ivoli^wIV )^wS
-
-    wR = context.score_weights[0]
-    wC = context.score_weights[1]
-    wV = context.score_weights[2]
-    wS = context.score_weights[3]
-    eps = context.score_weights[4]
-    wIV = context.score_weights[5]
-
-    z = ((mom ** wR) * ((1 - corr) ** wC) / (vol ** wV) / (ivol ** wIV)) ** (wS + eps)
-    z[mom < 0.] = 0.0
+    weights, cpf, top = eaa_allocations(hm.values[-13:], hb.values[-13:], ivol.values,
+                                        [context.score_weights], context.active.index(context.cash))
 
     # Crash Protection
-    num_neg = z[z <= 0].count()
-    cpf = float(num_neg) / N
-    print("cpf = %f" % cpf)
-
-    # Security selection
-    # TopN = Min( 1 + roundup( sqrt( N ), rounddown( N / 2 ) )
-    top_n = min(math.ceil(N ** 0.5) + 1, N / 2)
+    print("cpf = %f" % cpf[0])
 
     # Allocation
-    top_z = z.order().index[-top_n:]
+    top_z = [s for s, selected in zip(context.active, top[0]) if selected]
     print("top_z = %s" % [i.symbol for i in top_z])
 
-    w_z = ((1 - cpf) * z[top_z] / z[top_z].sum()).dropna()
     w = pd.Series([0.0] * len(context.assets), index=context.assets)
-    for s in w_z.index:
-        w[s] = w_z[s]
-    w[context.cash] += cpf
+    for s, weight in zip(context.active, weights[0]):
+        w[s] += weight
     print("Allocation:\n%s" % w)
 
     context.alloc = w
@@ -150,21 +111,84 @@ def reallocate(context, data):
 
 def make_history(context, data):
     if context.use_adjusted:
-        df = pd.DataFrame(index=data[context.active[0]]['aclose_hist'].index, columns=context.active)
-        for s in context.active:
-            df[s] = data[s]['aclose_hist']
-        return df
+        return data.history(context.active, 'aclose', 300, '1d')
     else:
         return history(300, '1d', 'price')
 
 
 def fetch_pre(df):
-    df = df.rename(columns={'Adj Close': 'aclose'})
-    df['aclose_hist'] = pd.Series([[]] * len(df.index), index=df.index)
-    return df
+    return df.rename(columns={'Adj Close': 'aclose'})
+
 
+def eaa_allocations(monthly, bill, ivol, score_weights, cash):
+    """
+    Score and allocate many EAA universes for a batch of score weights in one array pass.
 
-def fetch_post(df):
-    for i in range(0, len(df.index)):
-        df['aclose_hist'].ix[-i - 1] = df['aclose'][-i - 300:][:300]
-    return df
\ No newline at end of file
+    monthly is a (..., 13, N) cube of month-end prices whose last row is the current month, bill the
+    matching (..., 13) bill prices and ivol the (..., N) intraday volatility ratios; the leading
+    dimensions are free (universes, months, ...). score_weights is a sequence of K
+    (wR, wC, wV, wS, eps, wIV) tuples and cash the column that takes the crash protection fraction.
+
+    Returns (weights, cpf, top) shaped (K, ..., N), (K, ...) and (K, ..., N).
+    """
+    monthly = np.asarray(monthly, dtype=float)
+    bill = np.asarray(bill, dtype=float)[..., None]
+    ivol = np.asarray(ivol, dtype=float)
+    score_weights = np.asarray(score_weights, dtype=float)
+    N = monthly.shape[-1]
+
+    # excess return momentum
+    last = monthly[..., -1, :]
+    mom = 0.0
+    for lag in (1, 3, 6, 12):
+        mom = mom + last / monthly[..., -1 - lag, :] - bill[..., -1, :] / bill[..., -1 - lag, :]
+    mom = mom / 22
+
+    # nominal return correlation to equi-weight portfolio
+    ret = monthly[..., 1:, :] / monthly[..., :-1, :] - 1
+    ret_dev = ret - ret.mean(axis=-2, keepdims=True)
+    ew_index = ret.mean(axis=-1, keepdims=True)
+    ew_dev = ew_index - ew_index.mean(axis=-2, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = (ret_dev * ew_dev).sum(axis=-2) / np.sqrt((ret_dev ** 2).sum(axis=-2) * (ew_dev ** 2).sum(axis=-2))
+
+    vol = ret.std(axis=-2, ddof=1)
+
+    # Generalized Momentum
+    # wi ~ zi = ( ri^wR * (1-ci)^wC / vi^wV / ivoli^wIV )^wS
+    shape = (len(score_weights),) + (1,) * mom.ndim
+    wR, wC, wV, wS, eps, wIV = [score_weights[:, i].reshape(shape) for i in range(6)]
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        z = ((mom ** wR) * ((1 - corr) ** wC) / (vol ** wV) / (ivol ** wIV)) ** (wS + eps)
+    z = np.where(mom < 0., 0.0, z)
+
+    # Crash Protection
+    cpf = (z <= 0).sum(axis=-1) / float(N)
+
+    # Security selection
+    # TopN = Min( 1 + roundup( sqrt( N ), rounddown( N / 2 ) )
+    top_n = int(min(math.ceil(N ** 0.5) + 1, N // 2))
+    ranks = np.where(np.isnan(z), np.inf, z).argsort(axis=-1, kind='mergesort').argsort(axis=-1)
+    top = ranks >= N - top_n
+
+    # Allocation
+    top_z = np.where(top, z, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = (1 - cpf)[..., None] * top_z / np.nansum(top_z, axis=-1, keepdims=True)
+    weights = np.where(np.isfinite(weights), weights, 0.0)
+    weights[..., cash] += cpf
+
+    return weights, cpf, top
+
+
+def monthly_windows(monthly, months=13):
+    """
+    Zero-copy (..., T - months + 1, months, N) view of trailing month windows over a (..., T, N) cube
+    of month-end prices, ready to pass to eaa_allocations for every month of a backtest at once.
+    """
+    monthly = np.asarray(monthly)
+    count = monthly.shape[-2] - months + 1
+    shape = monthly.shape[:-2] + (count, months, monthly.shape[-1])
+    strides = monthly.strides[:-2] + (monthly.strides[-2],) + monthly.strides[-2:]
+    return np.lib.stride_tricks.as_strided(monthly, shape=shape, strides=strides, writeable=False)
@@ -1,9 +1,11 @@
+import heapq
+import itertools
+
 from quantopian.pipeline import Pipeline
 from quantopian.algorithm import attach_pipeline, pipeline_output
 
-# Import specific filters and factors which will be used
+# Import specific filters which will be used
 from quantopian.pipeline.filters import QTradableStocksUS
-from quantopian.pipeline.factors import BusinessDaysSincePreviousEvent
 
 # Import datasets which will be used
 from quantopian.pipeline.data.factset.estimates import PeriodicConsensus, Actuals
@@ -12,7 +14,8 @@ from quantopian.pipeline.data.sentdex import sentiment
 # import optimize
 import quantopian.optimize as opt
 
-# Import pandas
+# Import numpy and pandas
+import numpy as np
 import pandas as pd
 
 
@@ -38,6 +41,9 @@ def initialize(context):
     # Make our pipeline and attach to the algo
     attach_pipeline(make_pipeline(context), 'earnings_pipe')
 
+    # Announcement state, updated only for the names with news each day
+    context.events = EarningsEvents(context)
+
     # Place orders
     schedule_function(
         func=place_orders,
@@ -49,7 +55,7 @@ def initialize(context):
 def make_pipeline(context):
     """
     Define our pipeline.
-    This implements the logic determining longs and shorts
+    It only delivers the raw inputs, the long and short logic lives in EarningsEvents
     """
 
     # Create datasets of sales estimates and actuals for the most recent quarter (fq0).
@@ -65,35 +71,18 @@ def make_pipeline(context):
     # beat analyst expectations. A negative value means the company missed expectations.
     surprise = (fq0_eps_act_value - fq0_eps_cons_mean) / fq0_eps_cons_mean
 
-    # Calculate the days since an earnings announcement impacted trading
-    # The asof_date considers whether an announcement was before or after hours
-    # We want to open on recent announcements but then close after an announcement is old
-    days_since_announcement = BusinessDaysSincePreviousEvent(inputs=[fq0_eps_act.asof_date])
-    recent_announcement = days_since_announcement <= context.MAX_DAYS_AFTER_EARNINGS_TO_OPEN
-    old_announcement = days_since_announcement > context.MAX_DAYS_AFTER_EARNINGS_TO_HOLD
+    # The date of the announcement. The asof_date considers whether an announcement was before or
+    # after hours; the days since it are counted by EarningsEvents
+    announcement = fq0_eps_act.asof_date.latest
 
     # Define a sentiment factor.
     news_sentiment = sentiment.sentiment_signal.latest
 
-    # Select short stocks which recently beat earnings and have a positive news sentiment. 
-    # Likewise long stocks which recently missed earnings estimates and have a negative sentiment.
-    shorts = (
-            recent_announcement
-            & (surprise > context.MIN_SHORT_SURPRISE)
-            & (news_sentiment > context.MIN_SHORT_SENTIMENT)
-    )
-    longs = (
-            recent_announcement
-            & (surprise < context.MAX_LONG_SURPRISE)
-            & (news_sentiment < context.MAX_LONG_SENTIMENT)
-    )
-
     pipe = Pipeline(
         columns={
-            'longs': longs,
-            'shorts': shorts,
             'surprise': surprise,
-            'old_announcement': old_announcement,
+            'asof_date': announcement,
+            'sentiment': news_sentiment,
         },
         screen=QTradableStocksUS(),
     )
@@ -101,12 +90,111 @@ def make_pipeline(context):
     return pipe
 
 
+class EarningsEvents(object):
+    """
+    The earnings signal kept up to date incrementally. Only a handful of names get a new Actuals
+    asof_date on a given day, so instead of recomputing the business days since the announcement
+    and the sentiment screen for the whole universe, each announcement is indexed by the dates on
+    which it leaves the open window (more than MAX_DAYS_AFTER_EARNINGS_TO_OPEN business days old)
+    and the hold window (more than MAX_DAYS_AFTER_EARNINGS_TO_HOLD). A day's update touches the
+    names with a new or revised announcement and the names crossing one of these dates.
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self.horizons = (context.MAX_DAYS_AFTER_EARNINGS_TO_OPEN, context.MAX_DAYS_AFTER_EARNINGS_TO_HOLD)
+        # asset -> asof_date (datetime64[D]) and surprise of its latest announcement
+        self.announced = {}
+        self.surprise = {}
+        # assets announced at most 3 (recent) and at most 40 (holdable) business days ago
+        self.recent = set()
+        self.holdable = set()
+        # heap of (date the announcement gets too old, horizon, push order, asset, asof_date)
+        self.expiries = []
+        self.pushes = itertools.count()
+        self.last = None
+        self.universe = pd.Index([])
+        self.opens = pd.Series([], dtype=float)
+
+    def update(self, today, output):
+        """
+        Apply one day's pipeline output: today is the session date, output the frame with the
+        surprise, asof_date and sentiment columns.
+        """
+        today = np.datetime64(today, 'D')
+        surprise = output['surprise']
+        announced = output['asof_date']
+
+        # the names whose announcement or surprise differ from the previous output
+        if self.last is None:
+            changed = announced.notnull()
+        else:
+            previous = self.last.reindex(output.index)
+            changed = announced.notnull() & (
+                (announced != previous['asof_date']) |
+                ((surprise != previous['surprise']) & ~(surprise.isnull() & previous['surprise'].isnull())))
+        self.last = output[['surprise', 'asof_date']]
+
+        # names whose asof_date went missing are neither recent nor holdable any more
+        cleared = announced.isnull().values & output.index.isin(list(self.announced))
+        for asset in output.index[cleared]:
+            del self.announced[asset], self.surprise[asset]
+            self.recent.discard(asset)
+            self.holdable.discard(asset)
+
+        names = output.index[changed.values]
+        dates = announced.values[changed.values].astype('datetime64[D]')
+        for asset, asof, value in zip(names, dates, surprise.values[changed.values]):
+            self.surprise[asset] = value
+            if self.announced.get(asset) == asof:
+                continue
+            # a new announcement restarts both windows
+            self.announced[asset] = asof
+            self.recent.add(asset)
+            self.holdable.add(asset)
+            for horizon, days in enumerate(self.horizons):
+                # the first day with more than `days` business days since asof
+                expiry = np.busday_offset(asof, days + 1, roll='forward')
+                heapq.heappush(self.expiries, (expiry, horizon, next(self.pushes), asset, asof))
+
+        while self.expiries and self.expiries[0][0] <= today:
+            expiry, horizon, _, asset, asof = heapq.heappop(self.expiries)
+            if self.announced.get(asset) == asof:
+                (self.recent, self.holdable)[horizon].discard(asset)
+
+        # the sentiment screen only runs over the recent announcements
+        self.universe = output.index
+        context = self.context
+        recent = pd.Index(list(self.recent))
+        recent = recent[recent.isin(self.universe)]
+        values = pd.Series([self.surprise[asset] for asset in recent], index=recent, dtype=float)
+        news = output['sentiment'].reindex(recent)
+        longs = (values < context.MAX_LONG_SURPRISE) & (news < context.MAX_LONG_SENTIMENT)
+        shorts = (values > context.MIN_SHORT_SURPRISE) & (news > context.MIN_SHORT_SENTIMENT)
+        # (again invert the surprise)
+        self.opens = -values[longs | shorts]
+
+    def candidates(self, positions):
+        """
+        (alphas of the names to open, alphas of the positions to hold) for the held assets
+        `positions`. A position is held while it is in the pipeline output and its announcement
+        isn't old, which includes names without an asof_date; the others get no alpha.
+        """
+        positions = list(positions)
+        opens = self.opens[~self.opens.index.isin(positions)]
+        held = self.last[self.last.index.isin(positions)]
+        old = held['asof_date'].notnull().values & ~held.index.isin(list(self.holdable))
+        holds = -held['surprise'][~old]
+        return opens, holds
+
+
 def before_trading_start(context, data):
     """
     Run our pipeline to fetch the actual data. 
     """
 
     context.output = pipeline_output('earnings_pipe')
+    context.events.update(get_datetime().date(), context.output)
 
 
 def place_orders(context, data):
@@ -114,18 +202,11 @@ def place_orders(context, data):
     Use Optimize to place orders all at once
     """
 
-    # get a list of the currently held securities.
-    current_positions = list(context.portfolio.positions)
-
-    # Make a series of the longs and shorts and associated alphas
-    long_alphas = -context.output.query('index not in @current_positions and longs').surprise
-    short_alphas = -context.output.query('index not in @current_positions and shorts').surprise
-
-    # Hold any current positions which the announcement isn't old (again invert the surprise)
-    hold_these_alphas = -context.output.query('index in @current_positions and not old_announcement').surprise
+    # The longs and shorts to open and the current positions whose announcement isn't old
+    open_alphas, hold_alphas = context.events.candidates(context.portfolio.positions)
 
-    # Combine the three
-    all_alphas = pd.concat([long_alphas, short_alphas, hold_these_alphas])
+    # Combine the two
+    all_alphas = pd.concat([open_alphas, hold_alphas])
 
     # Create our maximize alpha objective
     alpha_objective = opt.MaximizeAlpha(all_alphas)
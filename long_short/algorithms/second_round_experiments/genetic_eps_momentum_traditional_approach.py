@@ -1,3 +1,6 @@
+import time
+from collections import OrderedDict
+
 import numpy as np
 from quantopian.algorithm import order_optimal_portfolio
 from quantopian.algorithm import attach_pipeline, pipeline_output
@@ -14,30 +17,112 @@ Genetic Algorithm Operators
 '''
 
 
+class Population(object):
+    """
+    Whole population as one (pop_size x gen_num) genome array plus fitness and ER vectors.
+    assets names the genome columns once Evolve has run, so the population can seed the next call.
+    """
+
+    def __init__(self, genomes, fitness=None, ER=None, assets=None):
+        self.genomes = np.array(genomes, dtype=float, ndmin=2)
+        self.assets = assets
+        size = len(self.genomes)
+        self.fitness = np.full(size, np.nan) if fitness is None else np.array(fitness, dtype=float)
+        self.ER = np.full(size, np.nan) if ER is None else np.array(ER, dtype=float)
+
+    def __len__(self):
+        return len(self.genomes)
+
+    @classmethod
+    def random(cls, pop_size, gen_num):
+        return cls(np.random.uniform(0.0, 100.0, (pop_size, gen_num)))
+
+    @classmethod
+    def fromIndividuals(cls, pop):
+        return cls([individual['Genome'] for individual in pop],
+                   [individual['Fitness'] for individual in pop],
+                   [individual['ER'] for individual in pop])
+
+    def individual(self, i):
+        return {'Genome': self.genomes[i].tolist(), 'Fitness': self.fitness[i], 'ER': self.ER[i]}
+
+    def toIndividuals(self):
+        return [self.individual(i) for i in range(len(self))]
+
+    def take(self, indices):
+        return Population(self.genomes[indices], self.fitness[indices], self.ER[indices])
+
+
+def remapPopulation(population, assets, pop_size, weights=None):
+    # warm start: names shared with the previous population keep the genes of its best genomes,
+    # new names are drawn at random, and previous weights (asset -> weight) become one more genome
+    seeded = Population.random(pop_size, len(assets))
+    if population is not None and population.assets is not None:
+        previous = dict((asset, i) for i, asset in enumerate(population.assets))
+        columns = [j for j, asset in enumerate(assets) if asset in previous]
+        sources = [previous[assets[j]] for j in columns]
+        ranked = np.argsort(-np.nan_to_num(population.fitness, nan=-np.inf))[:pop_size]
+        seeded.genomes[np.ix_(np.arange(len(ranked)), columns)] = population.genomes[np.ix_(ranked, sources)]
+
+    if weights:
+        genome = seeded.genomes[-1]
+        for j, asset in enumerate(assets):
+            if asset in weights:
+                genome[j] = weights[asset] * 50.0 * len(assets)
+    return seeded
+
+
+def mutatePopulation(population, probability):
+    # one dice per individual, then a single normal draw for all genes of the mutated rows
+    mutated = np.random.uniform(0.0, 1.0, len(population)) < probability
+    if mutated.any():
+        noise = np.random.normal(0, 1, (np.count_nonzero(mutated), population.genomes.shape[1]))
+        population.genomes[mutated] = np.maximum(population.genomes[mutated] + noise, 0.0)
+        population.fitness[mutated] = np.nan
+        population.ER[mutated] = np.nan
+    return population
+
+
+def crossoverPoints(pairs, gen_num, probability):
+    # crossover point of every pair, gen_num (i.e. no crossover) where the dice fails
+    crossed = np.random.uniform(0.0, 1.0, pairs) < probability
+    points = np.full(pairs, gen_num)
+    if gen_num > 1:
+        points[crossed] = np.random.randint(1, gen_num, np.count_nonzero(crossed))
+    return points
+
+
+def crossoverPopulation(parents_1, parents_2, probability):
+    # masked one-point crossover of parents_1[i] with parents_2[i], children of both halves stacked
+    gen_num = parents_1.genomes.shape[1]
+    points = crossoverPoints(len(parents_1), gen_num, probability)
+    head = np.arange(gen_num) < points[:, np.newaxis]
+    crossed = points < gen_num
+
+    genomes = np.concatenate((np.where(head, parents_1.genomes, parents_2.genomes),
+                              np.where(head, parents_2.genomes, parents_1.genomes)))
+    fitness = np.concatenate((np.where(crossed, np.nan, parents_1.fitness),
+                              np.where(crossed, np.nan, parents_2.fitness)))
+    ER = np.concatenate((np.where(crossed, np.nan, parents_1.ER),
+                         np.where(crossed, np.nan, parents_2.ER)))
+    return Population(genomes, fitness, ER)
+
+
 def creatPopulation(pop_size, gen_num):
-    pop = []
-    for i in range(pop_size):
-        genome = np.random.uniform(0.0, 100.0, gen_num).tolist()
-        individual = {'Genome': genome, 'Fitness': np.nan, 'ER': np.nan}
-        pop.append(individual)
-    return pop
+    return Population.random(pop_size, gen_num).toIndividuals()
 
 
 def mutation(individual, probability):
-    if np.random.uniform(0.0, 1.0) < probability:
-        for gen in range(len(individual['Genome'])):
-            individual['Genome'][gen] = individual['Genome'][gen] + np.random.normal(0, 1)
-            if individual['Genome'][gen] < 0.0:
-                individual['Genome'][gen] = 0.0
-
+    population = mutatePopulation(Population([individual['Genome']]), probability)
+    individual['Genome'][:] = population.genomes[0].tolist()
     return individual
 
 
 def crossover(individual_1, individual_2, probability):
-    child_1 = {'Genome': [], 'Fitness': np.nan, 'ER': np.nan}
-    child_2 = {'Genome': [], 'Fitness': np.nan, 'ER': np.nan}
-    if np.random.uniform(0.0, 1.0) < probability:
-        dice = np.random.randint(1, len(individual_1['Genome']))
+    dice = crossoverPoints(1, len(individual_1['Genome']), probability)[0]
+    if dice < len(individual_1['Genome']):
+        child_1 = {'Genome': [], 'Fitness': np.nan, 'ER': np.nan}
+        child_2 = {'Genome': [], 'Fitness': np.nan, 'ER': np.nan}
         child_1['Genome'] = individual_1['Genome'][:dice] + individual_2['Genome'][dice:]
         child_2['Genome'] = individual_2['Genome'][:dice] + individual_1['Genome'][dice:]
     else:
@@ -47,103 +132,686 @@ def crossover(individual_1, individual_2, probability):
     return child_1, child_2
 
 
-def tournamentSelection(pop, contestants):
-    tournament = []
-    for i in range(contestants):
-        dice = np.random.randint(0, len(pop))
-        already_selected = False
-        for selected in tournament:
-            if np.array_equal(selected['Genome'], pop[dice]['Genome']):
-                already_selected = True
-                i = i - 1
-                break
-        if already_selected == False:
-            tournament.append(pop[dice])
+def tournamentEntrants(pop_len, tournaments, contestants):
+    # contestant indices of every tournament, sampled without replacement within a row
+    contestants = min(contestants, pop_len)
+    if contestants * 4 > pop_len:
+        keys = np.random.uniform(0.0, 1.0, (tournaments, pop_len))
+        return np.argpartition(keys, contestants - 1, axis=1)[:, :contestants]
 
-    fitnesses = []
-    for i in range(len(tournament)):
-        fitnesses.append(tournament[i]['Fitness'])
+    entrants = np.random.randint(0, pop_len, (tournaments, contestants))
+    while True:
+        ordered = np.sort(entrants, axis=1)
+        repeated = np.any(ordered[:, 1:] == ordered[:, :-1], axis=1)
+        if not repeated.any():
+            return entrants
+        entrants[repeated] = np.random.randint(0, pop_len, (np.count_nonzero(repeated), contestants))
 
-    bestFit = tournament[np.argmax(fitnesses)]
-    return bestFit
+
+def selectWinners(fitness, tournaments, contestants=5):
+    # runs all tournaments of a generation at once and returns the index of every winner
+    fitness = np.asarray(fitness, dtype=float)
+    entrants = tournamentEntrants(len(fitness), tournaments, contestants)
+    return entrants[np.arange(tournaments), np.argmax(fitness[entrants], axis=1)]
+
+
+def tournamentSelection(pop, contestants):
+    winner = selectWinners([individual['Fitness'] for individual in pop], 1, contestants)[0]
+    return pop[winner]
+
+
+def portfolioMoments(df_assets_data):
+    # mean returns vector and covariance matrix, computed once and shared by every genome
+    prices = np.asarray(df_assets_data.values, dtype=float)
+    returns = np.diff(prices, axis=0) / prices[:-1]
+    P = np.mean(returns, axis=0)
+    C = np.atleast_2d(np.cov(returns, rowvar=False))
+    return P, C
+
+
+def dailyReturns(prices):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.diff(prices, axis=0) / prices[:-1]
+    returns[~np.isfinite(returns)] = 0.0
+    return returns
+
+
+class RollingMoments(object):
+    """
+    Mean vector and covariance of daily returns over a sliding price window, kept as running sums
+    and cross-products. Consecutive windows only add the new days and remove the expired ones,
+    assets entering or leaving the window add or drop a row and column instead of a rebuild.
+    Missing returns count as 0. The sums are rebuilt from the window every `refresh` updates to
+    keep the rounding drift bounded.
+    """
+
+    def __init__(self, refresh=52):
+        self.refresh = refresh
+        self.updates = 0
+        self.assets = []
+        self.dates = None
+        self.window = None
+        self.S = None
+        self.Q = None
+
+    def rebuild(self, prices, dates, assets):
+        self.window = dailyReturns(prices)
+        self.dates = dates
+        self.assets = list(assets)
+        self.S = self.window.sum(axis=0)
+        self.Q = self.window.T.dot(self.window)
+
+    def overlap(self, dates):
+        # number of return days shared with the new window when it is a plain forward slide
+        start = self.dates.searchsorted(dates[0])
+        shared = len(self.dates) - start
+        if start == len(self.dates) or shared > len(dates):
+            return 0
+        if self.dates[start] != dates[0] or self.dates[-1] != dates[shared - 1]:
+            return 0
+        return shared
+
+    def slide(self, prices, dates, assets, shared):
+        position = dict((asset, j) for j, asset in enumerate(assets))
+
+        # names that left the universe lose their row and column
+        kept = [i for i, asset in enumerate(self.assets) if asset in position]
+        if len(kept) < len(self.assets):
+            self.S = self.S[kept]
+            self.Q = self.Q[np.ix_(kept, kept)]
+            self.window = self.window[:, kept]
+            self.assets = [self.assets[i] for i in kept]
+        columns = [position[asset] for asset in self.assets]
+
+        # expired days leave the sums, new days enter them
+        old = self.window[:len(self.window) - shared]
+        self.S -= old.sum(axis=0)
+        self.Q -= old.T.dot(old)
+        new = dailyReturns(prices[shared:][:, columns])
+        self.S += new.sum(axis=0)
+        self.Q += new.T.dot(new)
+        self.window = np.vstack((self.window[len(self.window) - shared:], new))
+        self.dates = dates
+
+        # names that joined the universe get a row and column
+        known = set(self.assets)
+        entering = [j for j, asset in enumerate(assets) if asset not in known]
+        if entering:
+            block = dailyReturns(prices[:, entering])
+            cross = self.window.T.dot(block)
+            self.Q = np.block([[self.Q, cross], [cross.T, block.T.dot(block)]])
+            self.S = np.concatenate((self.S, block.sum(axis=0)))
+            self.window = np.hstack((self.window, block))
+            self.assets = self.assets + [assets[j] for j in entering]
+
+    def update(self, df_assets_data):
+        # moves the window to df_assets_data and returns (P, C) in its column order
+        prices = np.asarray(df_assets_data.values, dtype=float)
+        dates = df_assets_data.index[1:]
+        assets = list(df_assets_data.columns)
+
+        shared = 0
+        if self.window is not None and self.updates % self.refresh != 0:
+            shared = self.overlap(dates)
+        if shared:
+            self.slide(prices, dates, assets, shared)
+        else:
+            self.rebuild(prices, dates, assets)
+        self.updates += 1
+
+        position = dict((asset, i) for i, asset in enumerate(self.assets))
+        order = [position[asset] for asset in assets]
+        n = len(self.window)
+        P = self.S[order] / n
+        C = (self.Q[np.ix_(order, order)] - n * np.outer(P, P)) / (n - 1)
+        return P, C
+
+
+class FactorCovariance(object):
+    """
+    Diagonal plus rank-k covariance, C ~ B B' + diag(d), fitted once per optimization from the top
+    k eigenpairs of the sample covariance. The residual variances d are shrunk towards their mean.
+    A portfolio variance costs O(N k) instead of O(N^2).
+    """
+
+    def __init__(self, loadings, residuals):
+        self.loadings = loadings
+        self.residuals = residuals
+
+    @classmethod
+    def fit(cls, C, factors=5, shrinkage=0.1):
+        C = np.atleast_2d(C)
+        factors = min(factors, len(C))
+        if factors < len(C) - 1:
+            from scipy.sparse.linalg import eigsh
+            values, vectors = eigsh(C, k=factors, which='LA')
+        else:
+            values, vectors = np.linalg.eigh(C)
+            values, vectors = values[-factors:], vectors[:, -factors:]
+
+        loadings = vectors * np.sqrt(np.maximum(values, 0.0))
+        residuals = np.maximum(np.diag(C) - np.sum(loadings ** 2, axis=1), 0.0)
+        residuals = (1.0 - shrinkage) * residuals + shrinkage * residuals.mean()
+        return cls(loadings, residuals)
+
+    def variance(self, W):
+        # one portfolio variance per row of W
+        WL = W.dot(self.loadings)
+        return np.einsum('ij,ij,j->i', W, W, self.residuals) + np.einsum('ij,ij->i', WL, WL)
+
+    def dot(self, w):
+        return self.residuals * w + self.loadings.dot(self.loadings.T.dot(w))
+
+    def arrays(self):
+        return [self.loadings, self.residuals]
+
+    def astype(self, dtype):
+        return FactorCovariance(*[array.astype(dtype) for array in self.arrays()])
+
+
+def portfolioVariance(W, C):
+    # one variance per row of W, for a dense covariance matrix or a FactorCovariance
+    if isinstance(C, FactorCovariance):
+        return C.variance(W)
+    return np.einsum('ij,ij->i', W.dot(C), W)
+
+
+def chunkBytes(n_assets, dtype=float):
+    # bytes per genome of the (genomes x assets) arrays alive while a chunk is scored: the weights
+    # and weights x covariance, plus the genomes cast to the moments' precision below float64
+    dtype = np.dtype(dtype)
+    return (2 if dtype == np.float64 else 3) * n_assets * dtype.itemsize
+
+
+def evaluationRows(n_assets, memory_budget, dtype=float):
+    # genomes per chunk so that a chunk's arrays fit in memory_budget bytes, None for no limit
+    if memory_budget is None:
+        return None
+    return max(1, int(memory_budget // chunkBytes(n_assets, dtype)))
+
+
+def evaluationMemory(pop_size, P, C, memory_budget=None, workers=1):
+    # estimated bytes held to score pop_size genomes, counted from the array shapes rather than
+    # measured: the moments plus the largest chunk of each worker
+    moments = [P] + (C.arrays() if isinstance(C, FactorCovariance) else [C])
+    rows = min(evaluationRows(len(P), memory_budget, P.dtype) or pop_size, pop_size)
+    return sum(array.nbytes for array in moments) + workers * rows * chunkBytes(len(P), P.dtype)
+
+
+def EvaluatePopulation(genomes, P, C, min_weight=0.001, max_weight=1.0, period=63, memory_budget=None):
+    # scores the population in chunks of genomes whose arrays fit in memory_budget bytes (all at
+    # once without a budget), in the precision of P and C
+    genomes = np.atleast_2d(np.asarray(genomes, dtype=float))
+    rows = evaluationRows(genomes.shape[1], memory_budget, P.dtype) or max(len(genomes), 1)
+    fitness = np.empty(len(genomes))
+    ER = np.empty(len(genomes))
+    for start in range(0, len(genomes), rows):
+        chunk = slice(start, start + rows)
+        fitness[chunk], ER[chunk] = evaluateChunk(genomes[chunk], P, C, min_weight, max_weight, period)
+    return fitness, ER
+
+
+def evaluateChunk(genomes, P, C, min_weight, max_weight, period):
+    # one row of weights per genome; the annualisation runs in float64 whatever the precision
+    genomes = genomes.astype(P.dtype, copy=False)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normW = genomes / genomes.sum(axis=1)[:, np.newaxis]
+        valid = np.isclose(normW.sum(axis=1), 1.0) & ~(normW.max(axis=1) > max_weight) & \
+            ~(normW.min(axis=1) < min_weight)
+
+        mu = normW.dot(P).astype(float)
+        sigma = np.sqrt(portfolioVariance(normW, C).astype(float))
+
+        mu = ((1 + mu) ** period) - 1
+        sigma = np.sqrt(period) * sigma
+        sharpe = mu / sigma
+
+    fitness = np.where(valid, sharpe, 0.0)
+    ER = np.where(valid, mu, 0.0) * 100.0
+    return fitness, ER
 
 
 def EvaluationFunction(individual, df_assets_data, min_weight=0.001, max_weight=1.0, period=63):
-    constrain = False
-    normW = list(np.array(individual['Genome']) / sum(individual['Genome']))
-    if sum(normW) == 1.0:
-        for W in normW:
-            if W > max_weight or W < min_weight:
-                fitness = 0.0
-                mu = 0.0
-                constrain = True
-                break
+    P, C = portfolioMoments(df_assets_data)
+    fitness, ER = EvaluatePopulation(individual['Genome'], P, C, min_weight, max_weight, period)
+    individual['Fitness'] = float(fitness[0])
+    individual['ER'] = float(ER[0])
+    return individual
 
-        if constrain == False:
-            # Evaluate portfolio
-            returns = np.asmatrix(np.diff(df_assets_data.as_matrix(), axis=0) / df_assets_data.as_matrix()[:-1])
-            returns = returns.T
-            weights = np.asmatrix(normW).T
 
-            P = np.asmatrix(np.mean(returns, axis=1))
-            C = np.asmatrix(np.cov(returns))
+class FitnessCache(object):
+    """
+    Bounded LRU memo of (Fitness, ER) keyed on a 128-bit digest of the genome bits.
+    Only valid for one set of portfolio moments, so Evolve builds a new one per call.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.multipliers = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def digest(self, genomes):
+        # two multiply-add hashes over the raw float bits (odd multipliers, wrapping uint64)
+        bits = np.ascontiguousarray(genomes, dtype=float).view(np.uint64)
+        if self.multipliers is None or self.multipliers.shape[1] != bits.shape[1]:
+            odd = np.random.RandomState(bits.shape[1]).randint(0, 2 ** 63, (2, bits.shape[1]), dtype=np.uint64)
+            self.multipliers = odd * np.uint64(2) + np.uint64(1)
+        return list(zip((bits * self.multipliers[0]).sum(axis=1).tolist(),
+                        (bits * self.multipliers[1]).sum(axis=1).tolist()))
+
+    def lookup(self, genomes):
+        keys = self.digest(genomes)
+        fitness = np.full(len(keys), np.nan)
+        ER = np.full(len(keys), np.nan)
+        missing = np.ones(len(keys), dtype=bool)
+        for i, key in enumerate(keys):
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                fitness[i], ER[i] = entry
+                missing[i] = False
+        misses = int(np.count_nonzero(missing))
+        self.hits += len(keys) - misses
+        self.misses += misses
+        return keys, fitness, ER, missing
+
+    def store(self, keys, fitness, ER):
+        for key, fit, er in zip(keys, fitness, ER):
+            self.entries[key] = (fit, er)
+            self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        return {'cache_hits': self.hits, 'cache_misses': self.misses,
+                'cache_evictions': self.evictions, 'cache_size': len(self.entries)}
+
+
+def evaluateIndividually(genomes, HP_data, **kwargs):
+    # unbatched reference path: full EvaluationFunction (moments included) per genome
+    scored = [EvaluationFunction({'Genome': list(genome)}, HP_data, **kwargs) for genome in genomes]
+    return (np.array([individual['Fitness'] for individual in scored]),
+            np.array([individual['ER'] for individual in scored]))
+
+
+def scorePopulation(pop, evaluate, cache=None):
+    # evaluates the genomes the cache has not seen yet, returns how many were evaluated
+    if cache is None:
+        pop.fitness, pop.ER = evaluate(pop.genomes)
+        return len(pop)
+
+    keys, pop.fitness, pop.ER, missing = cache.lookup(pop.genomes)
+    if missing.any():
+        fitness, ER = evaluate(pop.genomes[missing])
+        pop.fitness[missing] = fitness
+        pop.ER[missing] = ER
+        cache.store([keys[i] for i in np.flatnonzero(missing)], fitness, ER)
+    return int(np.count_nonzero(missing))
+
+
+class StoppingRule(object):
+    """
+    When Evolve should stop: generations exhausted, best fitness stagnant for `stagnation`
+    generations (an improvement must beat `tolerance` relative to the previous best), or the
+    next step would overrun `time_budget` seconds at the average pace so far.
+    """
+
+    def __init__(self, generations, stagnation=None, tolerance=0.0, time_budget=None):
+        self.max_generations = generations
+        self.stagnation = stagnation
+        self.tolerance = tolerance
+        self.time_budget = time_budget
+        self.started = time.time()
+        self.best = np.nan
+        self.stagnant = 0
+        self.generations = 0
+        self.reason = None
+
+    def elapsed(self):
+        return time.time() - self.started
+
+    def update(self, best, generations=1, next_step=1):
+        self.generations += generations
+        if np.isnan(self.best) or best > self.best + self.tolerance * abs(self.best):
+            self.best = best
+            self.stagnant = 0
+        else:
+            self.stagnant += generations
+
+        elapsed = self.elapsed()
+        if self.generations >= self.max_generations:
+            self.reason = 'generations'
+        elif self.stagnation is not None and self.stagnant >= self.stagnation:
+            self.reason = 'stagnation'
+        elif self.time_budget is not None and elapsed * (self.generations + next_step) / self.generations > self.time_budget:
+            self.reason = 'time_budget'
+        return self.reason is not None
+
+    def stats(self):
+        return {'stop_reason': self.reason, 'generations': self.generations, 'elapsed': self.elapsed()}
+
+
+def breedPopulation(pop, tournament_size, mutation_prob):
+    # tournament selection, pairwise one-point crossover and mutation of a scored population
+    selected = pop.take(selectWinners(pop.fitness, len(pop), tournament_size))
+
+    order = np.random.permutation(len(selected))
+    half = int(len(selected) / 2)
+    nextGeneration = crossoverPopulation(selected.take(order[:half]), selected.take(order[half:2 * half]), 0.75)
+    return mutatePopulation(nextGeneration, mutation_prob)
+
+
+def evolveGenerations(pop, evaluate, cache, generations, tournament_size, mutation_prob, hof, evaluated=False,
+                      stopping=None, verbose=False):
+    # returns the last scored generation, the updated hall of fame and the evaluations made
+    evaluations = 0
+    for generation in range(generations):
+        if evaluated:
+            pop = breedPopulation(pop, tournament_size, mutation_prob)
+        evaluations += scorePopulation(pop, evaluate, cache)
+        evaluated = True
+
+        best = np.argmax(pop.fitness)
+        if pop.fitness[best] > hof['Fitness'] or np.isnan(hof['Fitness']):
+            hof = pop.individual(best)
+        if verbose:
+            print('Generation: ' + str(generation) + ' Best Fit: ' + str(pop.fitness[best]))
+        if stopping is not None and stopping.update(hof['Fitness']):
+            break
+
+    return pop, hof, evaluations
 
-            mu = float(P.T * weights)
-            sigma = float(np.sqrt(weights.T * C * weights))
 
-            mu = ((1 + mu) ** period) - 1
-            sigma = np.sqrt(period) * sigma
-            sharpe = mu / sigma
-            fitness = float(sharpe)
-    else:
-        fitness = 0.0
-        mu = 0.0
+'''
+Island model: sub-populations evolve in worker processes and exchange elites every
+migration_interval generations. The moments live in one shared memory block that each
+worker attaches to once, only the (small) sub-populations travel with the tasks.
+The module has to be importable by name in the workers (fork start method).
+'''
 
-    individual['Fitness'] = fitness
-    individual['ER'] = mu * 100.0
-    return individual
+ISLAND = {}
+
+
+def shareArrays(arrays):
+    from multiprocessing import shared_memory
 
+    specs = []
+    size = 0
+    for array in arrays:
+        specs.append((size, array.shape, array.dtype.str))
+        size += -(-array.nbytes // 8) * 8
+    block = shared_memory.SharedMemory(create=True, size=max(size, 8))
+    for (offset, shape, dtype), array in zip(specs, arrays):
+        np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset)[...] = array
+    return block, specs
 
-def Evolve(HP_data, pop_size=200, generations=50, period=63):
-    pop = creatPopulation(pop_size, len(HP_data.columns))
-    hof = {'Geneome': [], 'Fitness': np.nan}
 
-    for _ in range(generations):
-        for i in range(len(pop)):
-            pop[i] = EvaluationFunction(pop[i], HP_data, period)
+def initIsland(block_name, specs, cache_size, eval_kwargs):
+    from multiprocessing import shared_memory
 
-        fitnesses = []
-        for i in range(len(pop)):
-            fitnesses.append(pop[i]['Fitness'])
+    block = shared_memory.SharedMemory(name=block_name)
+    ISLAND['block'] = block
+    arrays = [np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset) for offset, shape, dtype in specs]
+    if len(arrays) == 2:
+        ISLAND['moments'] = arrays
+    else:
+        ISLAND['moments'] = [arrays[0], FactorCovariance(*arrays[1:])]
+    ISLAND['cache'] = FitnessCache(cache_size) if cache_size else None
+    ISLAND['eval_kwargs'] = eval_kwargs
+
+
+def runIsland(task):
+    genomes, fitness, ER, evaluated, generations, tournament_size, mutation_prob, seed = task
+    np.random.seed(seed)
+    P, C = ISLAND['moments']
+    cache = ISLAND['cache']
+    hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    evaluate = lambda genomes: EvaluatePopulation(genomes, P, C, **ISLAND['eval_kwargs'])
+
+    hof = {'Genome': [], 'Fitness': np.nan, 'ER': np.nan}
+    pop, hof, evaluations = evolveGenerations(Population(genomes, fitness, ER), evaluate, cache, generations,
+                                              tournament_size, mutation_prob, hof, evaluated)
+    if cache is not None:
+        hits, misses = cache.hits - hits, cache.misses - misses
+    return pop.genomes, pop.fitness, pop.ER, hof, evaluations, hits, misses
+
+
+def migrate(islands, migrants):
+    # ring topology: the best individuals of island i replace the worst ones of island i + 1
+    ranked = [np.argsort(np.nan_to_num(pop.fitness, nan=-np.inf)) for pop in islands]
+    elites = [pop.take(order[::-1][:migrants]) for pop, order in zip(islands, ranked)]
+    for i, pop in enumerate(islands):
+        source = elites[i - 1]
+        worst = ranked[i][:len(source)]
+        pop.genomes[worst] = source.genomes
+        pop.fitness[worst] = source.fitness
+        pop.ER[worst] = source.ER
+
+
+def evolveIslands(pop, P, C, generations, tournament_size, mutation_prob, cache_size, eval_kwargs,
+                  islands, migration_interval, migrants, processes, stopping, verbose=False):
+    import multiprocessing
+
+    sub_pops = [pop.take(rows) for rows in np.array_split(np.random.permutation(len(pop)), islands)]
+    hof = {'Genome': [], 'Fitness': np.nan, 'ER': np.nan}
+    stats = {'evaluations': 0, 'islands': islands}
+    if cache_size:
+        stats.update({'cache_hits': 0, 'cache_misses': 0})
+
+    shared = [P] + (C.arrays() if isinstance(C, FactorCovariance) else [C])
+    block, specs = shareArrays([np.ascontiguousarray(array) for array in shared])
+    pool = multiprocessing.Pool(processes or min(islands, multiprocessing.cpu_count()),
+                                initializer=initIsland, initargs=(block.name, specs, cache_size, eval_kwargs))
+    try:
+        evaluated = False
+        epoch = min(migration_interval, generations)
+        while True:
+            tasks = [(pop.genomes, pop.fitness, pop.ER, evaluated, epoch, tournament_size, mutation_prob,
+                      np.random.randint(2 ** 31 - 1)) for pop in sub_pops]
+            sub_pops = []
+            for genomes, fitness, ER, island_hof, evaluations, hits, misses in pool.map(runIsland, tasks):
+                sub_pops.append(Population(genomes, fitness, ER))
+                if island_hof['Fitness'] > hof['Fitness'] or np.isnan(hof['Fitness']):
+                    hof = island_hof
+                stats['evaluations'] += evaluations
+                if cache_size:
+                    stats['cache_hits'] += hits
+                    stats['cache_misses'] += misses
+            migrate(sub_pops, migrants)
+            evaluated = True
+
+            if verbose:
+                print('Generation: ' + str(stopping.generations + epoch - 1) + ' Best Fit: ' + str(hof['Fitness']))
+            next_epoch = min(migration_interval, generations - stopping.generations - epoch)
+            if stopping.update(hof['Fitness'], epoch, next_epoch):
+                break
+            epoch = next_epoch
+    finally:
+        pool.close()
+        pool.join()
+        block.close()
+        block.unlink()
+
+    pop = Population(np.concatenate([sub.genomes for sub in sub_pops]),
+                     np.concatenate([sub.fitness for sub in sub_pops]),
+                     np.concatenate([sub.ER for sub in sub_pops]))
+    return pop, hof, stats
+
+
+def Evolve(HP_data, pop_size=200, generations=50, period=63, batched=True, tournament_size=5, cache_size=10000,
+           min_weight=0.001, max_weight=1.0, islands=1, migration_interval=5, migrants=2, processes=None,
+           seed_population=None, seed_weights=None, moments=None,
+           covariance='dense', factors=5, shrinkage=0.1,
+           stagnation=None, tolerance=0.0, time_budget=None, memory_budget=None, precision='float64',
+           verbose=False):
+    stopping = StoppingRule(generations, stagnation, tolerance, time_budget)
+    assets = list(HP_data.columns)
+    # keep the box feasible for small universes, as MaxSharpe does
+    min_weight = min(min_weight, 1.0 / len(assets))
+    max_weight = max(max_weight, 1.0 / len(assets))
+    bounds = {'min_weight': min_weight, 'max_weight': max_weight}
+    if seed_population is not None or seed_weights:
+        pop = remapPopulation(seed_population, assets, pop_size, seed_weights)
+    else:
+        pop = Population.random(pop_size, len(assets))
+
+    hof = {'Genome': [], 'Fitness': np.nan, 'ER': np.nan}
+    if batched or islands > 1:
+        P, C = moments if moments is not None else portfolioMoments(HP_data)
+        if covariance == 'factor':
+            C = FactorCovariance.fit(C, factors, shrinkage)
+        if precision != 'float64':
+            # float32 halves the covariance and every chunk, the fitness stays float64
+            P, C = P.astype(precision), C.astype(precision)
+
+    if islands > 1:
+        pop, hof, stats = evolveIslands(pop, P, C, generations, tournament_size, 0.3, cache_size,
+                                        dict(bounds, period=period, memory_budget=memory_budget), islands,
+                                        migration_interval, migrants, processes, stopping, verbose)
+    else:
+        cache = FitnessCache(cache_size) if cache_size else None
+        if batched:
+            evaluate = lambda genomes: EvaluatePopulation(genomes, P, C, period=period, memory_budget=memory_budget,
+                                                          **bounds)
+        else:
+            evaluate = lambda genomes: evaluateIndividually(genomes, HP_data, period=period, **bounds)
+
+        pop, hof, evaluations = evolveGenerations(pop, evaluate, cache, generations, tournament_size,
+                                                  0.3, hof, stopping=stopping, verbose=verbose)
+        stats = {'evaluations': evaluations}
+        if cache is not None:
+            stats.update(cache.stats())
+
+    stats.update(stopping.stats())
+    if batched or islands > 1:
+        workers = min(islands, processes or islands)
+        stats['eval_estimated_mb'] = evaluationMemory(-(-len(pop) // islands), P, C, memory_budget, workers) / 2.0 ** 20
+    pop.assets = assets
+    normGenome = np.array(hof['Genome']) / sum(hof['Genome'])
+    if normGenome.max() > max_weight or normGenome.min() < min_weight:
+        # no genome inside the bounds scored: the nearest weights that are
+        normGenome = projectWeights(normGenome, min_weight, max_weight)
+    normGenome = list(normGenome)
+    result = dict(list(zip(assets, normGenome)))
+    return hof, pop, result, stats
 
-        bestInGeneration = pop[np.argmax(fitnesses)]
-        if bestInGeneration['Fitness'] > hof['Fitness'] or np.isnan(hof['Fitness']):
-            hof = bestInGeneration
-        # print 'Generation: '+str(_)+' Best Fit: '+str(bestInGeneration['Fitness'])
-        n_of_contestants = 5
-        selected = []
-        for i in range(pop_size):
-            selected.append(tournamentSelection(pop, n_of_contestants))
 
-        np.random.shuffle(selected)
-        selected_A = selected[:int(len(selected) / 2)]
-        selected_B = selected[int(len(selected) / 2):]
-        nextGeneration = []
-        cross_over_prob = 0.75
-        for i in range(len(selected_A)):
-            child_1, child_2 = crossover(selected_A[i], selected_B[i], cross_over_prob)
-            nextGeneration.append(child_1)
-            nextGeneration.append(child_2)
+'''
+Deterministic max-Sharpe solver: the same inputs and outputs as Evolve, found by projected gradient
+ascent over the long-only weights {sum(w) = 1, min_weight <= w <= max_weight}. The Sharpe ratio is
+pseudo-concave where the expected return is positive, so the ascent reaches the optimum the GA samples for.
+'''
 
-        mutation_prob = 0.3
-        for i in range(len(nextGeneration)):
-            nextGeneration[i] = mutation(nextGeneration[i], mutation_prob)
 
-        pop = nextGeneration
+def projectWeights(v, min_weight, max_weight):
+    # Euclidean projection onto the capped simplex, bisection on the shift tau
+    low, high = np.min(v) - max_weight, np.max(v) - min_weight
+    for _ in range(100):
+        tau = 0.5 * (low + high)
+        if np.clip(v - tau, min_weight, max_weight).sum() > 1.0:
+            low = tau
+        else:
+            high = tau
+        if high - low < 1e-15:
+            break
+    return np.clip(v - 0.5 * (low + high), min_weight, max_weight)
+
+
+def sharpeAndGradient(w, P, C, period):
+    m = P.dot(w)
+    Cw = C.dot(w)
+    sigma = np.sqrt(w.dot(Cw))
+    growth = (1 + m) ** period
+    sharpe = (growth - 1) / (np.sqrt(period) * sigma)
+    gradient = (period * (1 + m) ** (period - 1) * P / sigma - (growth - 1) * Cw / sigma ** 3) / np.sqrt(period)
+    return sharpe, gradient
+
+
+def MaxSharpe(HP_data, min_weight=0.001, max_weight=1.0, period=63, moments=None, covariance='dense', factors=5, shrinkage=0.1,
+              seed_weights=None, max_iterations=1000, tolerance=1e-10):
+    started = time.time()
+    assets = list(HP_data.columns)
+    P, C = moments if moments is not None else portfolioMoments(HP_data)
+    if covariance == 'factor':
+        C = FactorCovariance.fit(C, factors, shrinkage)
+
+    # keep the box feasible for small universes
+    min_weight = min(min_weight, 1.0 / len(assets))
+    max_weight = max(max_weight, 1.0 / len(assets))
+
+    w = np.full(len(assets), 1.0 / len(assets))
+    if seed_weights:
+        w = projectWeights(np.array([seed_weights.get(asset, 0.0) for asset in assets]), min_weight, max_weight)
+    sharpe, gradient = sharpeAndGradient(w, P, C, period)
+    step = 0.1 / max(np.max(np.abs(gradient)), 1e-12)
+    evaluations = 1
+    stop_reason = 'iterations'
+
+    for iteration in range(1, max_iterations + 1):
+        # backtracking (Armijo) line search along the projected gradient
+        while True:
+            candidate = projectWeights(w + step * gradient, min_weight, max_weight)
+            candidate_sharpe, candidate_gradient = sharpeAndGradient(candidate, P, C, period)
+            evaluations += 1
+            if candidate_sharpe >= sharpe + 1e-4 * gradient.dot(candidate - w):
+                break
+            step *= 0.5
+            if step < 1e-16:
+                candidate, candidate_sharpe, candidate_gradient = w, sharpe, gradient
+                break
 
-    normGenome = list((np.array(hof['Genome']) / sum(hof['Genome'])))
-    result = dict(list(zip(HP_data.columns, normGenome)))
-    return hof, pop, result
+        s, y = candidate - w, candidate_gradient - gradient
+        moved = np.max(np.abs(s))
+        w, sharpe, gradient = candidate, candidate_sharpe, candidate_gradient
+        if moved < tolerance:
+            stop_reason = 'converged'
+            break
+        # Barzilai-Borwein step for the next iteration
+        curvature = abs(s.dot(y))
+        step = s.dot(s) / curvature if curvature > 0 else 2 * step
+
+    mu = ((1 + P.dot(w)) ** period) - 1
+    hof = {'Genome': (w * 100.0).tolist(), 'Fitness': float(sharpe), 'ER': float(mu * 100.0)}
+    result = dict(list(zip(assets, w)))
+    stats = {'method': 'max_sharpe', 'iterations': iteration, 'evaluations': evaluations,
+             'stop_reason': stop_reason, 'elapsed': time.time() - started}
+    return hof, None, result, stats
+
+
+# keyword arguments of each optimizer, the shared ones go to either. An option the chosen optimizer
+# does not take is an error, except under method='auto', where one call configures both and the
+# other optimizer's own options are listed in stats['unused_options']
+GA_OPTIONS = frozenset(['pop_size', 'generations', 'batched', 'tournament_size', 'cache_size', 'islands',
+                        'migration_interval', 'migrants', 'processes', 'seed_population', 'stagnation',
+                        'time_budget', 'memory_budget', 'precision', 'verbose'])
+SOLVER_OPTIONS = frozenset(['max_iterations'])
+SHARED_OPTIONS = frozenset(['min_weight', 'max_weight', 'period', 'moments', 'covariance', 'factors', 'shrinkage',
+                            'seed_weights', 'tolerance'])
+
+
+def Allocate(HP_data, method='auto', max_solver_assets=500, **kwargs):
+    # 'auto' uses the max-Sharpe solver up to max_solver_assets names and the GA above that
+    unknown = set(kwargs) - GA_OPTIONS - SOLVER_OPTIONS - SHARED_OPTIONS
+    if unknown:
+        raise TypeError('Allocate() got unexpected keyword arguments %s' % ', '.join(sorted(unknown)))
+    chosen = method
+    if method == 'auto':
+        chosen = 'max_sharpe' if len(HP_data.columns) <= max_solver_assets else 'ga'
+    if chosen not in ('ga', 'max_sharpe'):
+        raise ValueError("method must be 'ga', 'max_sharpe' or 'auto', not %r" % method)
+    optimizer, options = (MaxSharpe, SOLVER_OPTIONS) if chosen == 'max_sharpe' else (Evolve, GA_OPTIONS)
+    unused = set(kwargs) - options - SHARED_OPTIONS
+    if unused and method != 'auto':
+        raise TypeError('%s() does not take %s' % (optimizer.__name__, ', '.join(sorted(unused))))
+    hof, pop, result, stats = optimizer(HP_data, **dict((k, v) for k, v in kwargs.items() if k not in unused))
+    stats.setdefault('method', 'ga')
+    if unused:
+        stats['unused_options'] = sorted(unused)
+    return hof, pop, result, stats
 
 
 '''
@@ -194,6 +862,24 @@ def initialize(context):
     context.days_period = 63
     context.look_back_periods = 4
 
+    # 'ga', or opt in to 'max_sharpe' or 'auto' (the solver up to 500 names, the GA above)
+    context.optimizer = 'ga'
+
+    # genetic optimizer, warm started from the previous rebalance's population
+    context.ga_population = None
+    context.ga_pop_size = 100
+    context.ga_generations = 30
+    context.ga_warm_generations = 10
+    # rebalance runs as a scheduled function, keep Evolve well inside its time limit
+    context.ga_stagnation = 8
+    context.ga_time_budget = 30
+    # bytes of genome arrays per evaluation chunk (None scores the population at once), and
+    # 'float32' to keep the return moments in single precision for large universes
+    context.ga_memory_budget = None
+    context.ga_precision = 'float64'
+    # returns moments of the look back window, updated incrementally between rebalances
+    context.moments = RollingMoments()
+
     schedule_function(func=rebalance,
                       date_rule=date_rules.week_start(),
                       time_rule=time_rules.market_open())
@@ -282,7 +968,21 @@ def get_genetic_weights(context, data):
     price_history = data.history(context.assets_symbols, "price", days_to_look_back, "1d")
 
     # 200, 50
-    hof, pop, genetic_weights_result = Evolve(price_history, pop_size=100, generations=30)
+    if context.ga_population is None:
+        generations = context.ga_generations
+    else:
+        generations = context.ga_warm_generations
+    options = {'moments': context.moments.update(price_history), 'seed_weights': context.long_port_weights}
+    if context.optimizer != 'max_sharpe':
+        # the GA's own settings, which the max-Sharpe solver does not take
+        options.update(pop_size=context.ga_pop_size, generations=generations,
+                       seed_population=context.ga_population, stagnation=context.ga_stagnation,
+                       time_budget=context.ga_time_budget, memory_budget=context.ga_memory_budget,
+                       precision=context.ga_precision)
+    hof, pop, genetic_weights_result, stats = Allocate(price_history, method=context.optimizer, **options)
+    print("{}: {} evaluations, stopped on {}".format(stats['method'], stats['evaluations'], stats['stop_reason']))
+    if pop is not None:
+        context.ga_population = pop
     context.long_port_weights = genetic_weights_result
 
 
@@ -0,0 +1,16 @@
+"""
+Local, event-driven replacement of the Quantopian backtester for the files in algorithms/.
+
+    from backtest import DailyBars, run_algorithm
+    bars = DailyBars.from_csv('data/bars.csv')
+    perf = run_algorithm('algorithms/genetic_default.py', bars, start='2012-01-03', end='2013-12-31')
+"""
+from .assets import Asset, Equity
+from .bars import DailyBars
+from .feed import MinuteFeed
+from .ledger import Ledger
+from .profiler import Profiler
+from .rules import commission, date_rules, slippage, time_rules
+from .runtime import BarData, Context, TradingAlgorithm, load_algorithm, run_algorithm
+from .store import ColumnStore
+from .sweep import sweep
@@ -0,0 +1,65 @@
+"""
+python -m backtest algorithms/genetic_default.py --bars data/bars.csv --start 2012-01-03 --end 2013-12-31
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from . import ColumnStore, DailyBars, run_algorithm
+from .pipeline import FactorCache
+from .profiler import Profiler
+from .store import is_store
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m backtest', description='Backtest an algorithm file on local daily bars.')
+    parser.add_argument('algorithm', help='path of the algorithm .py file')
+    parser.add_argument('--bars', required=True, help='column store directory, long CSV or directory of per-symbol CSVs')
+    parser.add_argument('--start', default=None)
+    parser.add_argument('--end', default=None)
+    parser.add_argument('--capital', type=float, default=1e6)
+    parser.add_argument('--pipeline-cache', default=None, help='directory of the persistent pipeline column cache')
+    parser.add_argument('--streaming-pipeline', action='store_true',
+                        help='compute the pipelines one session at a time with running window sums')
+    parser.add_argument('--minutes', default=None,
+                        help='directory of per-session minute bar CSVs (<YYYY-MM-DD>.csv) to run in minute mode')
+    parser.add_argument('--profile', default=None, help='time the callbacks and write a Chrome trace to this JSON file')
+    parser.add_argument('--output', default=None, help='write the daily performance to this CSV')
+    args = parser.parse_args()
+
+    bars = ColumnStore(args.bars) if is_store(args.bars) else DailyBars.from_csv(args.bars)
+    started = time.time()
+    cache = FactorCache(args.pipeline_cache) if args.pipeline_cache else None
+    profiler = Profiler() if args.profile else None
+    perf = run_algorithm(args.algorithm, bars, args.start, args.end, args.capital, pipeline_cache=cache,
+                         profiler=profiler, streaming_pipeline=args.streaming_pipeline,
+                         minute_feed=args.minutes)
+    elapsed = time.time() - started
+
+    total = perf['portfolio_value'].iloc[-1] / args.capital - 1.0
+    print('%d sessions in %.2fs, total return %.2f%%, max leverage %.2f' % (
+        len(perf), elapsed, 100 * total, perf['gross_leverage'].max()))
+    if isinstance(bars, ColumnStore):
+        print('%d history requests, %.1f MB read' % (bars.stats['requests'], bars.stats['bytes_read'] / 1e6))
+    if 'optimizations' in perf.attrs:
+        report = perf.attrs['optimizations']
+        print('%d optimizations: %.1f ms mean, %.1f ms max, %d iterations mean, %d polished' % (
+            len(report), report['solve_ms'].mean(), report['solve_ms'].max(), report['iterations'].mean(),
+            report['polished'].sum()))
+    if cache is not None and cache.stats:
+        print('pipeline cache:')
+        print(cache.report().to_string())
+    if profiler is not None:
+        profiler.chrome_trace(args.profile)
+        with pd.option_context('display.width', 200):
+            print(profiler.summary().head(20).to_string())
+            print('slowest days:')
+            print(profiler.slowest_days().to_string())
+        print('trace written to %s' % args.profile)
+    if args.output:
+        perf.to_csv(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+The global functions the Quantopian platform injects into algorithm files. Each call is
+dispatched to the TradingAlgorithm that is currently running.
+"""
+import logging
+
+from .rules import commission, date_rules, slippage, time_rules
+
+_algorithm = None
+
+
+def get_algorithm():
+    if _algorithm is None:
+        raise RuntimeError('no algorithm is running')
+    return _algorithm
+
+
+def set_algorithm(algorithm):
+    global _algorithm
+    previous, _algorithm = _algorithm, algorithm
+    return previous
+
+
+class AlgorithmLog(object):
+    """
+    Quantopian's `log` object on top of the standard logging module.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger('backtest.algorithm')
+
+    def debug(self, message):
+        self.logger.debug(message)
+
+    def info(self, message):
+        self.logger.info(message)
+
+    def warn(self, message):
+        self.logger.warning(message)
+
+    warning = warn
+
+    def error(self, message):
+        self.logger.error(message)
+
+
+log = AlgorithmLog()
+
+
+def schedule_function(func, date_rule=None, time_rule=None, half_days=True, calendar=None):
+    return get_algorithm().schedule_function(func, date_rule, time_rule, half_days, calendar)
+
+
+def order(asset, amount, style=None):
+    return get_algorithm().order(asset, amount)
+
+
+def order_value(asset, value, style=None):
+    return get_algorithm().order_value(asset, value)
+
+
+def order_percent(asset, percent, style=None):
+    return get_algorithm().order_percent(asset, percent)
+
+
+def order_target(asset, target, style=None):
+    return get_algorithm().order_target(asset, target)
+
+
+def order_target_value(asset, target, style=None):
+    return get_algorithm().order_target_value(asset, target)
+
+
+def order_target_percent(asset, target, style=None):
+    return get_algorithm().order_target_percent(asset, target)
+
+
+def order_optimal_portfolio(objective, constraints):
+    return get_algorithm().order_optimal_portfolio(objective, constraints)
+
+
+def get_open_orders(asset=None):
+    # orders fill immediately, nothing is ever open
+    return [] if asset is not None else {}
+
+
+def cancel_order(order):
+    pass
+
+
+def attach_pipeline(pipeline, name, chunks=None, eager=True):
+    return get_algorithm().attach_pipeline(pipeline, name, chunks)
+
+
+def pipeline_output(name):
+    return get_algorithm().pipeline_output(name)
+
+
+def record(*args, **kwargs):
+    values = dict(zip(args[::2], args[1::2]))
+    values.update(kwargs)
+    get_algorithm().record(**values)
+
+
+def symbol(symbol_str):
+    return get_algorithm().symbol(symbol_str)
+
+
+def symbols(*symbol_strs):
+    return [symbol(symbol_str) for symbol_str in symbol_strs]
+
+
+def sid(sid):
+    return get_algorithm().sid(sid)
+
+
+def get_datetime(tz=None):
+    dt = get_algorithm().get_datetime()
+    return dt.tz_convert(tz) if tz is not None else dt
+
+
+def history(bar_count, frequency, field, ffill=True):
+    # the pre-2016 history() API: every asset the algorithm has referenced
+    algo = get_algorithm()
+    return algo.data.history(list(algo.referenced), field, bar_count, frequency)
+
+
+def fetch_csv(url, **kwargs):
+    # url is a local CSV path, see backtest.fetcher
+    return get_algorithm().fetch_csv(url, **kwargs)
+
+
+def set_commission(model=None, us_equities=None, us_futures=None):
+    get_algorithm().ledger.commission_model = model or us_equities
+
+
+def set_slippage(model=None, us_equities=None, us_futures=None):
+    get_algorithm().ledger.slippage_model = model or us_equities
+
+
+def set_benchmark(asset):
+    pass
+
+
+def set_long_only():
+    pass
+
+
+def set_max_leverage(max_leverage):
+    pass
+
+
+def set_symbol_lookup_date(dt):
+    pass
+
+
+NAMES = ['schedule_function', 'attach_pipeline', 'pipeline_output', 'order', 'order_value', 'order_percent', 'order_target', 'order_target_value',
+         'order_target_percent', 'order_optimal_portfolio', 'get_open_orders', 'cancel_order', 'record', 'symbol', 'symbols',
+         'sid', 'get_datetime', 'history', 'fetch_csv', 'set_commission', 'set_slippage', 'set_benchmark', 'set_long_only',
+         'set_max_leverage', 'set_symbol_lookup_date', 'date_rules', 'time_rules', 'commission', 'slippage',
+         'log']
+
+
+def namespace():
+    return dict((name, globals()[name]) for name in NAMES)
@@ -0,0 +1,37 @@
+class Asset(object):
+    """
+    A tradable security, identified by its sid. Compares and hashes like the Quantopian Equity,
+    so assets can key dicts, Series and DataFrame columns.
+    """
+
+    __slots__ = ('sid', 'symbol', 'column')
+
+    def __init__(self, sid, symbol, column=None):
+        self.sid = int(sid)
+        self.symbol = symbol
+        # position of the asset in the bar arrays
+        self.column = column
+
+    def __eq__(self, other):
+        try:
+            return self.sid == other.sid
+        except AttributeError:
+            return False
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __lt__(self, other):
+        return self.sid < other.sid
+
+    def __hash__(self):
+        return self.sid
+
+    def __repr__(self):
+        return 'Equity(%d [%s])' % (self.sid, self.symbol)
+
+    def __reduce__(self):
+        return Asset, (self.sid, self.symbol, self.column)
+
+
+Equity = Asset
@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from .assets import Asset
+from .pipeline.events import is_event_column, to_days
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class DailyBars(object):
+    """
+    In-memory daily bars: one (sessions x assets) float array per field plus the session and
+    asset indexes. 'price' is the close forward filled over missing sessions, as on Quantopian.
+    """
+
+    def __init__(self, sessions, assets, fields):
+        self.sessions = pd.DatetimeIndex(sessions)
+        self.assets = list(assets)
+        for column, asset in enumerate(self.assets):
+            asset.column = column
+        self.fields = dict((name, np.ascontiguousarray(values, dtype=float)) for name, values in fields.items())
+        if 'price' not in self.fields:
+            self.fields['price'] = pd.DataFrame(self.fields['close']).ffill().values
+        self.by_symbol = dict((asset.symbol, asset) for asset in self.assets)
+        self.by_sid = dict((asset.sid, asset) for asset in self.assets)
+
+    @classmethod
+    def from_frames(cls, frames, sids=None):
+        """
+        frames: {field: DataFrame(sessions x symbols)}, sids: optional {symbol: sid}.
+        """
+        close = frames['close']
+        symbols = list(close.columns)
+        sids = sids or dict((symbol, i) for i, symbol in enumerate(symbols))
+        assets = [Asset(sids[symbol], symbol) for symbol in symbols]
+        fields = dict((name, frame.reindex(index=close.index, columns=symbols).values)
+                      for name, frame in frames.items())
+        return cls(close.index, assets, fields)
+
+    @classmethod
+    def from_csv(cls, path):
+        """
+        Either one long CSV with date, symbol, [sid,] open, high, low, close, volume columns,
+        or a directory with one <SYMBOL>.csv per asset (Date, Open, High, Low, Close, Volume).
+        Extra numeric columns are kept as fields for the pipeline datasets, as are *_date columns
+        (event dates such as an earnings asof_date), stored as days since 1970-01-01.
+        """
+        if os.path.isdir(path):
+            tables = []
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.csv'):
+                    table = pd.read_csv(os.path.join(path, name))
+                    table.columns = [column.lower() for column in table.columns]
+                    table['symbol'] = os.path.splitext(name)[0]
+                    tables.append(table)
+            table = pd.concat(tables, ignore_index=True)
+        else:
+            table = pd.read_csv(path)
+            table.columns = [column.lower() for column in table.columns]
+
+        table['date'] = pd.to_datetime(table['date'])
+        for column in table.columns:
+            if is_event_column(column) and not pd.api.types.is_numeric_dtype(table[column]):
+                table[column] = to_days(pd.to_datetime(table[column]))
+        sids = None
+        if 'sid' in table.columns:
+            sids = dict(zip(table['symbol'], table['sid']))
+        # any other numeric column (fundamentals, estimates) becomes a field of the same name
+        fields = [column for column in table.columns if column not in ('date', 'symbol', 'sid')
+                  and (column in FIELDS or pd.api.types.is_numeric_dtype(table[column]))]
+        frames = dict((field, table.pivot(index='date', columns='symbol', values=field).sort_index())
+                      for field in fields)
+        return cls.from_frames(frames, sids)
+
+    def session_index(self, dt):
+        # index of the last session at or before dt
+        return int(self.sessions.searchsorted(pd.Timestamp(dt).normalize(), side='right')) - 1
+
+    def columns(self, assets):
+        return [asset.column for asset in assets]
+
+    def window(self, field, end, bar_count, columns=None):
+        # bar_count rows ending at session index `end` (inclusive), a view unless the columns
+        # are not one ascending run
+        values = self.fields[field][max(end - bar_count + 1, 0):end + 1]
+        if columns is None:
+            return values
+        if len(columns) and columns[-1] - columns[0] == len(columns) - 1 and columns == sorted(columns):
+            return values[:, columns[0]:columns[-1] + 1]
+        return values[:, columns]
+
+    def row(self, field, index):
+        return self.fields[field][index]
@@ -0,0 +1,87 @@
+"""
+Importable stand-ins for the quantopian.* modules, so that algorithm files load outside the platform.
+Names that the local runtime implements resolve to it, anything else resolves to an Unavailable
+placeholder that raises NotImplementedError when it is used.
+"""
+import sys
+import types
+
+from . import api, optimize, pipeline
+from .pipeline import risk
+
+MODULES = ['quantopian', 'quantopian.algorithm', 'quantopian.optimize', 'quantopian.optimize.experimental',
+           'quantopian.pipeline', 'quantopian.pipeline.data', 'quantopian.pipeline.data.builtin', 'quantopian.pipeline.data.morningstar',
+           'quantopian.pipeline.data.factset', 'quantopian.pipeline.data.factset.estimates',
+           'quantopian.pipeline.data.sentdex', 'quantopian.pipeline.experimental', 'quantopian.pipeline.factors',
+           'quantopian.pipeline.filters', 'quantopian.pipeline.classifiers']
+
+
+class Unavailable(object):
+    """
+    A quantopian name the local runtime does not implement (yet).
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def fail(self, *args, **kwargs):
+        raise NotImplementedError('%s is not available in the local runtime' % self.name)
+
+    __call__ = fail
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        return Unavailable(self.name + '.' + attr)
+
+    def __repr__(self):
+        return '<unavailable %s>' % self.name
+
+
+def unavailable(module):
+    def __getattr__(name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return Unavailable(module.__name__ + '.' + name)
+    return __getattr__
+
+
+def install(modules=None):
+    """
+    Register the shim modules in sys.modules. `modules` maps module names to {name: object} that
+    the shim exports for real, the later engines register through it.
+    """
+    exports = {'quantopian.algorithm': api.namespace(),
+               'quantopian.optimize': dict((name, getattr(optimize, name)) for name in (
+                   'MaximizeAlpha', 'TargetWeights', 'PositionConcentration', 'MaxGrossExposure', 'NetExposure',
+                   'DollarNeutral', 'MaxTurnover', 'calculate_optimal_portfolio', 'OptimizationFailed',
+                   'InfeasibleConstraints', 'UnboundedObjective')),
+               'quantopian.optimize.experimental': {'RiskModelExposure': optimize.RiskModelExposure},
+               'quantopian.pipeline': {'Pipeline': pipeline.Pipeline, 'CustomFactor': pipeline.CustomFactor},
+               'quantopian.pipeline.data': {'USEquityPricing': pipeline.USEquityPricing,
+                                            'EquityPricing': pipeline.EquityPricing,
+                                            'Fundamentals': pipeline.Fundamentals},
+               'quantopian.pipeline.data.builtin': {'USEquityPricing': pipeline.USEquityPricing},
+               'quantopian.pipeline.data.morningstar': {'Fundamentals': pipeline.Fundamentals},
+               'quantopian.pipeline.factors': dict((name, getattr(pipeline, name)) for name in (
+                   'CustomFactor', 'SimpleMovingAverage', 'Returns', 'AverageDollarVolume', 'Latest',
+                   'BusinessDaysSincePreviousEvent')),
+               'quantopian.pipeline.filters': {'QTradableStocksUS': pipeline.QTradableStocksUS,
+                                               'StaticAssets': pipeline.StaticAssets},
+               'quantopian.pipeline.data.factset.estimates': {'Actuals': pipeline.Actuals,
+                                                              'PeriodicConsensus': pipeline.PeriodicConsensus},
+               'quantopian.pipeline.data.sentdex': {'sentiment': pipeline.sentiment},
+               'quantopian.pipeline.experimental': {'risk_loading_pipeline': risk.risk_loading_pipeline}}
+    exports.update(modules or {})
+    for name in MODULES + [name for name in exports if name not in MODULES]:
+        module = sys.modules.get(name)
+        if module is None or not getattr(module, '__local_runtime__', False):
+            module = types.ModuleType(name)
+            module.__local_runtime__ = True
+            module.__path__ = []
+            module.__getattr__ = unavailable(module)
+            sys.modules[name] = module
+            parent, _, child = name.rpartition('.')
+            if parent in sys.modules:
+                setattr(sys.modules[parent], child, module)
+        module.__dict__.update(exports.get(name, {}))
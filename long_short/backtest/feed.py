@@ -0,0 +1,129 @@
+"""
+Minute bars for the minute mode of the runtime, streamed from local files: one CSV per session,
+<YYYY-MM-DD>.csv with symbol, open, high, low, close, volume columns and either a minute column
+(1 is the 9:31 bar) or a dt column in exchange time. Sessions are parsed ahead by a worker thread
+into a bounded asyncio queue, and only the rows of the minutes on which a callback runs are kept,
+so a backtest holds at most `buffer` sessions of those rows instead of the intraday history.
+"""
+import asyncio
+import os
+
+import numpy as np
+import pandas as pd
+
+from .rules import MINUTES_PER_SESSION
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class MinuteBars(object):
+    """
+    One session at the minutes `minutes` (ascending, 1..390): row i of open/high/low/close/volume
+    is the bar of minutes[i] (NaN and 0 volume without a trade), price the last close so far (the
+    previous session's price before the first trade), and day_open/day_high/day_low/day_volume
+    the session up to that minute, i.e. the partial daily bar.
+    """
+
+    def __init__(self, minutes, fields):
+        self.minutes = minutes
+        self.fields = fields
+
+    def partial(self, field, row):
+        # the field of the partial daily bar at row `row`, None for fields it does not have
+        name = {'open': 'day_open', 'high': 'day_high', 'low': 'day_low', 'close': 'price', 'price': 'price',
+                'volume': 'day_volume'}.get(field)
+        return self.fields[name][row] if name is not None else None
+
+
+class MinuteFeed(object):
+    """
+    path: directory of the per-session minute CSVs, buffer: sessions parsed ahead of the one the
+    algorithm is trading.
+    """
+
+    def __init__(self, path, buffer=2):
+        self.path = path
+        self.buffer = buffer
+
+    def load(self, bars, index, minutes):
+        """
+        MinuteBars of session `index` of `bars` at the given minutes, built from the file's rows
+        without a row per minute of the session.
+        """
+        session = bars.sessions[index]
+        if not len(minutes):
+            return MinuteBars([], {})
+        path = os.path.join(self.path, '%s.csv' % session.date())
+        if not os.path.isfile(path):
+            raise IOError('no minute bars for %s at %s' % (session.date(), path))
+        table = pd.read_csv(path)
+        table.columns = [column.lower() for column in table.columns]
+        if 'minute' not in table.columns:
+            opened = session + pd.Timedelta(hours=9, minutes=30)
+            table['minute'] = (pd.to_datetime(table['dt']) - opened) // pd.Timedelta(minutes=1)
+        columns = table['symbol'].map(dict((asset.symbol, asset.column) for asset in bars.assets)).values
+        due = np.asarray(minutes, dtype=int)
+        found = pd.notnull(columns) & table['minute'].between(1, min(due.max(), MINUTES_PER_SESSION)).values
+        # the rows of each asset in minute order, one per minute (the last of a repeated minute)
+        keys = columns[found].astype(int) * (MINUTES_PER_SESSION + 1) + table['minute'].values[found].astype(int)
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        unique = np.append(keys[1:] != keys[:-1], True)[:len(keys)]
+        order, keys = order[unique], keys[unique]
+        values = dict((field, table[field].values[found][order].astype(float) if field in table.columns else
+                       np.full(len(keys), 0.0 if field == 'volume' else np.nan)) for field in FIELDS)
+
+        # asset by asset, each due minute adds the rows [start, end) since the previous one; the
+        # partial daily bars accumulate these pieces, so no row is built for the other minutes
+        assets = np.arange(len(bars.assets))
+        wanted = (assets[:, None] * (MINUTES_PER_SESSION + 1) + due).ravel()
+        end = np.searchsorted(keys, wanted, side='right')
+        start = np.append(0, end[:-1])
+        empty, shape = start == end, (len(assets), len(due))
+
+        def accumulate(ufunc, array, identity):
+            reduced = np.where(empty, identity, ufunc.reduceat(np.append(array, identity), start))
+            return ufunc.accumulate(reduced.reshape(shape).T, axis=0)
+
+        row = np.arange(len(keys))
+        closed = accumulate(np.maximum, np.where(np.isnan(values['close']), -1, row), -1)
+        opened = accumulate(np.minimum, np.where(np.isnan(values['open']), len(keys), row), len(keys))
+        now = ~empty & (np.append(keys, -1)[end - 1] == wanted)
+        fields = dict((field, np.where(now, np.append(values[field], np.nan)[end - 1],
+                                       0.0 if field == 'volume' else np.nan).reshape(shape).T) for field in FIELDS)
+        previous = bars.fields['price'][index - 1] if index > 0 else np.full(len(assets), np.nan)
+        fields['price'] = np.where(closed >= 0, np.append(values['close'], np.nan)[closed], previous)
+        fields['day_open'] = np.append(values['open'], np.nan)[opened]
+        fields['day_high'] = accumulate(np.fmax, values['high'], np.nan)
+        fields['day_low'] = accumulate(np.fmin, values['low'], np.nan)
+        fields['day_volume'] = accumulate(np.add, values['volume'], 0.0)
+        return MinuteBars(list(minutes), fields)
+
+    async def sessions(self, bars, plan):
+        """
+        Async generator of (session index, MinuteBars) over plan, a list of (session index, due
+        minutes), with up to `buffer` sessions loaded ahead in a worker thread.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.buffer)
+
+        async def produce():
+            try:
+                for index, minutes in plan:
+                    loaded = await loop.run_in_executor(None, self.load, bars, index, minutes)
+                    await queue.put((index, loaded))
+                await queue.put(None)
+            except Exception as error:
+                await queue.put(error)
+
+        producer = loop.create_task(produce())
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            producer.cancel()
@@ -0,0 +1,69 @@
+"""
+fetch_csv for the local runtime: per-asset columns read from CSV files on disk, aligned to the
+sessions of the bars and forward filled like Quantopian's fetcher.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def read_csv(path, date_column='date', date_format=None, usecols=None, pre_func=None, post_func=None, **kwargs):
+    """
+    The fetched table indexed by date: pre_func sees the raw table, post_func the dated one.
+    """
+    if path.startswith(('http://', 'https://')):
+        raise NotImplementedError('fetch_csv reads local files only, download %s first' % path)
+    if usecols is not None and date_column not in usecols:
+        usecols = [date_column] + list(usecols)
+    table = pd.read_csv(os.path.expanduser(path), usecols=usecols)
+    if pre_func is not None:
+        table = pre_func(table)
+    table.index = pd.to_datetime(table.pop(date_column), format=date_format).rename(None)
+    table = table.sort_index()
+    if post_func is not None:
+        table = post_func(table)
+    return table
+
+
+class FetchedData(object):
+    """
+    The columns loaded with fetch_csv: one contiguous (sessions x fetched assets) float buffer per
+    field, so history windows over the fetched assets are row slices of it, not copies.
+    """
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.columns = {}
+        self.fields = {}
+
+    def __contains__(self, field):
+        return field in self.fields
+
+    def add(self, asset, table):
+        # each numeric column of the table becomes a field for `asset`
+        if asset not in self.columns:
+            self.columns[asset] = len(self.columns)
+            for field, values in self.fields.items():
+                self.fields[field] = np.hstack([values, np.full((len(self.sessions), 1), np.nan)])
+        column = self.columns[asset]
+        # rows dated on a non-session day are seen from the next session on
+        table = table[~table.index.duplicated(keep='last')]
+        values = table.select_dtypes('number').reindex(table.index.union(self.sessions)).ffill().reindex(self.sessions)
+        for field in values.columns:
+            if field not in self.fields:
+                self.fields[field] = np.full((len(self.sessions), len(self.columns)), np.nan)
+            self.fields[field][:, column] = values[field].values
+
+    def window(self, field, end, bar_count, assets):
+        try:
+            columns = [self.columns[asset] for asset in assets]
+        except KeyError as error:
+            raise KeyError('%r has no fetched %r column' % (error.args[0], field))
+        values = self.fields[field][max(end - bar_count + 1, 0):end + 1]
+        if len(columns) and columns[-1] - columns[0] == len(columns) - 1 and columns == sorted(columns):
+            return values[:, columns[0]:columns[-1] + 1]
+        return values[:, columns]
+
+    def row(self, field, index, assets):
+        return self.window(field, index, 1, assets)[0]
@@ -0,0 +1,130 @@
+class Position(object):
+
+    __slots__ = ('asset', 'amount', 'cost_basis', 'last_sale_price')
+
+    def __init__(self, asset, amount=0, cost_basis=0.0, last_sale_price=0.0):
+        self.asset = asset
+        self.amount = amount
+        self.cost_basis = cost_basis
+        self.last_sale_price = last_sale_price
+
+    @property
+    def sid(self):
+        return self.asset
+
+    def __repr__(self):
+        return 'Position(%r, amount=%d, cost_basis=%.4f, last_sale_price=%.4f)' % (
+            self.asset, self.amount, self.cost_basis, self.last_sale_price)
+
+
+class Positions(dict):
+    """
+    asset -> Position. Iterating yields the held assets, unknown assets read as an empty position.
+    """
+
+    def __missing__(self, asset):
+        return Position(asset)
+
+
+class Portfolio(object):
+
+    def __init__(self, capital_base):
+        self.starting_cash = capital_base
+        self.cash = capital_base
+        self.positions = Positions()
+        self.positions_value = 0.0
+        self.positions_exposure = 0.0
+        self.gross_exposure = 0.0
+        self.portfolio_value = capital_base
+        self.pnl = 0.0
+        self.returns = 0.0
+        self.capital_used = 0.0
+
+
+class Account(object):
+
+    def __init__(self, portfolio):
+        self.portfolio = portfolio
+
+    @property
+    def leverage(self):
+        value = self.portfolio.portfolio_value
+        return self.portfolio.gross_exposure / value if value else 0.0
+
+    @property
+    def net_leverage(self):
+        value = self.portfolio.portfolio_value
+        return self.portfolio.positions_exposure / value if value else 0.0
+
+    @property
+    def settled_cash(self):
+        return self.portfolio.cash
+
+
+class Ledger(object):
+    """
+    Cash and positions of one backtest. Orders fill immediately and in full at the given price
+    (after slippage), commissions are taken from cash.
+    """
+
+    def __init__(self, capital_base, commission_model, slippage_model):
+        self.portfolio = Portfolio(capital_base)
+        self.account = Account(self.portfolio)
+        self.commission_model = commission_model
+        self.slippage_model = slippage_model
+        self.transactions = []
+
+    def fill(self, dt, asset, amount, price, volume):
+        if amount == 0:
+            return None
+        portfolio = self.portfolio
+        fill_price = self.slippage_model.fill_price(amount, price, volume)
+        cost = self.commission_model.calculate(amount, fill_price)
+
+        position = portfolio.positions.get(asset)
+        if position is None:
+            position = portfolio.positions[asset] = Position(asset)
+        total = position.amount + amount
+        if total == 0:
+            del portfolio.positions[asset]
+        elif position.amount * total < 0 or position.amount == 0:
+            position.cost_basis = fill_price
+        elif abs(total) > abs(position.amount):
+            position.cost_basis = (position.cost_basis * position.amount + fill_price * amount) / total
+        position.amount = total
+        position.last_sale_price = price
+
+        portfolio.cash -= amount * fill_price + cost
+        portfolio.capital_used -= amount * fill_price + cost
+        # the filled shares are marked at `price`, the slippage and commission are the only loss
+        exposure = amount * price
+        portfolio.positions_value += exposure
+        portfolio.positions_exposure += exposure
+        portfolio.gross_exposure += abs(total * price) - abs((total - amount) * price)
+        portfolio.portfolio_value = portfolio.cash + portfolio.positions_value
+        self.transactions.append((dt, asset, amount, fill_price, cost))
+        return amount
+
+    def mark(self, prices):
+        # revalue the held positions at the price row of the current session
+        portfolio = self.portfolio
+        exposure = gross = 0.0
+        for position in portfolio.positions.values():
+            price = prices[position.asset.column]
+            if price == price:
+                position.last_sale_price = price
+            else:
+                price = position.last_sale_price
+            value = position.amount * price
+            exposure += value
+            gross += abs(value)
+        portfolio.positions_value = exposure
+        portfolio.positions_exposure = exposure
+        portfolio.gross_exposure = gross
+        portfolio.portfolio_value = portfolio.cash + exposure
+        portfolio.pnl = portfolio.portfolio_value - portfolio.starting_cash
+        portfolio.returns = portfolio.portfolio_value / portfolio.starting_cash - 1.0
+
+    def target_amount(self, asset, target_shares):
+        position = self.portfolio.positions.get(asset)
+        return int(target_shares) - (position.amount if position is not None else 0)
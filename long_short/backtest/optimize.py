@@ -0,0 +1,770 @@
+"""
+quantopian.optimize for the local runtime. The objective and constraints of one
+order_optimal_portfolio call become a quadratic program over the target weights w
+
+    minimize 1/2 w'diag(p)w + q'w  subject to  A_i w in C_i
+
+whose constraint matrix is sparse in a particular way: identity blocks (PositionConcentration bounds,
+the L1 balls of MaxGrossExposure and MaxTurnover) plus a few dense rows (net exposure, risk factor
+loadings). It is solved with an OSQP-style ADMM on that structure: the linear system of every
+iteration is diagonal plus low rank (Woodbury, O(n k)), the projections are boxes and L1 balls, the
+step size adapts and an infeasibility certificate stops early. The approximate solution is then made
+exact: by an active-set polish for a quadratic objective, by a crossover to a small LP over the
+near-tied weights (HiGHS through scipy) for MaximizeAlpha. Every solve is warm started from the
+previous one.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from .pipeline.risk import SECTORS, STYLES
+
+
+class OptimizationFailed(Exception):
+    pass
+
+
+class InfeasibleConstraints(OptimizationFailed):
+    pass
+
+
+class UnboundedObjective(OptimizationFailed):
+    pass
+
+
+'''
+Objectives: universe() lists the assets they need, cost(problem) adds to p and q
+'''
+
+
+class Objective(object):
+
+    def universe(self):
+        return pd.Index([])
+
+    def cost(self, problem):
+        raise NotImplementedError
+
+
+class MaximizeAlpha(Objective):
+    """
+    Maximize alphas . w. Only the ranking of the alphas matters, so they are scaled to a unit maximum.
+    """
+
+    def __init__(self, alphas):
+        self.alphas = pd.Series(alphas, dtype=float).dropna()
+
+    def universe(self):
+        return self.alphas.index
+
+    def cost(self, problem):
+        alphas = self.alphas.reindex(problem.assets).fillna(0.0).values
+        scale = np.abs(alphas).max() if len(alphas) else 0.0
+        problem.q -= alphas / scale if scale > 0 else alphas
+
+
+class TargetWeights(Objective):
+    """
+    Minimize the squared distance to the target weights; assets without a target aim at zero.
+    """
+
+    def __init__(self, weights):
+        self.weights = pd.Series(weights, dtype=float).dropna()
+
+    def universe(self):
+        return self.weights.index
+
+    def cost(self, problem):
+        problem.p += 1.0
+        problem.q -= self.weights.reindex(problem.assets).fillna(0.0).values
+
+
+'''
+Constraints: apply(problem) adds bounds, L1 balls or dense rows, labelled for the report
+'''
+
+
+class Constraint(object):
+
+    def universe(self):
+        return pd.Index([])
+
+    def apply(self, problem):
+        raise NotImplementedError
+
+    @property
+    def label(self):
+        return type(self).__name__
+
+
+class PositionConcentration(Constraint):
+    """
+    min_weights <= w <= max_weights per asset, the defaults for the assets without an entry.
+    """
+
+    def __init__(self, min_weights, max_weights, default_min_weight=0.0, default_max_weight=0.0, etf_lookthru=None):
+        self.min_weights = pd.Series(min_weights, dtype=float)
+        self.max_weights = pd.Series(max_weights, dtype=float)
+        self.default_min_weight = default_min_weight
+        self.default_max_weight = default_max_weight
+
+    @classmethod
+    def with_equal_bounds(cls, min, max, etf_lookthru=None):
+        return cls(pd.Series(dtype=float), pd.Series(dtype=float), min, max)
+
+    def universe(self):
+        return self.min_weights.index.union(self.max_weights.index)
+
+    def apply(self, problem):
+        lower = self.min_weights.reindex(problem.assets).fillna(self.default_min_weight).values
+        upper = self.max_weights.reindex(problem.assets).fillna(self.default_max_weight).values
+        problem.bound(lower, upper, self.label)
+
+
+class MaxGrossExposure(Constraint):
+    """
+    sum |w| <= max.
+    """
+
+    def __init__(self, max):
+        self.max = max
+
+    def apply(self, problem):
+        problem.ball(self.label, np.zeros(problem.n), self.max)
+
+
+class NetExposure(Constraint):
+    """
+    min <= sum w <= max.
+    """
+
+    def __init__(self, min, max):
+        self.min = min
+        self.max = max
+
+    def apply(self, problem):
+        problem.rows(self.label, [''], np.ones((1, problem.n)), self.min, self.max)
+
+
+class DollarNeutral(NetExposure):
+    """
+    |sum w| <= tolerance.
+    """
+
+    def __init__(self, tolerance=0.0001):
+        NetExposure.__init__(self, -tolerance, tolerance)
+
+
+class MaxTurnover(Constraint):
+    """
+    sum |w - w0| <= max, w0 the current weights.
+    """
+
+    def __init__(self, max):
+        self.max = max
+
+    def apply(self, problem):
+        problem.ball(self.label, problem.current, self.max)
+
+
+class RiskModelExposure(Constraint):
+    """
+    Bounds on the net exposure loadings' w to every risk factor, by default +-0.18 for the sectors
+    and +-0.36 for the styles (version 0). Override them with min_<factor>= / max_<factor>= keywords;
+    missing loadings count as no exposure.
+    """
+
+    def __init__(self, risk_model_loadings, version=None, **bounds):
+        self.loadings = pd.DataFrame(risk_model_loadings)
+        self.version = version
+        self.bounds = bounds
+
+    def limits(self, factor):
+        default = 0.36 if factor in STYLES else 0.18
+        return self.bounds.get('min_' + factor, -default), self.bounds.get('max_' + factor, default)
+
+    def apply(self, problem):
+        factors = [factor for factor in self.loadings.columns if factor in SECTORS + STYLES or
+                   'min_' + factor in self.bounds or 'max_' + factor in self.bounds]
+        loadings = self.loadings[factors].reindex(problem.assets).fillna(0.0).values.T
+        limits = np.array([self.limits(factor) for factor in factors], dtype=float).reshape(-1, 2)
+        problem.rows(self.label, factors, loadings, limits[:, 0], limits[:, 1])
+
+
+class Problem(object):
+    """
+    The program of one optimization over `assets`, assembled by the objective and the constraints.
+    current: the weights held now. Blocks are (kind, label, keys, data): 'box' bounds, 'ball'
+    (center, radius) and 'rows' (matrix, lower, upper).
+    """
+
+    def __init__(self, assets, current):
+        self.assets = assets
+        self.current = current
+        self.n = len(assets)
+        self.p = np.zeros(self.n)
+        self.q = np.zeros(self.n)
+        self.lower = np.full(self.n, -np.inf)
+        self.upper = np.full(self.n, np.inf)
+        self.bound_label = None
+        self.blocks = []
+
+    def bound(self, lower, upper, label):
+        self.lower = np.maximum(self.lower, lower)
+        self.upper = np.minimum(self.upper, upper)
+        self.bound_label = label
+
+    def ball(self, label, center, radius):
+        self.blocks.append(('ball', label, self.assets, (center, float(radius))))
+
+    def rows(self, label, keys, matrix, lower, upper):
+        count = len(keys)
+        self.blocks.append(('rows', label, list(keys), (np.asarray(matrix, dtype=float).reshape(count, self.n),
+                                                        np.broadcast_to(lower, count).astype(float),
+                                                        np.broadcast_to(upper, count).astype(float))))
+
+    def all_blocks(self):
+        blocks = list(self.blocks)
+        if self.bound_label is not None:
+            blocks.insert(0, ('box', self.bound_label, self.assets, (self.lower, self.upper)))
+        return blocks
+
+
+def project_ball(v, center, radius):
+    # Euclidean projection onto {x: |x - center|_1 <= radius}
+    d = v - center
+    a = np.abs(d)
+    if a.sum() <= radius:
+        return v
+    u = np.sort(a)[::-1]
+    css = np.cumsum(u) - radius
+    k = np.flatnonzero(u * np.arange(1, len(u) + 1) > css)[-1]
+    return center + np.sign(d) * np.maximum(a - css[k] / (k + 1.0), 0.0)
+
+
+class Settings(object):
+
+    # the ADMM stops at the first tolerance whose active set polishes into an exact solution
+    def __init__(self, tolerances=(1e-3, 1e-4, 1e-5, 1e-6), max_iter=10000, rho=0.1, sigma=1e-6, alpha=1.6,
+                 check=10, adapt=5.0, polish=True):
+        self.tolerances = tolerances
+        self.max_iter = max_iter
+        self.rho = rho
+        self.sigma = sigma
+        self.alpha = alpha
+        self.check = check
+        self.adapt = adapt
+        self.polish = polish
+
+
+class Solver(object):
+    """
+    ADMM over the blocks of one problem. The dense rows are scaled to unit norm and the cost to a
+    unit maximum; results are returned unscaled.
+    """
+
+    def __init__(self, problem, settings):
+        self.settings = settings
+        self.n = problem.n
+        cost = max(np.abs(problem.q).max() if self.n else 0.0, problem.p.max() if self.n else 0.0)
+        self.c = 1.0 / cost if cost > 0 else 1.0
+        self.p, self.q = problem.p * self.c, problem.q * self.c
+        self.blocks = problem.all_blocks()
+        # the identity blocks first, then all dense rows stacked
+        self.sets, matrices, lower, upper, self.scale = [], [], [], [], []
+        for kind, label, keys, data in self.blocks:
+            if kind == 'rows':
+                matrix, l, u = data
+                norm = np.sqrt((matrix ** 2).sum(axis=1))
+                e = 1.0 / np.where(norm > 0, norm, 1.0)
+                matrices.append(matrix * e[:, None])
+                lower.append(l * e)
+                upper.append(u * e)
+                self.scale.append(e)
+            else:
+                self.sets.append((kind, data))
+        self.D = np.vstack(matrices) if matrices else np.zeros((0, self.n))
+        self.l = np.concatenate(lower) if lower else np.zeros(0)
+        self.u = np.concatenate(upper) if upper else np.zeros(0)
+        self.e = np.concatenate(self.scale) if self.scale else np.zeros(0)
+        self.equality = (self.u - self.l) < 1e-9
+        self.iterations = self.factorizations = 0
+
+    def factor(self, rho):
+        # (diag(p) + sigma + k rho) + D' R D through Woodbury: only the r x r capacitance is inverted
+        self.rho = rho
+        self.rho_rows = np.where(self.equality, 1e3 * rho, rho)
+        self.diagonal = self.p + self.settings.sigma + len(self.sets) * rho
+        Dd = self.D / self.diagonal
+        capacitance = np.diag(1.0 / self.rho_rows) + Dd.dot(self.D.T) if len(self.D) else np.zeros((0, 0))
+        self.capacitance = np.linalg.inv(capacitance) if len(self.D) else capacitance
+        self.Dd = Dd
+        self.factorizations += 1
+
+    def linear_solve(self, rhs):
+        x = rhs / self.diagonal
+        if len(self.D):
+            x -= self.Dd.T.dot(self.capacitance.dot(self.D.dot(x)))
+        return x
+
+    def project(self, kind, data, v):
+        if kind == 'box':
+            return np.clip(v, data[0], data[1])
+        return project_ball(v, data[0], data[1])
+
+    def support(self, kind, data, dy):
+        # sup of dy'z over the set, +inf when unbounded in that direction
+        if kind == 'ball':
+            return data[0].dot(dy) + data[1] * np.abs(dy).max()
+        lower, upper = data
+        positive, negative = np.maximum(dy, 0.0), np.minimum(dy, 0.0)
+        if np.any(np.isinf(upper) & (positive > 0)) or np.any(np.isinf(lower) & (negative < 0)):
+            return np.inf
+        return np.where(positive > 0, upper, 0.0).dot(positive) + np.where(negative < 0, lower, 0.0).dot(negative)
+
+    def residuals(self, x, z, y, zr, yr):
+        Dx = self.D.dot(x) / self.e
+        zr = zr / self.e
+        primal = max([np.abs(x - z_i).max() for z_i in z] + [np.abs(Dx - zr).max() if len(zr) else 0.0])
+        Aty = sum(y) + self.D.T.dot(yr)
+        dual = np.abs(self.p * x + self.q + Aty).max() / self.c
+        scale_primal = max([np.abs(x).max()] + [np.abs(z_i).max() for z_i in z] +
+                           ([np.abs(Dx).max(), np.abs(zr).max()] if len(zr) else []))
+        scale_dual = max(np.abs(self.p * x).max(), np.abs(Aty).max(), np.abs(self.q).max()) / self.c
+        return primal, dual, scale_primal, scale_dual
+
+    def infeasible(self, dy, dyr):
+        norm = max([np.abs(d).max() for d in dy] + [np.abs(dyr).max() if len(dyr) else 0.0])
+        if norm < 1e-10:
+            return False
+        eps = 1e-6 * norm
+        Aty = sum(dy) + self.D.T.dot(dyr)
+        if np.abs(Aty).max() > eps:
+            return False
+        support = sum(self.support(kind, data, d) for (kind, data), d in zip(self.sets, dy))
+        support += self.support('box', (self.l, self.u), dyr) if len(dyr) else 0.0
+        return support < -eps
+
+    def solve(self, x, y, yr, rho, eps, max_iter):
+        # from unscaled x and duals until the residuals are below eps (absolute and relative)
+        s = self.settings
+        self.factor(rho)
+        y = [y_i * self.c for y_i in y]
+        yr = yr * self.c / self.e if len(yr) else yr
+        z = [self.project(kind, data, x) for kind, data in self.sets]
+        zr = np.clip(self.D.dot(x), self.l, self.u)
+        status = 'max_iter'
+        iteration = 0
+        for iteration in range(1, max_iter + 1):
+            y_previous, yr_previous = y, yr
+            rhs = s.sigma * x - self.q + sum(self.rho * z_i - y_i for z_i, y_i in zip(z, y))
+            if len(yr):
+                rhs = rhs + self.D.T.dot(self.rho_rows * zr - yr)
+            x_tilde = self.linear_solve(rhs)
+            x = s.alpha * x_tilde + (1.0 - s.alpha) * x
+            z_new, y_new = [], []
+            for (kind, data), z_i, y_i in zip(self.sets, z, y):
+                relaxed = s.alpha * x_tilde + (1.0 - s.alpha) * z_i
+                z_i = self.project(kind, data, relaxed + y_i / self.rho)
+                z_new.append(z_i)
+                y_new.append(y_i + self.rho * (relaxed - z_i))
+            z, y = z_new, y_new
+            if len(yr):
+                relaxed = s.alpha * self.D.dot(x_tilde) + (1.0 - s.alpha) * zr
+                zr = np.clip(relaxed + yr / self.rho_rows, self.l, self.u)
+                yr = yr + self.rho_rows * (relaxed - zr)
+
+            if iteration % s.check:
+                continue
+            primal, dual, scale_primal, scale_dual = self.residuals(x, z, y, zr, yr)
+            if primal <= eps * (1.0 + scale_primal) and dual <= eps * (1.0 + scale_dual):
+                status = 'solved'
+                break
+            if self.infeasible([a - b for a, b in zip(y, y_previous)], yr - yr_previous):
+                status = 'infeasible'
+                break
+            # rebalance the primal and dual residuals when they drift apart
+            ratio = np.sqrt((primal / max(scale_primal, 1e-10)) / max(dual / max(scale_dual, 1e-10), 1e-10))
+            rho_new = float(np.clip(self.rho * ratio, 1e-6, 1e6))
+            if rho_new > self.rho * s.adapt or rho_new < self.rho / s.adapt:
+                self.factor(rho_new)
+        self.iterations += iteration
+        y = [y_i / self.c for y_i in y]
+        yr = yr * self.e / self.c if len(yr) else yr
+        return x, z, y, zr / self.e if len(zr) else zr, yr, status
+
+
+def polish(problem, x, z, y, zr, yr, tolerance=1e-7):
+    """
+    Solve the equality problem of the active set that the ADMM found (as OSQP: a row is active when
+    it is closer to its bound than its dual is to zero): bounds and L1 kinks fix weights, active L1
+    balls and dense rows become equations. The result is kept only when it satisfies the KKT
+    conditions, which makes it the exact optimum; returns (weights, binding) or None.
+    """
+    n = problem.n
+    lower_fixed = np.zeros(n, dtype=bool)
+    upper_fixed = np.zeros(n, dtype=bool)
+    kink = np.zeros(n, dtype=bool)
+    value = np.zeros(n)
+    equations, targets, signs, rows = [], [], [], []
+    set_index = row_index = 0
+    dual_tolerance = 1e-9 * max([1e-12] + [np.abs(y_i).max() for y_i in y] + [np.abs(yr).max() if len(yr) else 0.0])
+    for kind, label, keys, data in problem.all_blocks():
+        if kind == 'box':
+            y_i, z_i = y[set_index], z[set_index]
+            set_index += 1
+            lower_fixed = (z_i - data[0] < -y_i) & np.isfinite(data[0])
+            upper_fixed = (data[1] - z_i < y_i) & np.isfinite(data[1]) & ~lower_fixed
+            value[lower_fixed] = data[0][lower_fixed]
+            value[upper_fixed] = data[1][upper_fixed]
+        elif kind == 'ball':
+            y_i, z_i = y[set_index], z[set_index]
+            set_index += 1
+            center, radius = data
+            if radius - np.abs(z_i - center).sum() >= np.abs(y_i).max():
+                continue
+            sign = np.sign(z_i - center)
+            at_center = (sign == 0) & ~lower_fixed & ~upper_fixed & ~kink
+            kink |= at_center
+            value[at_center] = center[at_center]
+            equations.append(sign)
+            targets.append(radius + sign.dot(center))
+            signs.append(1.0)
+            rows.append((label, '', True))
+        else:
+            matrix, lower, upper = data
+            count = len(keys)
+            y_rows, z_rows = yr[row_index:row_index + count], zr[row_index:row_index + count]
+            row_index += count
+            for i in range(count):
+                if z_rows[i] - lower[i] < -y_rows[i] or y_rows[i] < -dual_tolerance:
+                    equations.append(matrix[i])
+                    targets.append(lower[i])
+                    signs.append(-1.0 if lower[i] < upper[i] else 0.0)
+                    rows.append((label, keys[i], False))
+                elif upper[i] - z_rows[i] < y_rows[i] or y_rows[i] > dual_tolerance:
+                    equations.append(matrix[i])
+                    targets.append(upper[i])
+                    signs.append(1.0 if lower[i] < upper[i] else 0.0)
+                    rows.append((label, keys[i], False))
+    fixed = lower_fixed | upper_fixed | kink
+    free = ~fixed
+    E = np.array(equations).reshape(len(equations), n)
+    b = np.array(targets) - E[:, fixed].dot(value[fixed])
+    E_free = E[:, free]
+    p, q = problem.p[free], problem.q[free]
+    if np.all(p > 0):
+        # strictly convex on the free weights: solve through the Schur complement of diag(p)
+        if len(E):
+            nu = np.linalg.lstsq((E_free / p).dot(E_free.T), (E_free / p).dot(-q) - b, rcond=None)[0]
+            value[free] = (-q - E_free.T.dot(nu)) / p
+        else:
+            value[free] = -q / p
+    elif len(E):
+        value[free] = np.linalg.lstsq(E_free, b, rcond=None)[0]
+    elif free.any():
+        return None
+
+    # primal feasibility
+    slack = tolerance * max(1.0, np.abs(value).max())
+    if np.any(value < problem.lower - slack) or np.any(value > problem.upper + slack):
+        return None
+    for kind, label, keys, data in problem.blocks:
+        if kind == 'ball' and np.abs(value - data[0]).sum() > data[1] + slack:
+            return None
+        if kind == 'rows':
+            row_values = data[0].dot(value)
+            if np.any(row_values < data[1] - slack) or np.any(row_values > data[2] + slack):
+                return None
+    if len(E) and np.abs(E.dot(value) - np.array(targets)).max() > slack:
+        return None
+
+    # dual feasibility: stationarity on the free weights, signs of the multipliers
+    gradient = problem.p * value + problem.q
+    scale = tolerance * max(1.0, np.abs(problem.q).max())
+    nu = np.linalg.lstsq(E_free.T, -gradient[free], rcond=None)[0] if len(E) else np.zeros(0)
+    if free.any() and np.abs(gradient[free] + E_free.T.dot(nu)).max() > scale:
+        return None
+    signs = np.array(signs)
+    if np.any(nu * signs < -scale):
+        return None
+    residual = -(gradient + E.T.dot(nu)) if len(E) else -gradient
+    # at a kink the L1 balls absorb |residual| up to their multipliers
+    absorb = np.zeros(n)
+    for i, (label, key, ball) in enumerate(rows):
+        if ball:
+            absorb[E[i] == 0] += max(nu[i], 0.0)
+    if np.any(residual[lower_fixed] > absorb[lower_fixed] + scale) or \
+            np.any(residual[upper_fixed] < -absorb[upper_fixed] - scale) or \
+            np.any(np.abs(residual[kink]) > absorb[kink] + scale):
+        return None
+
+    binding = {}
+    if problem.bound_label is not None:
+        at_bound = (lower_fixed & (residual < -scale)) | (upper_fixed & (residual > scale))
+        if at_bound.any():
+            binding[problem.bound_label] = list(problem.assets[at_bound])
+    for i, (label, key, ball) in enumerate(rows):
+        if abs(nu[i]) > scale:
+            binding.setdefault(label, []).append(key)
+    return value, binding
+
+
+def subgradients(problem, points, r, balls, multipliers):
+    # left and right derivative of r w + sum_b lambda_b |w - c_b| over the bounds, at every point
+    left, right = r[:, None] + 0.0 * points, r[:, None] + 0.0 * points
+    for (label, center, radius), multiplier in zip(balls, multipliers):
+        center = center[:, None]
+        left = left + multiplier * np.where(points > center, 1.0, -1.0)
+        right = right + multiplier * np.where(points < center, -1.0, 1.0)
+    left = np.where(points <= problem.lower[:, None], -np.inf, left)
+    right = np.where(points >= problem.upper[:, None], np.inf, right)
+    return left, right
+
+
+def crossover(problem, y, yr, tau, tolerance=1e-7):
+    """
+    Exact solution of a linear objective from approximate ADMM multipliers. Given the multipliers
+    of the L1 balls and dense rows every weight minimizes its own piecewise linear Lagrangian;
+    the weights whose minimizer is clear within tau are fixed there and the near ties go into a
+    small LP with the coupling constraints, solved exactly by HiGHS. Its multipliers must then
+    confirm every fixed weight. Returns (weights, binding) or None.
+    """
+    from scipy import sparse
+    from scipy.optimize import linprog
+
+    n = problem.n
+    balls = [(label, data[0], data[1]) for kind, label, keys, data in problem.blocks if kind == 'ball']
+    rows = [(label, keys, data) for kind, label, keys, data in problem.blocks if kind == 'rows']
+    D = np.vstack([data[0] for label, keys, data in rows] or [np.zeros((0, n))])
+    l = np.concatenate([data[1] for label, keys, data in rows] or [np.zeros(0)])
+    u = np.concatenate([data[2] for label, keys, data in rows] or [np.zeros(0)])
+    ball_duals = y[1:] if problem.bound_label is not None else y
+    # the breakpoints: the bounds and the ball centers inside them
+    points = np.column_stack([problem.lower, problem.upper] +
+                             [np.clip(center, problem.lower, problem.upper) for label, center, radius in balls])
+
+    def interval(multipliers, nu, tau):
+        left, right = subgradients(problem, points, problem.q + D.T.dot(nu), balls, multipliers)
+        inside = (left <= tau) & (right >= -tau)
+        return (np.where(inside, points, np.inf).min(axis=1), np.where(inside, points, -np.inf).max(axis=1))
+
+    start, end = interval([np.abs(y_b).max() for y_b in ball_duals], yr, tau)
+    if np.any(start > end):
+        return None
+    free = start < end
+    value = np.where(free, 0.0, start)
+    m = int(free.sum())
+    if m == 0:
+        # nothing left for the LP, whose multipliers would confirm the fixed weights
+        return None
+
+    # the small LP over [w_free, g_1, ..., g_k] with g_b >= |w - c_b| on the free weights
+    k = len(balls)
+    identity = sparse.identity(m, format='csr')
+    blocks, bounds_ub, cost = [], [], np.concatenate([problem.q[free], np.zeros(k * m)])
+    for b, (label, center, radius) in enumerate(balls):
+        pick = [sparse.csr_matrix((m, m))] * k
+        pick[b] = identity
+        for sign in (1.0, -1.0):
+            blocks.append(sparse.hstack([sign * identity] + [-block for block in pick]))
+            bounds_ub.append(sign * center[free])
+        blocks.append(sparse.hstack([sparse.csr_matrix((1, m))] +
+                                    [sparse.csr_matrix(np.ones((1, m)) if i == b else np.zeros((1, m)))
+                                     for i in range(k)]))
+        bounds_ub.append([radius - np.abs(value - center)[~free].sum()])
+    fixed_rows = D[:, ~free].dot(value[~free])
+    upper_rows, lower_rows = np.flatnonzero(np.isfinite(u)), np.flatnonzero(np.isfinite(l))
+    for sign, index, bound in ((1.0, upper_rows, u), (-1.0, lower_rows, l)):
+        blocks.append(sparse.hstack([sparse.csr_matrix(sign * D[index][:, free]), sparse.csr_matrix((len(index), k * m))]))
+        bounds_ub.append(sign * (bound[index] - fixed_rows[index]))
+    A_ub = sparse.vstack(blocks, format='csr')
+    b_ub = np.concatenate(bounds_ub)
+    variable_bounds = [(lower if np.isfinite(lower) else None, upper if np.isfinite(upper) else None)
+                       for lower, upper in zip(start[free], end[free])] + [(0, None)] * (k * m)
+    result = linprog(cost, A_ub=A_ub, b_ub=b_ub, bounds=variable_bounds, method='highs')
+    if result.status != 0:
+        return None
+    value[free] = result.x[:m]
+
+    # the multipliers of the coupling constraints, in the order the rows were stacked
+    marginals = -result.ineqlin.marginals
+    multipliers = [marginals[(2 * m + 1) * b + 2 * m] for b in range(k)]
+    offset = (2 * m + 1) * k
+    nu = np.zeros(len(l))
+    nu[upper_rows] += marginals[offset:offset + len(upper_rows)]
+    nu[lower_rows] -= marginals[offset + len(upper_rows):]
+    scale = tolerance * max(1.0, np.abs(problem.q).max())
+    start, end = interval(multipliers, nu, scale)
+    slack = tolerance * max(1.0, np.abs(value).max())
+    if np.any(value < start - slack) or np.any(value > end + slack):
+        return None
+
+    binding = {}
+    if problem.bound_label is not None:
+        bounded = np.column_stack([value, value])
+        free_problem = Problem(problem.assets, problem.current)
+        left, right = subgradients(free_problem, bounded, problem.q + D.T.dot(nu), balls, multipliers)
+        at_bound = ((value <= problem.lower + slack) & (left[:, 0] > scale)) | \
+                   ((value >= problem.upper - slack) & (right[:, 0] < -scale))
+        if at_bound.any():
+            binding[problem.bound_label] = list(problem.assets[at_bound])
+    for (label, center, radius), multiplier in zip(balls, multipliers):
+        if multiplier > scale:
+            binding.setdefault(label, []).append('')
+    index = 0
+    for label, keys, data in rows:
+        for key in keys:
+            if abs(nu[index]) > scale:
+                binding.setdefault(label, []).append(key)
+            index += 1
+    return value, binding
+
+
+class OptimizationResult(object):
+    """
+    Target weights of one optimization plus its report: status, solve_time (seconds, assembly
+    included), iterations, factorizations, whether the polish was kept and `binding`, the
+    constraints at their bound with a non-zero dual as {label: [keys]}.
+    """
+
+    def __init__(self, weights, status, solve_time, iterations, factorizations, polished, binding, state):
+        self.weights = weights
+        self.status = status
+        self.solve_time = solve_time
+        self.iterations = iterations
+        self.factorizations = factorizations
+        self.polished = polished
+        self.binding = binding
+        self.state = state
+
+    def summary(self):
+        binding = ', '.join('%s (%d)' % (label, len(keys)) if len(keys) > 1 else
+                            label if keys[0] == '' else '%s %s' % (label, keys[0])
+                            for label, keys in sorted(self.binding.items()))
+        return '%s in %.1f ms, %d iterations%s, binding: %s' % (
+            self.status, self.solve_time * 1e3, self.iterations, ', polished' if self.polished else '',
+            binding or 'none')
+
+    def __repr__(self):
+        return '<OptimizationResult %s>' % self.summary()
+
+
+def run_optimization(objective, constraints, current_weights=None, warm_start=None, settings=None):
+    """
+    Solve one order_optimal_portfolio problem. current_weights: Series of the held weights (the
+    MaxTurnover reference), warm_start: the previous OptimizationResult.
+    """
+    started = time.perf_counter()
+    settings = settings or Settings()
+    current_weights = pd.Series(current_weights if current_weights is not None else {}, dtype=float)
+    assets = objective.universe()
+    for constraint in constraints:
+        assets = assets.union(constraint.universe(), sort=False)
+    assets = assets.union(current_weights.index[current_weights != 0], sort=False)
+    if not len(assets):
+        # no alphas and no positions: the empty portfolio
+        return OptimizationResult(pd.Series([], dtype=float), 'solved', time.perf_counter() - started, 0, 0, False,
+                                  {}, {'duals': {}, 'rho': settings.rho})
+
+    problem = Problem(assets, current_weights.reindex(assets).fillna(0.0).values)
+    for constraint in constraints:
+        constraint.apply(problem)
+    objective.cost(problem)
+    blocks = problem.all_blocks()
+    balls = [block for block in blocks if block[0] == 'ball']
+    if not balls and np.any((problem.q != 0) & (problem.p == 0) &
+                            (np.isinf(problem.lower) | np.isinf(problem.upper))):
+        raise UnboundedObjective('the objective is unbounded, add a PositionConcentration or MaxGrossExposure')
+    if np.any(problem.lower > problem.upper) or any(block[3][1] < 0 for block in balls) or \
+            any(np.any(block[3][1] > block[3][2]) for block in blocks if block[0] == 'rows'):
+        raise InfeasibleConstraints('a lower bound is above its upper bound')
+
+    # warm start from the previous weights and duals of the same constraints
+    names = [(i, block[1]) for i, block in enumerate(blocks)]
+    weights = np.clip(problem.current, problem.lower, problem.upper)
+    rho = settings.rho
+    duals = {}
+    if warm_start is not None:
+        weights = warm_start.weights.reindex(assets).fillna(0.0).values
+        rho = warm_start.state['rho']
+        duals = warm_start.state['duals']
+
+    def dual(name, keys):
+        previous = duals.get(name)
+        if previous is None or len(previous) == 0:
+            return np.zeros(len(keys))
+        return previous.reindex(keys).fillna(0.0).values
+    y = [dual(name, block[2]) for name, block in zip(names, blocks) if block[0] != 'rows']
+    yr = np.concatenate([dual(name, block[2]) for name, block in zip(names, blocks) if block[0] == 'rows'] or
+                        [np.zeros(0)])
+
+    solver = Solver(problem, settings)
+    x, polished, binding = weights, None, None
+    for eps in settings.tolerances:
+        x, z, y, zr, yr, status = solver.solve(x, y, yr, solver.rho if solver.factorizations else rho, eps,
+                                               settings.max_iter - solver.iterations)
+        if status == 'infeasible':
+            raise InfeasibleConstraints('no portfolio satisfies all the constraints')
+        polished = None
+        if settings.polish and np.all(problem.p == 0):
+            polished = crossover(problem, y, yr, 10 * eps * max(1.0, np.abs(problem.q).max()))
+        elif settings.polish:
+            polished = polish(problem, x, z, y, zr, yr)
+        if polished is not None:
+            x, binding = polished
+            status = 'solved'
+            break
+        if status != 'solved':
+            break
+    if status == 'max_iter' and np.all(problem.p == 0):
+        # ADMM can stall on a linear objective: the whole problem goes to the LP of the crossover
+        polished = crossover(problem, y, yr, np.inf)
+        if polished is not None:
+            x, binding = polished
+            status = 'solved'
+    if status != 'solved':
+        # as on Quantopian, an unconverged solution is not traded
+        raise OptimizationFailed('the optimizer stopped on %s after %d iterations without reaching tolerance %g'
+                                 % (status, solver.iterations, eps))
+
+    state = {}
+    set_index = row_index = 0
+    for name, (kind, label, keys, data) in zip(names, blocks):
+        if kind == 'rows':
+            state[name] = pd.Series(yr[row_index:row_index + len(keys)], index=keys)
+            row_index += len(keys)
+        else:
+            state[name] = pd.Series(y[set_index], index=keys)
+            set_index += 1
+    if binding is None:
+        # not polished: the rows with a non-zero dual
+        binding = {}
+        for name, (kind, label, keys, data) in zip(names, blocks):
+            duals = state[name]
+            active = ([''] if (duals != 0).any() else []) if kind == 'ball' else list(duals.index[duals != 0])
+            if active:
+                binding.setdefault(label, []).extend(active)
+
+    weights = pd.Series(x, index=assets)
+    return OptimizationResult(weights, status, time.perf_counter() - started, solver.iterations,
+                              solver.factorizations, polished is not None, binding, {'duals': state, 'rho': solver.rho})
+
+
+def optimization_report(optimizations):
+    """
+    One row per order_optimal_portfolio call of a backtest: (date, OptimizationResult) pairs in,
+    status, solve time, iterations and the binding constraints out.
+    """
+    rows = [(result.status, result.solve_time * 1e3, result.iterations, result.factorizations, result.polished,
+             ', '.join(sorted(result.binding))) for date, result in optimizations]
+    return pd.DataFrame(rows, columns=['status', 'solve_ms', 'iterations', 'factorizations', 'polished', 'binding'],
+                        index=pd.DatetimeIndex([date for date, result in optimizations]))
+
+
+def calculate_optimal_portfolio(objective, constraints, current_portfolio=None):
+    """
+    The target weights as a Series, without placing orders.
+    """
+    return run_optimization(objective, constraints, current_portfolio).weights
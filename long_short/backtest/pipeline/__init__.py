@@ -0,0 +1,12 @@
+"""
+Local pipeline engine: the quantopian.pipeline API (Pipeline, datasets, factors, filters) evaluated
+over whole chunks of sessions with vectorized (sessions x assets) arrays.
+"""
+from .cache import FactorCache
+from .data import BoundColumn, DataSet, EquityPricing, Fundamentals, USEquityPricing, sentiment
+from .engine import Pipeline, PipelineEngine, PipelineOutput
+from .estimates import Actuals, EstimatesDataSet, PeriodicConsensus
+from .events import BusinessDayIndex, BusinessDaysSincePreviousEvent, EventCalendar
+from .factors import SMA, AverageDollarVolume, CustomFactor, Latest, Returns, SimpleMovingAverage
+from .filters import QTradableStocksUS, StaticAssets
+from .terms import Factor, Filter, Term
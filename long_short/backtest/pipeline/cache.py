@@ -0,0 +1,265 @@
+"""
+Disk cache of computed pipeline columns. An entry is one term on one dataset (bars and asset
+universe) over a contiguous range of sessions, stored as .npy; a request that overlaps it reads
+the overlap and computes only the sessions outside. Least recently used entries are evicted once
+the cache exceeds max_bytes. Processes can share a directory (e.g. the workers of a sweep): each
+write goes to a file of its own, and the index is merged with the one on disk under a file lock.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import time
+import types
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    # no flock on Windows: the index merges are not serialized there
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from .engine import resolve
+from .factors import CustomFactor
+
+INDEX = 'index.json'
+LOCK = 'index.lock'
+
+
+def code_digest(code, digest):
+    digest.update(code.co_code)
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            code_digest(constant, digest)
+        else:
+            digest.update(repr(constant).encode())
+
+
+def term_digest(term, graph):
+    """
+    Structural hash of a term: its key, plus the compute() code of every CustomFactor it depends on,
+    so that editing a factor invalidates its cached outputs.
+    """
+    digest = hashlib.sha1(repr(term.key).encode())
+    for key in sorted(graph, key=repr):
+        node = graph[key]
+        if isinstance(node, CustomFactor):
+            code_digest(type(node).compute.__code__, digest)
+    return digest.hexdigest()
+
+
+def dataset_digest(bars):
+    """
+    Identity of the data behind a run: the asset universe, plus for a ColumnStore its path, session
+    range and the size and modification time of its files (a store rewritten in place or appended
+    to gets a new identity), or the field contents for in-memory bars.
+    """
+    digest = hashlib.sha1(np.array([asset.sid for asset in bars.assets], dtype=np.int64).tobytes())
+    path = getattr(bars, 'path', None)
+    if path is not None:
+        digest.update(os.path.realpath(path).encode())
+        if len(bars.sessions):
+            digest.update(('%s %s %d' % (bars.sessions[0], bars.sessions[-1], len(bars.sessions))).encode())
+        for name in sorted(os.listdir(path)):
+            stat = os.stat(os.path.join(path, name))
+            digest.update(('%s %d %d' % (name, stat.st_size, stat.st_mtime_ns)).encode())
+    else:
+        digest.update(bars.sessions.asi8.tobytes())
+        for name in sorted(bars.fields):
+            digest.update(name.encode())
+            digest.update(np.ascontiguousarray(bars.fields[name]).tobytes())
+    return digest.hexdigest()
+
+
+class FactorCache(object):
+    """
+    path: cache directory, max_bytes: size above which the least recently used entries are removed.
+    stats: per pipeline column name, rows served from the cache and rows computed.
+    """
+
+    def __init__(self, path, max_bytes=2 ** 30):
+        self.path = path
+        self.max_bytes = max_bytes
+        if not os.path.isdir(path):
+            os.makedirs(path, exist_ok=True)
+        self.entries = self.load()
+        # keys written since the last save, the files of the unreadable entries dropped and the
+        # files the writes replaced
+        self.written = set()
+        self.dropped = {}
+        self.replaced = []
+        self.stats = {}
+
+    def load(self):
+        index = os.path.join(self.path, INDEX)
+        if not os.path.isfile(index):
+            return {}
+        with open(index) as index_file:
+            return json.load(index_file)
+
+    @contextlib.contextmanager
+    def locked(self):
+        with open(os.path.join(self.path, LOCK), 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def remove(self, name):
+        try:
+            os.remove(os.path.join(self.path, name))
+        except OSError:
+            pass
+
+    def save(self):
+        """
+        Merge this cache's writes into the index on disk, which other processes may have updated
+        since it was read, evict, and write the index back. Of two entries of one key, the one
+        with more rows stays.
+        """
+        with self.locked():
+            entries = self.load()
+            for key, name in self.dropped.items():
+                # unless another process has written the key again since
+                if key in entries and entries[key]['file'] == name:
+                    del entries[key]
+            stale = list(self.replaced)
+            for key in self.written:
+                ours, theirs = self.entries[key], entries.get(key)
+                if theirs is not None and theirs['file'] != ours['file']:
+                    if theirs['rows'] > ours['rows']:
+                        stale.append(ours['file'])
+                        continue
+                    stale.append(theirs['file'])
+                entries[key] = ours
+            for key, entry in self.entries.items():
+                if key in entries:
+                    entries[key]['used'] = max(entries[key]['used'], entry['used'])
+            self.entries = entries
+            self.evict()
+            referenced = set(entry['file'] for entry in self.entries.values())
+            for name in stale:
+                if name not in referenced:
+                    self.remove(name)
+            temporary = os.path.join(self.path, '%s.%d.tmp' % (INDEX, os.getpid()))
+            with open(temporary, 'w') as index_file:
+                json.dump(self.entries, index_file)
+            os.replace(temporary, os.path.join(self.path, INDEX))
+        self.written, self.dropped, self.replaced = set(), {}, []
+
+    def read(self, key, sessions):
+        # (first session index, rows) of the cached entry, None if there is no usable entry
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        first = sessions.searchsorted(pd.Timestamp(entry['start']))
+        if first >= len(sessions) or sessions[first] != pd.Timestamp(entry['start']):
+            return None
+        try:
+            values = np.load(os.path.join(self.path, entry['file']), mmap_mode='r')
+        except (IOError, ValueError):
+            self.dropped[key] = self.entries.pop(key)['file']
+            self.written.discard(key)
+            return None
+        entry['used'] = time.time()
+        return first, values
+
+    def write(self, key, sessions, start, values):
+        # a new file per write, so that no process reads a file another one is replacing
+        name = '%s-%s.npy' % (key, uuid.uuid4().hex[:12])
+        temporary = os.path.join(self.path, name + '.tmp.npy')
+        np.save(temporary, values)
+        os.replace(temporary, os.path.join(self.path, name))
+        if key in self.entries:
+            self.replaced.append(self.entries[key]['file'])
+        self.entries[key] = {'file': name, 'start': str(sessions[start].date()), 'rows': len(values),
+                             'bytes': int(values.nbytes), 'used': time.time()}
+        self.written.add(key)
+        self.dropped.pop(key, None)
+
+    def evict(self):
+        total = sum(entry['bytes'] for entry in self.entries.values())
+        for key in sorted(self.entries, key=lambda key: self.entries[key]['used']):
+            if total <= self.max_bytes:
+                break
+            entry = self.entries.pop(key)
+            total -= entry['bytes']
+            self.remove(entry['file'])
+
+    def count(self, name, cached, computed):
+        stats = self.stats.setdefault(name, {'hit_rows': 0, 'computed_rows': 0, 'hits': 0, 'partial': 0, 'misses': 0})
+        stats['hit_rows'] += cached
+        stats['computed_rows'] += computed
+        if not computed:
+            stats['hits'] += 1
+        elif cached:
+            stats['partial'] += 1
+        else:
+            stats['misses'] += 1
+
+    def compute(self, engine, terms, start, stop):
+        """
+        engine.evaluate(terms, start, stop) with every term served from the cache where possible.
+        """
+        sessions = engine.bars.sessions
+        if engine.digest is None:
+            engine.digest = dataset_digest(engine.bars)
+        dataset = engine.digest
+        results = {}
+        plans = {}
+        for name, term in terms.items():
+            graph, _ = resolve([term])
+            key = term_digest(term, graph) + '-' + dataset
+            cached = self.read(key, sessions)
+            lo = hi = start
+            if cached is not None:
+                first, values = cached
+                lo, hi = max(first, start), min(first + len(values), stop)
+            if lo < hi:
+                results[name] = np.empty((stop - start,) + values.shape[1:], dtype=values.dtype)
+                results[name][lo - start:hi - start] = values[lo - first:hi - first]
+                gaps = tuple(gap for gap in ((start, lo), (hi, stop)) if gap[0] < gap[1])
+            else:
+                if lo > hi:
+                    # apart from the cached range, which is replaced; a range touching it extends it
+                    cached = None
+                gaps = ((start, stop),)
+            plans[name] = (key, cached, gaps)
+            self.count(name, max(0, hi - lo), stop - start - max(0, hi - lo))
+
+        # one graph evaluation per distinct missing range, shared by the terms missing it
+        missing = {}
+        for name, (key, cached, gaps) in plans.items():
+            for gap in gaps:
+                missing.setdefault(gap, []).append(name)
+        for (lo, hi), names in missing.items():
+            computed = engine.evaluate(dict((name, terms[name]) for name in names), lo, hi)
+            for name in names:
+                if name not in results:
+                    results[name] = np.empty((stop - start,) + computed[name].shape[1:], dtype=computed[name].dtype)
+                results[name][lo - start:hi - start] = computed[name]
+
+        for name, (key, cached, gaps) in plans.items():
+            if not gaps:
+                continue
+            values, first = results[name], start
+            if cached is not None:
+                # keep the union of the cached and the new range
+                cached_first, cached_values = cached
+                lo, hi = min(cached_first, start), max(cached_first + len(cached_values), stop)
+                union = np.empty((hi - lo,) + values.shape[1:], dtype=values.dtype)
+                union[cached_first - lo:cached_first - lo + len(cached_values)] = cached_values
+                union[start - lo:stop - lo] = values
+                values, first = union, lo
+            self.write(key, sessions, first, values)
+        self.save()
+        return results
+
+    def report(self):
+        return pd.DataFrame.from_dict(self.stats, orient='index')
@@ -0,0 +1,69 @@
+"""
+Datasets: the leaves of the factor graph, read from the fields of the backtest bars.
+"""
+import numpy as np
+
+from .events import DATES, is_event_column
+from .factors import Latest
+from .terms import Term
+
+
+class BoundColumn(Term):
+    """
+    One field of a dataset, the bar field `field`. Row i holds the field at session i - 1; `latest`
+    is the factor of it. *_date columns are event dates (datetime64, NaT where missing).
+    """
+
+    def __init__(self, dataset, name, dtype=np.float64):
+        self.dataset = dataset
+        self.name = name
+        self.field = dataset.prefix + name
+        self.dtype = DATES if is_event_column(name) else dtype
+        if self.dtype == DATES:
+            self.missing_value = np.datetime64('NaT')
+        Term.__init__(self)
+
+    def make_key(self):
+        return ('column', self.dataset.name, self.name)
+
+    @property
+    def latest(self):
+        return Latest(inputs=[self])
+
+    def __repr__(self):
+        return '%s.%s' % (self.dataset.name, self.name)
+
+
+class DataSet(object):
+    """
+    Columns resolve to bar fields of the same name, after `prefix`. ffill: forward fill the field
+    over the sessions without a value (report-based data such as fundamentals), optional: columns
+    that read as missing values when the bars do not have their fields.
+    """
+
+    def __init__(self, name, columns=None, ffill=False, optional=(), prefix=''):
+        self.name = name
+        self.ffill = ffill
+        self.optional = optional
+        self.prefix = prefix
+        self.fixed = columns
+        self.columns = {}
+
+    def __getattr__(self, name):
+        if name.startswith('__') or (self.fixed is not None and name not in self.fixed):
+            raise AttributeError('%s has no column %r' % (self.name, name))
+        column = self.columns.get(name)
+        if column is None:
+            column = self.columns[name] = BoundColumn(self, name)
+        return column
+
+    def __repr__(self):
+        return self.name
+
+
+USEquityPricing = DataSet('USEquityPricing', columns=('open', 'high', 'low', 'close', 'volume'),
+                          optional=('open', 'high', 'low', 'volume'))
+EquityPricing = USEquityPricing
+Fundamentals = DataSet('Fundamentals', ffill=True)
+# sentdex news sentiment, the sentiment_signal field of the bars
+sentiment = DataSet('sentiment', columns=('sentiment_signal',), ffill=True)
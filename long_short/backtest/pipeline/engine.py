@@ -0,0 +1,200 @@
+"""
+Chunked pipeline evaluation. A run computes every term of the graph once for a block of sessions,
+each over its own (sessions x assets) rows, with the extra leading rows its consumers' windows need.
+"""
+import numpy as np
+import pandas as pd
+
+from .data import BoundColumn
+from .events import EventCalendar, is_event_column, to_days
+
+
+class Pipeline(object):
+
+    def __init__(self, columns=None, screen=None, domain=None):
+        self.columns = dict(columns or {})
+        self.screen = screen
+
+    def add(self, term, name, overwrite=False):
+        if name in self.columns and not overwrite:
+            raise KeyError('column %r already exists' % name)
+        self.columns[name] = term
+
+    def remove(self, name):
+        return self.columns.pop(name)
+
+    def set_screen(self, screen, overwrite=False):
+        if self.screen is not None and not overwrite:
+            raise ValueError('the pipeline already has a screen')
+        self.screen = screen
+
+    def terms(self):
+        terms = dict(self.columns)
+        if self.screen is not None:
+            terms['__screen__'] = self.screen
+        return terms
+
+
+def resolve(terms):
+    """
+    The graph behind `terms` with structurally equal terms merged: (canonical term per key,
+    keys in dependency order).
+    """
+    canonical = {}
+    order = []
+
+    def visit(term):
+        if term.key in canonical:
+            return
+        canonical[term.key] = term
+        for dependency, _ in term.dependencies():
+            visit(dependency)
+        order.append(term.key)
+
+    for term in terms:
+        visit(term)
+    return canonical, order
+
+
+class PipelineEngine(object):
+    """
+    Evaluates pipelines over the sessions and assets of DailyBars (or a ColumnStore), through a
+    FactorCache when one is given. streaming: the window factors that can (moving averages) keep
+    running sums from one call to the next when the calls cover consecutive sessions, so that a
+    pipeline computed one session at a time costs O(1) per new bar and window instead of
+    O(window_length); results match the full recompute to rounding.
+    """
+
+    def __init__(self, bars, cache=None, streaming=False):
+        self.bars = bars
+        self.cache = cache
+        self.streaming = streaming
+        # term key -> running state of a streaming term, with the row its next call has to start at
+        self.states = {}
+        # identity of the bars for the cache, computed on first use
+        self.digest = None
+        self.asset_array = np.empty(len(bars.assets), dtype=object)
+        self.asset_array[:] = bars.assets
+        self.loaded = {}
+
+    def load(self, column):
+        # whole-history field array for a dataset column, forward filled if the dataset asks for it;
+        # the EventCalendar of an event date column
+        key = column.key
+        if key not in self.loaded:
+            fields = self.bars.fields
+            if column.field in fields:
+                values = fields[column.field]
+                if is_event_column(column.name):
+                    values = EventCalendar.from_field(values, self.bars.sessions)
+                elif column.dataset.ffill:
+                    values = pd.DataFrame(values).ffill().values
+            elif column.name in column.dataset.optional:
+                values = np.full((len(self.bars.sessions), len(self.bars.assets)), column.missing_value,
+                                 dtype=column.dtype)
+            else:
+                raise KeyError('the bars have no %r field for %r' % (column.field, column))
+            self.loaded[key] = values
+        return self.loaded[key]
+
+    def leaf(self, column, start, stop):
+        # rows for sessions start..stop-1, i.e. the field on sessions start-1..stop-2, missing before the data
+        values = self.load(column)
+        lo = start - 1
+        if isinstance(values, EventCalendar):
+            # the latest events known on those sessions, looked up for this chunk only
+            rows = values.latest(to_days(self.bars.sessions[max(lo, 0):max(stop - 1, 0)]))
+        else:
+            rows = values[max(lo, 0):max(stop - 1, 0)]
+        if lo >= 0:
+            return rows
+        padding = np.full((-lo, rows.shape[1]), column.missing_value, dtype=rows.dtype)
+        return np.concatenate((padding, rows))
+
+    def compute(self, terms, start, stop):
+        """
+        {name: (stop - start) x assets array} for the terms of `terms` ({name: term}) on the sessions
+        start..stop-1.
+        """
+        if self.cache is not None:
+            return self.cache.compute(self, terms, start, stop)
+        return self.evaluate(terms, start, stop)
+
+    def evaluate(self, terms, start, stop):
+        canonical, order = resolve(terms.values())
+        # rows needed before `start`, pushed from the outputs down to the leaves
+        extra = dict((key, 0) for key in order)
+        for key in reversed(order):
+            for dependency, rows in canonical[key].dependencies():
+                extra[dependency.key] = max(extra[dependency.key], extra[key] + rows)
+
+        sessions = self.bars.sessions
+        assets = self.bars.assets
+        results = {}
+        for key in order:
+            term = canonical[key]
+            lo = start - extra[key]
+            if isinstance(term, BoundColumn):
+                results[key] = self.leaf(term, lo, stop)
+                continue
+            window = max(term.window_length - 1, 0)
+            inputs = [self.rows(results[dependency.key], extra[dependency.key], extra[key] + window)
+                      for dependency in term.inputs]
+            mask = self.rows(results[term.mask.key], extra[term.mask.key], extra[key]) if term.mask is not None else None
+            dates = sessions[max(lo, 0):stop]
+            if lo < 0:
+                dates = pd.DatetimeIndex([pd.NaT] * -lo).append(dates)
+            if self.streaming and hasattr(term, '_stream'):
+                state = self.states.setdefault(key, {})
+                if state.get('row') != lo:
+                    state.clear()
+                out = term._stream(state, inputs, mask, dates, assets)
+                state['row'] = stop
+            else:
+                out = term._compute(inputs, mask, dates, assets)
+            results[key] = term.apply_mask(np.asarray(out, dtype=term.dtype), mask)
+        return dict((name, results[term.key][extra[term.key]:]) for name, term in terms.items())
+
+    @staticmethod
+    def rows(values, have, need):
+        # the last rows of a result that has `have` leading rows when `need` of them are wanted
+        return values[have - need:]
+
+    def run_pipeline(self, pipeline, start_date, end_date):
+        """
+        Quantopian's research run_pipeline: a (date, asset) MultiIndex frame of the screened rows.
+        """
+        sessions = self.bars.sessions
+        start = sessions.searchsorted(pd.Timestamp(start_date))
+        stop = sessions.searchsorted(pd.Timestamp(end_date), side='right')
+        output = PipelineOutput(self, pipeline, chunk_size=stop - start)
+        frames = [output.frame(index) for index in range(start, stop)]
+        return pd.concat(frames, keys=sessions[start:stop])
+
+
+class PipelineOutput(object):
+    """
+    An attached pipeline: computed chunk_size sessions at a time on the first request of a session
+    past the current chunk, then served per session from the chunk arrays.
+    """
+
+    def __init__(self, engine, pipeline, chunk_size=126):
+        self.engine = engine
+        self.pipeline = pipeline
+        self.chunk_size = chunk_size
+        self.start = self.stop = 0
+        self.results = None
+        self.chunks = 0
+
+    def frame(self, index):
+        if self.results is None or not self.start <= index < self.stop:
+            self.start = index
+            self.stop = min(index + self.chunk_size, len(self.engine.bars.sessions))
+            self.results = self.engine.compute(self.pipeline.terms(), self.start, self.stop)
+            self.chunks += 1
+        row = index - self.start
+        assets = self.engine.asset_array
+        screen = self.results.get('__screen__')
+        columns = np.flatnonzero(screen[row]) if screen is not None else np.arange(len(assets))
+        data = dict((name, values[row, columns]) for name, values in self.results.items() if name != '__screen__')
+        return pd.DataFrame(data, index=pd.Index(assets[columns], dtype=object), columns=sorted(self.pipeline.columns))
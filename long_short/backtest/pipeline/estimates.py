@@ -0,0 +1,35 @@
+"""
+FactSet estimates, read from bar fields. A slice of an estimates dataset, e.g.
+Actuals.slice('EPS', 'qf', 0), reads its columns from the fields named
+<dataset>_<item>_<frequency><period>_<column>: actuals_eps_qf0_actual_value and
+actuals_eps_qf0_asof_date (an event date column, see events.py), or periodic_consensus_eps_qf0_mean.
+"""
+from .data import DataSet
+
+
+class EstimatesDataSet(object):
+    """
+    A FactSet estimates dataset, whose columns exist per slice (item, frequency, period).
+    """
+
+    def __init__(self, name, field, columns):
+        self.name = name
+        self.field = field
+        self.columns = columns
+        self.slices = {}
+
+    def slice(self, item, frequency, period):
+        key = (item.lower(), frequency.lower(), int(period))
+        dataset = self.slices.get(key)
+        if dataset is None:
+            dataset = self.slices[key] = DataSet('%s.slice(%r, %r, %d)' % ((self.name,) + key), columns=self.columns,
+                                                 ffill=True, prefix='%s_%s_%s%d_' % ((self.field,) + key))
+        return dataset
+
+    def __repr__(self):
+        return self.name
+
+
+Actuals = EstimatesDataSet('Actuals', 'actuals', ('actual_value', 'asof_date'))
+PeriodicConsensus = EstimatesDataSet('PeriodicConsensus', 'periodic_consensus',
+                                     ('mean', 'median', 'high', 'low', 'std_dev', 'num_est', 'asof_date'))
@@ -0,0 +1,110 @@
+"""
+Point-in-time event dates in the pipeline. Dataset columns named *_date (an Actuals asof_date, a
+fundamentals report date) give, per asset and session, the date of the latest event known on that
+session. The bars store them as days since 1970-01-01 on the sessions where an event is reported;
+EventCalendar turns such a field into a sorted per-asset calendar that answers a chunk of sessions
+with one searchsorted, and BusinessDayIndex counts the business days between dates by lookup.
+"""
+import numpy as np
+
+from .terms import Factor
+
+EPOCH = np.datetime64('1970-01-01', 'D')
+DATES = np.dtype('datetime64[ns]')
+
+
+def is_event_column(name):
+    return name.endswith('_date')
+
+
+def to_days(dates):
+    # datetime-like values as float days since the epoch, NaN where missing
+    days = np.asarray(dates, dtype='datetime64[D]')
+    return np.where(np.isnat(days), np.nan, (days - EPOCH).astype(np.float64))
+
+
+class BusinessDayIndex(object):
+    """
+    Business day ordinals of the days first..last (days since the epoch): ordinal(d) counts the
+    weekdays from `first` up to d, so that numpy's busday_count(a, b) is ordinal(b) - ordinal(a).
+    """
+
+    def __init__(self, first, last):
+        self.first = int(first)
+        days = EPOCH + np.arange(self.first, int(last) + 1)
+        self.ordinals = np.concatenate(([0], np.cumsum(np.is_busday(days))))
+
+    def ordinal(self, days):
+        return self.ordinals[np.asarray(days, dtype=np.int64) - self.first]
+
+
+class EventCalendar(object):
+    """
+    The events of one column, as one array sorted by (asset column, day the event became known)
+    with the event date of each. width: number of asset columns.
+    """
+
+    def __init__(self, columns, known, events, width):
+        order = np.lexsort((known, columns))
+        self.columns = np.asarray(columns, dtype=np.int64)[order]
+        self.known = np.asarray(known, dtype=np.int64)[order]
+        self.events = np.asarray(events, dtype=np.int64)[order]
+        self.width = width
+        # (column, known day) packed into one sorted key; a day outside the known range maps
+        # to the ends of its column's block
+        self.base = self.known.min() if len(self.known) else 0
+        self.span = (self.known.max() - self.base + 2) if len(self.known) else 1
+        self.keys = self.columns * self.span + (self.known - self.base)
+
+    @classmethod
+    def from_field(cls, values, sessions):
+        """
+        A bar field of event dates (days since the epoch, NaN where none is reported): an event is
+        known from the first session on which the field shows its date.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        previous = np.concatenate((np.full((1, values.shape[1]), np.nan), values[:-1]))
+        with np.errstate(invalid='ignore'):
+            new = ~np.isnan(values) & (values != previous)
+        rows, columns = np.nonzero(new)
+        days = to_days(sessions).astype(np.int64)
+        return cls(columns, days[rows], values[rows, columns], values.shape[1])
+
+    def __len__(self):
+        return len(self.events)
+
+    def latest(self, days):
+        """
+        (len(days) x width) datetime64 array of the latest event known on each of `days` (days
+        since the epoch), NaT where an asset has none yet.
+        """
+        out = np.full((len(days), self.width), np.datetime64('NaT'), dtype=DATES)
+        if not len(self.events) or not len(days):
+            return out
+        offsets = np.clip(np.asarray(days, dtype=np.int64) - self.base, -1, self.span - 1)
+        queries = np.arange(self.width)[None, :] * self.span + offsets[:, None]
+        index = np.searchsorted(self.keys, queries, side='right') - 1
+        found = (index >= 0) & (self.columns[np.maximum(index, 0)] == np.arange(self.width)[None, :])
+        out[found] = (EPOCH + self.events[index[found]]).astype(DATES)
+        return out
+
+
+class BusinessDaysSincePreviousEvent(Factor):
+    """
+    Business days (weekdays) from the latest event date of a *_date column to each session, NaN
+    where the asset has no event, as Quantopian's factor of the same name.
+    """
+    window_length = 0
+
+    def _compute(self, inputs, mask, dates, assets):
+        events = to_days(inputs[0])
+        sessions = to_days(dates)
+        known = ~np.isnan(events) & ~np.isnan(sessions)[:, None]
+        out = np.full(events.shape, np.nan)
+        if known.any():
+            present = np.concatenate((events[known], sessions[~np.isnan(sessions)]))
+            index = BusinessDayIndex(present.min(), present.max())
+            counts = index.ordinal(np.nan_to_num(sessions, nan=index.first))[:, None] - \
+                index.ordinal(np.nan_to_num(events, nan=index.first))
+            out[known] = counts[known]
+        return out
@@ -0,0 +1,144 @@
+"""
+Built-in factors. The windowed ones are computed for all rows of a chunk at once.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .terms import Factor
+
+
+def rolling_nanmean(values, window_length):
+    # mean of the non-missing values of every window, missing where a window has none. The sums
+    # are taken per window rather than from a running total, so a row does not depend on where
+    # its chunk starts
+    finite = ~np.isnan(values)
+    windows = sliding_window_view(np.where(finite, values, 0.0), window_length, axis=0)
+    total = windows.sum(axis=-1)
+    counts = np.concatenate((np.zeros((1, values.shape[1]), dtype=np.int64), np.cumsum(finite, axis=0)))
+    count = counts[window_length:] - counts[:-window_length]
+    with np.errstate(all='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def running_nanmean(state, rows, length, window_length, resync=252):
+    """
+    rolling_nanmean from running sums, for the streaming engine: each new row adds the entering
+    value and drops the leaving one, O(1) per row instead of O(window_length). rows(slice) gives
+    the input values of those rows (`length` in all), so that only the rows entering and leaving
+    the window are read. `state` carries the sums and the leaving row from the previous call,
+    which ended on the row before the first one here (empty on a first call); the sums are
+    recomputed from the window every `resync` rows so that rounding errors do not accumulate.
+    """
+    def clean(values):
+        finite = ~np.isnan(values)
+        return np.where(finite, values, 0.0), finite
+
+    out = length - window_length + 1
+    if 'total' not in state or state['age'] >= resync:
+        # the first window summed in full, the rows after it from there
+        values, finite = clean(rows(slice(None)))
+        start_total, start_count = values[:window_length].sum(axis=0), finite[:window_length].sum(axis=0)
+        enter, entering = values[window_length:], finite[window_length:]
+        leave, leaving = values[:out - 1], finite[:out - 1]
+        last, last_finite = values[out - 1], finite[out - 1]
+        state['age'] = 0
+    else:
+        start_total, start_count = state['total'], state['count']
+        enter, entering = clean(rows(slice(window_length - 1, None)))
+        leave, leaving = clean(rows(slice(0, out)))
+        last, last_finite = leave[-1], leaving[-1]
+        leave = np.concatenate((state['leaving'][None], leave[:-1]))
+        leaving = np.concatenate((state['leaving_finite'][None], leaving[:-1]))
+    total = start_total + np.cumsum(enter - leave, axis=0)
+    count = start_count + np.cumsum(entering.astype(np.int64) - leaving, axis=0)
+    if len(total) < out:
+        total = np.concatenate((start_total[None], total))
+        count = np.concatenate((start_count[None], count))
+    state.update(total=total[-1], count=count[-1], leaving=last, leaving_finite=last_finite)
+    state['age'] += out
+    with np.errstate(all='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+class Latest(Factor):
+    window_length = 1
+
+    @property
+    def dtype(self):
+        # event date columns stay dates
+        return self.inputs[0].dtype
+
+    @property
+    def missing_value(self):
+        return self.inputs[0].missing_value
+
+    def _compute(self, inputs, mask, dates, assets):
+        return np.array(inputs[0], dtype=self.dtype)
+
+    def __repr__(self):
+        return '%r.latest' % (self.inputs[0],)
+
+
+class SimpleMovingAverage(Factor):
+
+    def _compute(self, inputs, mask, dates, assets):
+        return rolling_nanmean(inputs[0], self.window_length)
+
+    def _stream(self, state, inputs, mask, dates, assets):
+        return running_nanmean(state, lambda rows: inputs[0][rows], len(inputs[0]), self.window_length)
+
+
+class Returns(Factor):
+    """
+    Percent change of the close over the window: close[-1] / close[0] - 1.
+    """
+
+    def __init__(self, inputs=None, window_length=None, mask=None):
+        from .data import USEquityPricing
+        Factor.__init__(self, inputs or [USEquityPricing.close], window_length, mask)
+
+    def _compute(self, inputs, mask, dates, assets):
+        close = inputs[0]
+        with np.errstate(all='ignore'):
+            return close[self.window_length - 1:] / close[:len(close) - self.window_length + 1] - 1.0
+
+
+class AverageDollarVolume(Factor):
+
+    def __init__(self, inputs=None, window_length=None, mask=None):
+        from .data import USEquityPricing
+        Factor.__init__(self, inputs or [USEquityPricing.close, USEquityPricing.volume], window_length, mask)
+
+    def _compute(self, inputs, mask, dates, assets):
+        return rolling_nanmean(inputs[0] * inputs[1], self.window_length)
+
+    def _stream(self, state, inputs, mask, dates, assets):
+        return running_nanmean(state, lambda rows: inputs[0][rows] * inputs[1][rows], len(inputs[0]),
+                               self.window_length)
+
+
+class CustomFactor(Factor):
+    """
+    Quantopian's CustomFactor: compute(today, assets, out, *inputs) is called once per session with
+    the (window_length x assets) window of every input, restricted to the assets in the mask.
+    The windows are views into the chunk arrays.
+    """
+
+    def _compute(self, inputs, mask, dates, assets):
+        window_length = self.window_length
+        out = np.full((len(dates), len(assets)), np.nan)
+        sids = np.array([asset.sid for asset in assets])
+        for row, today in enumerate(dates):
+            windows = [values[row:row + window_length] for values in inputs]
+            if mask is None:
+                self.compute(today, sids, out[row], *windows)
+            else:
+                columns = np.flatnonzero(mask[row])
+                if len(columns):
+                    result = np.full(len(columns), np.nan)
+                    self.compute(today, sids[columns], result, *[window[:, columns] for window in windows])
+                    out[row, columns] = result
+        return out
+
+
+SMA = SimpleMovingAverage
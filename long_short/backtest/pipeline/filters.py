@@ -0,0 +1,34 @@
+"""
+Built-in filters.
+"""
+import numpy as np
+
+from .data import USEquityPricing
+from .factors import AverageDollarVolume
+from .terms import Filter
+
+
+class QTradableStocksUS(Filter):
+    """
+    Local approximation of Quantopian's tradable universe, which needs data it does not have
+    (listings, market caps, share classes): a close on the previous session and a 200-day average
+    daily dollar volume of at least $2.5M, where the bars have volumes.
+    """
+
+    def __init__(self):
+        Filter.__init__(self, inputs=[USEquityPricing.close.latest, AverageDollarVolume(window_length=200)])
+
+    def _compute(self, inputs, mask, dates, assets):
+        with np.errstate(invalid='ignore'):
+            return np.isfinite(inputs[0]) & ~(inputs[1] < 2.5e6)
+
+
+class StaticAssets(Filter):
+
+    def __init__(self, assets):
+        Filter.__init__(self, sids=tuple(sorted(asset.sid for asset in assets)))
+
+    def _compute(self, inputs, mask, dates, assets):
+        sids = set(self.params['sids'])
+        row = np.array([asset.sid in sids for asset in assets])
+        return np.repeat(row[None, :], len(dates), axis=0)
@@ -0,0 +1,20 @@
+"""
+The Quantopian risk model loadings (version 0): eleven sector and five style factors per asset,
+read from bar fields of the same names when the bars carry them.
+"""
+from .data import DataSet
+from .engine import Pipeline
+
+SECTORS = ('basic_materials', 'consumer_cyclical', 'financial_services', 'real_estate', 'consumer_defensive',
+           'health_care', 'utilities', 'communication_services', 'energy', 'industrials', 'technology')
+STYLES = ('momentum', 'size', 'value', 'short_term_reversal', 'volatility')
+
+RiskModel = DataSet('RiskModel', columns=SECTORS + STYLES, ffill=True, optional=SECTORS + STYLES)
+
+
+def risk_loading_pipeline():
+    """
+    quantopian.pipeline.experimental.risk_loading_pipeline: one column per risk factor, missing
+    loadings read as NaN (no exposure).
+    """
+    return Pipeline(columns=dict((name, getattr(RiskModel, name).latest) for name in SECTORS + STYLES))
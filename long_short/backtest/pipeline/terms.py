@@ -0,0 +1,336 @@
+"""
+Pipeline terms: nodes of the factor graph. Every term computes a (sessions x assets) block where
+row i holds its value as known before the open of session i, i.e. from data up to session i - 1.
+A term with window_length W receives W - 1 extra leading rows of each input.
+"""
+import operator
+
+import numpy as np
+
+
+class Term(object):
+    """
+    inputs: terms, window_length: rows of each input per output row (0 for no window),
+    mask: Filter outside of which the output is missing. `key` identifies the term by structure,
+    equal keys are computed once per pipeline run.
+    """
+    inputs = ()
+    window_length = 0
+    mask = None
+    dtype = np.float64
+    missing_value = np.nan
+
+    def __init__(self, inputs=None, window_length=None, mask=None, **params):
+        if inputs is not None:
+            self.inputs = tuple(inputs)
+        else:
+            self.inputs = tuple(self.inputs)
+        if window_length is not None:
+            self.window_length = window_length
+        if mask is not None:
+            self.mask = mask
+        self.params = params
+        self.key = self.make_key()
+
+    def make_key(self):
+        cls = type(self)
+        return (cls.__module__ + '.' + cls.__name__,
+                tuple(term.key for term in self.inputs),
+                self.window_length,
+                self.mask.key if self.mask is not None else None,
+                tuple(sorted(self.params.items())))
+
+    def dependencies(self):
+        # (term, extra leading rows needed from it)
+        extra = max(self.window_length - 1, 0)
+        dependencies = [(term, extra) for term in self.inputs]
+        if self.mask is not None:
+            dependencies.append((self.mask, 0))
+        return dependencies
+
+    def _compute(self, inputs, mask, dates, assets):
+        """
+        inputs: one array per input with window_length - 1 extra leading rows, mask: the boolean
+        mask rows or None, dates: the output sessions, assets: the asset columns.
+        """
+        raise NotImplementedError
+
+    def apply_mask(self, out, mask):
+        if mask is not None:
+            out[~mask] = self.missing_value
+        return out
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join(repr(term) for term in self.inputs))
+
+
+def binary(op, name):
+    def method(self, other):
+        return BinaryOp(op, name, self, other)
+    return method
+
+
+def reflected(op, name):
+    def method(self, other):
+        return BinaryOp(op, name, other, self)
+    return method
+
+
+def comparison(op, name):
+    def method(self, other):
+        return Comparison(op, name, self, other)
+    return method
+
+
+class Factor(Term):
+    """
+    A numeric term. Arithmetic combines factors and scalars, comparisons give filters.
+    """
+
+    __add__ = binary(operator.add, 'add')
+    __sub__ = binary(operator.sub, 'sub')
+    __mul__ = binary(operator.mul, 'mul')
+    __truediv__ = __div__ = binary(operator.truediv, 'div')
+    __pow__ = binary(operator.pow, 'pow')
+    __radd__ = reflected(operator.add, 'add')
+    __rsub__ = reflected(operator.sub, 'sub')
+    __rmul__ = reflected(operator.mul, 'mul')
+    __rtruediv__ = __rdiv__ = reflected(operator.truediv, 'div')
+    __lt__ = comparison(operator.lt, 'lt')
+    __le__ = comparison(operator.le, 'le')
+    __gt__ = comparison(operator.gt, 'gt')
+    __ge__ = comparison(operator.ge, 'ge')
+    __hash__ = object.__hash__
+
+    def __neg__(self):
+        return BinaryOp(operator.mul, 'mul', -1.0, self)
+
+    def eq(self, other):
+        return Comparison(operator.eq, 'eq', self, other)
+
+    def zscore(self, mask=None, groupby=None):
+        return ZScore(self, mask, groupby)
+
+    def demean(self, mask=None, groupby=None):
+        return Demean(self, mask, groupby)
+
+    def rank(self, method='ordinal', ascending=True, mask=None, groupby=None):
+        return Rank(self, mask, groupby, method=method, ascending=ascending)
+
+    def top(self, N, mask=None, groupby=None):
+        # rank(ascending=False) <= N, by partial selection
+        return Extremes(self, mask, groupby, N=N, ascending=False)
+
+    def bottom(self, N, mask=None, groupby=None):
+        return Extremes(self, mask, groupby, N=N, ascending=True)
+
+    def percentile_between(self, min_percentile, max_percentile, mask=None):
+        return PercentileBetween(self, mask, min_percentile=min_percentile, max_percentile=max_percentile)
+
+    def isnull(self):
+        return NullFilter(self, test='isnull')
+
+    def notnull(self):
+        return NullFilter(self, test='notnull')
+
+    def isfinite(self):
+        return NullFilter(self, test='isfinite')
+
+    isnan = isnull
+    notnan = notnull
+
+
+class Filter(Term):
+    """
+    A boolean term, usable as a screen or as the mask of another term.
+    """
+    dtype = np.bool_
+    missing_value = False
+
+    def __and__(self, other):
+        return BooleanOp(np.logical_and, 'and', self, other)
+
+    def __or__(self, other):
+        return BooleanOp(np.logical_or, 'or', self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+    __hash__ = object.__hash__
+
+
+def constant_key(value):
+    return ('constant', float(value))
+
+
+class BinaryOp(Factor):
+    """
+    left <op> right, either side may be a scalar.
+    """
+
+    def __init__(self, op, name, left, right):
+        self.op = op
+        self.constants = [None if isinstance(side, Term) else float(side) for side in (left, right)]
+        Term.__init__(self, inputs=[side for side in (left, right) if isinstance(side, Term)], name=name,
+                      constants=tuple(self.constants))
+
+    def operands(self, inputs):
+        inputs = list(inputs)
+        return [inputs.pop(0) if constant is None else constant for constant in self.constants]
+
+    def _compute(self, inputs, mask, dates, assets):
+        with np.errstate(all='ignore'):
+            return np.asarray(self.op(*self.operands(inputs)), dtype=np.float64)
+
+
+class Comparison(BinaryOp, Filter):
+    """
+    left <cmp> right, missing values compare False.
+    """
+
+    dtype = np.bool_
+    missing_value = False
+
+    def _compute(self, inputs, mask, dates, assets):
+        with np.errstate(invalid='ignore'):
+            return np.asarray(self.op(*self.operands(inputs)), dtype=bool)
+
+
+class BooleanOp(Filter):
+
+    def __init__(self, op, name, left, right):
+        self.op = op
+        Term.__init__(self, inputs=[left, right], name=name)
+
+    def _compute(self, inputs, mask, dates, assets):
+        return self.op(inputs[0], inputs[1])
+
+
+class Not(Filter):
+
+    def __init__(self, term):
+        Term.__init__(self, inputs=[term])
+
+    def _compute(self, inputs, mask, dates, assets):
+        return ~inputs[0]
+
+
+class NullFilter(Filter):
+
+    def __init__(self, term, test):
+        Term.__init__(self, inputs=[term], test=test)
+
+    def _compute(self, inputs, mask, dates, assets):
+        values = inputs[0]
+        test = self.params['test']
+        if test == 'isfinite':
+            return np.isfinite(values)
+        return np.isnan(values) if test == 'isnull' else ~np.isnan(values)
+
+
+class CrossSectional(Term):
+    """
+    Row-wise statistic of a factor over the assets inside the mask that have a value.
+    """
+
+    def __init__(self, factor, mask=None, groupby=None, **params):
+        if groupby is not None:
+            raise NotImplementedError('groupby is not available in the local pipeline engine')
+        Term.__init__(self, inputs=[factor], mask=mask, **params)
+
+    def masked(self, inputs, mask):
+        values = np.array(inputs[0], dtype=np.float64)
+        if mask is not None:
+            values[~mask] = np.nan
+        return values
+
+
+class ZScore(CrossSectional, Factor):
+
+    def _compute(self, inputs, mask, dates, assets):
+        values = self.masked(inputs, mask)
+        with np.errstate(all='ignore'):
+            mean = np.nanmean(values, axis=1, keepdims=True)
+            return (values - mean) / np.nanstd(values, axis=1, keepdims=True)
+
+
+class Demean(CrossSectional, Factor):
+
+    def _compute(self, inputs, mask, dates, assets):
+        values = self.masked(inputs, mask)
+        with np.errstate(all='ignore'):
+            return values - np.nanmean(values, axis=1, keepdims=True)
+
+
+class Rank(CrossSectional, Factor):
+    """
+    Ordinal rank (1 = smallest unless ascending=False), ties broken by asset order.
+    """
+
+    def _compute(self, inputs, mask, dates, assets):
+        if self.params['method'] != 'ordinal':
+            raise NotImplementedError('only ordinal ranks are available in the local pipeline engine')
+        values = self.masked(inputs, mask)
+        missing = np.isnan(values)
+        if not self.params['ascending']:
+            values = -values
+        values[missing] = np.inf
+        order = np.argsort(values, axis=1, kind='stable')
+        ranks = np.empty(values.shape)
+        rows = np.arange(values.shape[0])[:, None]
+        ranks[rows, order] = np.arange(1, values.shape[1] + 1)
+        ranks[missing] = np.nan
+        return ranks
+
+
+class Extremes(CrossSectional, Filter):
+    """
+    The N assets with the smallest (ascending) or largest values of each row, ties broken by asset
+    order: the same selection as rank(...) <= N, found with np.partition instead of a full sort.
+    """
+
+    def _compute(self, inputs, mask, dates, assets):
+        values = self.masked(inputs, mask)
+        missing = np.isnan(values)
+        if not self.params['ascending']:
+            values = -values
+        values[missing] = np.inf
+        N = self.params['N']
+        if N <= 0:
+            return np.zeros(values.shape, dtype=bool)
+        if N >= values.shape[1]:
+            return ~missing
+        # the N-th smallest value of each row; below it everything is in, at it the first ones
+        threshold = np.partition(values, N - 1, axis=1)[:, N - 1:N]
+        below = values < threshold
+        tied = (values == threshold) & ~missing
+        room = N - below.sum(axis=1, keepdims=True)
+        return below | (tied & (np.cumsum(tied, axis=1) <= room))
+
+
+def quantiles(values, percentiles):
+    # np.nanpercentile (linear) of every row, from np.partition at the order statistics needed
+    bounds = np.full((len(percentiles), len(values)), np.nan)
+    for row, line in enumerate(values):
+        line = line[~np.isnan(line)]
+        if not len(line):
+            continue
+        positions = (len(line) - 1) * (np.asarray(percentiles, dtype=np.float64) / 100.0)
+        below, above = np.floor(positions).astype(int), np.ceil(positions).astype(int)
+        ordered = np.partition(line, np.unique(np.concatenate((below, above))))
+        a, b, t = ordered[below], ordered[above], positions - below
+        # numpy's lerp, so that the bounds round the same way
+        bounds[:, row] = np.where(t >= 0.5, b - (b - a) * (1 - t), a + (b - a) * t)
+    return bounds
+
+
+class PercentileBetween(CrossSectional, Filter):
+    """
+    Assets whose value lies between the row's min_percentile and max_percentile.
+    """
+
+    def _compute(self, inputs, mask, dates, assets):
+        values = self.masked(inputs, mask)
+        bounds = quantiles(values, [self.params['min_percentile'], self.params['max_percentile']])
+        with np.errstate(invalid='ignore'):
+            return (values >= bounds[0][:, None]) & (values <= bounds[1][:, None])
@@ -0,0 +1,162 @@
+"""
+Backtest instrumentation. A Profiler attached to a run wraps the lifecycle callbacks, the scheduled
+functions, every other function of the algorithm module, the order and pipeline API and the data
+accessors with timers; each call becomes a span tagged with its simulated session. Without a
+profiler nothing is wrapped, so a plain run pays nothing.
+"""
+import functools
+import json
+import time
+import types
+
+import pandas as pd
+
+LIFECYCLE = ('initialize', 'before_trading_start', 'handle_data')
+ORDERS = ('order', 'order_value', 'order_percent', 'order_target', 'order_target_value', 'order_target_percent')
+PIPELINE = ('attach_pipeline', 'pipeline_output')
+DATA = ('history',)
+
+
+class Profiler(object):
+    """
+    functions: names of the algorithm module functions to time, None for all of them.
+    spans: (name, start ns, duration ns, session index) per timed call, in completion order.
+    """
+
+    def __init__(self, functions=None):
+        self.functions = functions
+        self.spans = []
+        self.days = []
+        self.categories = {}
+        self.session = -1
+        self.sessions = None
+        self.restore = []
+
+    def wrap(self, func, name, category):
+        if getattr(func, '__profiled__', False):
+            return func
+        spans = self.spans
+        clock = time.perf_counter_ns
+        self.categories.setdefault(name, category)
+        profiler = self
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                spans.append((name, start, clock() - start, profiler.session))
+        timed.__profiled__ = True
+        return timed
+
+    def instrument(self, algo):
+        """
+        Wrap the module globals and the data accessors of a TradingAlgorithm; undone by release().
+        """
+        self.sessions = algo.bars.sessions
+        module = algo.module
+        for name, value in list(vars(module).items()):
+            if not isinstance(value, types.FunctionType):
+                continue
+            if name in ORDERS:
+                category = 'orders'
+            elif name in PIPELINE:
+                category = 'pipeline'
+            elif name in DATA:
+                category = 'data'
+            elif name in LIFECYCLE:
+                category = 'lifecycle'
+            elif value.__module__ == module.__name__ and (self.functions is None or name in self.functions):
+                category = 'function'
+            else:
+                continue
+            self.restore.append((module, name, value))
+            setattr(module, name, self.wrap(value, name, category))
+        for name in ('history', 'current'):
+            setattr(algo.data, name, self.wrap(getattr(algo.data, name), 'data.' + name, 'data'))
+
+    def release(self):
+        for module, name, value in reversed(self.restore):
+            setattr(module, name, value)
+        self.restore = []
+
+    def scheduled(self, func):
+        self.categories[getattr(func, '__name__', repr(func))] = 'scheduled'
+
+    def begin_day(self, index):
+        self.session = index
+        self.days.append([index, time.perf_counter_ns(), 0])
+
+    def end_day(self):
+        day = self.days[-1]
+        day[2] = time.perf_counter_ns() - day[1]
+
+    # reports
+
+    def frame(self):
+        """
+        The spans in start order, with their self time: the duration minus that of the calls nested in them.
+        """
+        frame = pd.DataFrame(self.spans, columns=['name', 'start', 'duration', 'session'])
+        frame = frame.sort_values('start', kind='stable').reset_index(drop=True)
+        starts, durations = frame['start'].values, frame['duration'].values
+        own = durations.copy()
+        stack = []
+        for i in range(len(frame)):
+            while stack and starts[stack[-1]] + durations[stack[-1]] <= starts[i]:
+                stack.pop()
+            if stack:
+                own[stack[-1]] -= durations[i]
+            stack.append(i)
+        frame['self'] = own
+        frame['category'] = frame['name'].map(self.categories)
+        return frame
+
+    def summary(self):
+        """
+        Per timed name: calls, total (including nested calls), self, mean and max milliseconds.
+        """
+        frame = self.frame()
+        if not len(frame):
+            return frame
+        grouped = frame.groupby(['category', 'name'])
+        table = pd.DataFrame({'calls': grouped['duration'].count(), 'total_ms': grouped['duration'].sum() / 1e6,
+                              'self_ms': grouped['self'].sum() / 1e6, 'mean_ms': grouped['duration'].mean() / 1e6,
+                              'max_ms': grouped['duration'].max() / 1e6})
+        return table.sort_values('self_ms', ascending=False)
+
+    def per_day(self):
+        """
+        (sessions x timed names) self milliseconds, plus the wall time of the whole day.
+        """
+        frame = self.frame()
+        table = frame.pivot_table(index='session', columns='name', values='self', aggfunc='sum', fill_value=0)
+        days = pd.DataFrame(self.days, columns=['session', 'start', 'day']).set_index('session')['day']
+        table = table.reindex(days.index, fill_value=0).assign(day=days) / 1e6
+        table.index = self.sessions[table.index]
+        return table
+
+    def slowest_days(self, count=10):
+        table = self.per_day()
+        slowest = table.sort_values('day', ascending=False).head(count)
+        callbacks = slowest.drop(columns='day')
+        return pd.DataFrame({'day_ms': slowest['day'], 'slowest': callbacks.idxmax(axis=1),
+                             'slowest_ms': callbacks.max(axis=1)})
+
+    def chrome_trace(self, path):
+        """
+        Write the spans as a Chrome trace (chrome://tracing, Perfetto): one complete event per call
+        and per simulated day, timestamps in microseconds from the first event.
+        """
+        origin = min([start for _, start, _, _ in self.spans] + [start for _, start, _ in self.days] or [0])
+        events = []
+        for index, start, duration in self.days:
+            events.append({'name': str(self.sessions[index].date()), 'cat': 'day', 'ph': 'X', 'pid': 0, 'tid': 0,
+                           'ts': (start - origin) / 1e3, 'dur': duration / 1e3})
+        for name, start, duration, index in self.spans:
+            args = {'session': str(self.sessions[index].date())} if index >= 0 else {}
+            events.append({'name': name, 'cat': self.categories.get(name, ''), 'ph': 'X', 'pid': 0, 'tid': 0,
+                           'ts': (start - origin) / 1e3, 'dur': duration / 1e3, 'args': args})
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
@@ -0,0 +1,145 @@
+"""
+Schedule rules, commission and slippage models with the Quantopian names.
+Date rules are evaluated for the whole session calendar at once.
+"""
+import numpy as np
+import pandas as pd
+
+MINUTES_PER_SESSION = 390
+
+
+class DateRule(object):
+
+    def __init__(self, period=None, start=True, days_offset=0):
+        self.period = period
+        self.start = start
+        self.days_offset = days_offset
+
+    def mask(self, sessions):
+        # boolean mask over the sessions on which the rule fires
+        sessions = pd.DatetimeIndex(sessions)
+        if self.period is None:
+            return np.ones(len(sessions), dtype=bool)
+        if self.period == 'week':
+            keys = sessions.to_period('W').asi8
+        else:
+            keys = sessions.year * 12 + sessions.month
+        keys = np.asarray(keys)
+        boundaries = np.flatnonzero(np.diff(keys)) + 1
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [len(keys)])) - 1
+        if self.start:
+            chosen = starts + self.days_offset
+            chosen = chosen[chosen <= ends]
+        else:
+            chosen = ends - self.days_offset
+            chosen = chosen[chosen >= starts]
+        mask = np.zeros(len(sessions), dtype=bool)
+        mask[chosen] = True
+        return mask
+
+
+class date_rules(object):
+
+    @staticmethod
+    def every_day():
+        return DateRule()
+
+    @staticmethod
+    def week_start(days_offset=0):
+        return DateRule('week', True, days_offset)
+
+    @staticmethod
+    def week_end(days_offset=0):
+        return DateRule('week', False, days_offset)
+
+    @staticmethod
+    def month_start(days_offset=0):
+        return DateRule('month', True, days_offset)
+
+    @staticmethod
+    def month_end(days_offset=0):
+        return DateRule('month', False, days_offset)
+
+
+class TimeRule(object):
+
+    def __init__(self, minute):
+        # minute of the session (1 = first minute bar) at which the rule fires
+        self.minute = minute
+
+
+class time_rules(object):
+
+    @staticmethod
+    def market_open(hours=0, minutes=None):
+        offset = 60 * hours + (minutes if minutes is not None else (0 if hours else 1))
+        return TimeRule(max(offset, 1))
+
+    @staticmethod
+    def market_close(hours=0, minutes=None):
+        offset = 60 * hours + (minutes if minutes is not None else (0 if hours else 1))
+        return TimeRule(MINUTES_PER_SESSION - offset)
+
+
+class commission(object):
+
+    class PerShare(object):
+
+        def __init__(self, cost=0.001, min_trade_cost=0.0):
+            self.cost = cost
+            self.min_trade_cost = min_trade_cost
+
+        def calculate(self, amount, price):
+            return max(abs(amount) * self.cost, self.min_trade_cost)
+
+    class PerTrade(object):
+
+        def __init__(self, cost=0.0):
+            self.cost = cost
+
+        def calculate(self, amount, price):
+            return self.cost
+
+    class PerDollar(object):
+
+        def __init__(self, cost=0.0015):
+            self.cost = cost
+
+        def calculate(self, amount, price):
+            return abs(amount) * price * self.cost
+
+
+class slippage(object):
+
+    class NoSlippage(object):
+
+        def fill_price(self, amount, price, volume):
+            return price
+
+    class FixedSlippage(object):
+
+        def __init__(self, spread=0.0):
+            self.spread = spread
+
+        def fill_price(self, amount, price, volume):
+            return price + np.sign(amount) * self.spread / 2.0
+
+    class FixedBasisPointsSlippage(object):
+
+        def __init__(self, basis_points=5.0, volume_limit=0.1):
+            self.basis_points = basis_points
+
+        def fill_price(self, amount, price, volume):
+            return price * (1.0 + np.sign(amount) * self.basis_points / 10000.0)
+
+    class VolumeShareSlippage(object):
+        # price impact only, orders are not split into partial fills
+
+        def __init__(self, volume_limit=0.025, price_impact=0.1):
+            self.volume_limit = volume_limit
+            self.price_impact = price_impact
+
+        def fill_price(self, amount, price, volume):
+            share = min(abs(amount) / volume, self.volume_limit) if volume > 0 else self.volume_limit
+            return price * (1.0 + np.sign(amount) * self.price_impact * share ** 2)
@@ -0,0 +1,434 @@
+"""
+Event-driven daily backtest runtime for the Quantopian-style algorithm files.
+
+Per session: before_trading_start sees the bars up to the previous session, then the scheduled
+functions due that session run in time-rule order, then handle_data. Both see the session's own
+daily bar and orders fill in full at its price (daily mode), which is also the close the
+positions are marked at for the performance row.
+
+With a MinuteFeed (minute mode) the session is walked minute by minute instead, on the minutes
+where something runs: handle_data on every minute, then the scheduled functions of that minute.
+Callbacks see the minute bar and the partial daily bar, orders fill at the last minute price,
+and the positions are marked at the daily price after the close.
+"""
+import asyncio
+import inspect
+import os
+import sys
+import types
+
+import numpy as np
+import pandas as pd
+
+from . import api
+from .feed import MinuteFeed
+from .fetcher import FetchedData, read_csv
+from .ledger import Ledger
+from .optimize import optimization_report, run_optimization
+from .pipeline import FactorCache, PipelineEngine, PipelineOutput
+from .rules import MINUTES_PER_SESSION, commission, slippage
+
+MARKET_OPEN_UTC = pd.Timedelta(hours=13, minutes=30)
+
+
+class Context(object):
+    """
+    The `context` argument of the callbacks. Attributes named in `pinned` keep their value:
+    assignments from the algorithm are ignored, which lets a caller override its constants.
+    `assigned` holds the pinned names the algorithm did assign.
+    """
+
+    def __init__(self, portfolio, account, pinned=None):
+        object.__setattr__(self, 'portfolio', portfolio)
+        object.__setattr__(self, 'account', account)
+        object.__setattr__(self, 'pinned', dict(pinned or {}))
+        object.__setattr__(self, 'assigned', set())
+        for name, value in self.pinned.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        if name in self.pinned:
+            self.assigned.add(name)
+        else:
+            object.__setattr__(self, name, value)
+
+
+class BarData(object):
+    """
+    The `data` argument of the callbacks, reading from the bar arrays up to the current session
+    and, in minute mode, from the bars of the current minute.
+    """
+
+    def __init__(self, algo):
+        self.algo = algo
+
+    def _frame(self, values, assets):
+        bars = self.algo.bars
+        end = self.algo.index
+        index = bars.sessions[max(end - len(values) + 1, 0):end + 1]
+        return pd.DataFrame(values, index=index, columns=assets, copy=False)
+
+    def history(self, assets, fields, bar_count, frequency):
+        if frequency != '1d':
+            raise NotImplementedError('only daily history is available in the local runtime, minute bars are not kept')
+        bars = self.algo.bars
+        single_asset = not isinstance(assets, (list, tuple, set, pd.Index, np.ndarray))
+        asset_list = [assets] if single_asset else list(assets)
+        field_list = [fields] if isinstance(fields, str) else list(fields)
+        columns = bars.columns(asset_list)
+
+        frames = {}
+        for field in field_list:
+            if field in self.algo.fetched:
+                values = self.algo.fetched.window(field, self.algo.index, bar_count, asset_list)
+            else:
+                values = bars.window(field, self.algo.index, bar_count, columns)
+                partial = self.algo.partial_bar(field)
+                if partial is not None and len(values):
+                    # the current session's bar so far, as Quantopian's daily history in minute mode
+                    values = values.copy()
+                    values[-1] = partial[columns]
+            frames[field] = self._frame(values, asset_list)
+        if isinstance(fields, str):
+            frame = frames[fields]
+            return frame.iloc[:, 0] if single_asset else frame
+        if single_asset:
+            return pd.DataFrame(dict((field, frames[field].iloc[:, 0]) for field in field_list))
+        return pd.concat(frames, axis=1)
+
+    def current(self, assets, fields):
+        bars = self.algo.bars
+        index = self.algo.index
+        single_asset = not isinstance(assets, (list, tuple, set, pd.Index, np.ndarray))
+        asset_list = [assets] if single_asset else list(assets)
+        field_list = [fields] if isinstance(fields, str) else list(fields)
+        columns = bars.columns(asset_list)
+        values = dict((field, self.algo.fetched.row(field, index, asset_list) if field in self.algo.fetched
+                       else self.algo.current_row(field)[columns]) for field in field_list)
+        if single_asset:
+            if isinstance(fields, str):
+                return values[fields][0]
+            return pd.Series(dict((field, values[field][0]) for field in field_list))
+        if isinstance(fields, str):
+            return pd.Series(values[fields], index=asset_list)
+        return pd.DataFrame(values, index=asset_list)
+
+    def can_trade(self, assets):
+        close = self.algo.current_row('price' if self.algo.minute_bars is not None else 'close')
+        if isinstance(assets, (list, tuple, set, pd.Index, np.ndarray)):
+            assets = list(assets)
+            return pd.Series(np.isfinite(close[self.algo.bars.columns(assets)]), index=assets)
+        return bool(np.isfinite(close[assets.column]))
+
+    def is_stale(self, assets):
+        tradable = self.can_trade(assets)
+        return ~tradable if isinstance(tradable, pd.Series) else not tradable
+
+    def __contains__(self, asset):
+        return self.can_trade(asset)
+
+
+class TradingAlgorithm(object):
+    """
+    One backtest of an algorithm module over `bars` between start and end (inclusive).
+    context_attrs are pinned on the context, see Context. pipeline_cache: a FactorCache (or its
+    directory) that the attached pipelines read their columns through. profiler: a Profiler that
+    times the run. streaming_pipeline: compute the attached pipelines one session at a time on a
+    streaming PipelineEngine. minute_feed: a MinuteFeed (or its directory) to run in minute mode.
+    """
+
+    def __init__(self, module, bars, start=None, end=None, capital_base=1e6, context_attrs=None,
+                 pipeline_cache=None, profiler=None, streaming_pipeline=False, minute_feed=None):
+        self.module = module
+        self.bars = bars
+        sessions = bars.sessions
+        self.first = sessions.searchsorted(pd.Timestamp(start)) if start is not None else 0
+        self.last = (sessions.searchsorted(pd.Timestamp(end), side='right') - 1 if end is not None
+                     else len(sessions) - 1)
+        self.ledger = Ledger(capital_base, commission.PerShare(), slippage.FixedBasisPointsSlippage())
+        self.context = Context(self.ledger.portfolio, self.ledger.account, context_attrs)
+        self.data = BarData(self)
+        self.index = self.session = self.first
+        self.minute = 0
+        self.scheduled = []
+        self.recorded = {}
+        self.referenced = {}
+        self.volume = bars.fields.get('volume')
+        self.dates = bars.sessions.tolist()
+        self.engine = None
+        self.pipeline_cache = FactorCache(pipeline_cache) if isinstance(pipeline_cache, str) else pipeline_cache
+        self.pipelines = {}
+        self.streaming_pipeline = streaming_pipeline
+        self.profiler = profiler
+        self.fetched = FetchedData(bars.sessions)
+        self.optimizations = []
+        self.feed = MinuteFeed(minute_feed) if isinstance(minute_feed, str) else minute_feed
+        # the MinuteBars of the session being traded in minute mode and the row of the current minute
+        self.minute_bars = None
+        self.minute_row = 0
+
+    def callback(self, name):
+        func = getattr(self.module, name, None)
+        if func is None:
+            return None
+        if len(inspect.signature(func).parameters) == 1:
+            return lambda context, data: func(context)
+        return func
+
+    def get_datetime(self):
+        # the current session also in before_trading_start, whose data is still at the previous close
+        return (self.bars.sessions[self.session] + MARKET_OPEN_UTC + pd.Timedelta(minutes=self.minute)).tz_localize('UTC')
+
+    def schedule_function(self, func, date_rule=None, time_rule=None, half_days=True, calendar=None):
+        sessions = self.bars.sessions[self.first:self.last + 1]
+        mask = date_rule.mask(sessions) if date_rule is not None else np.ones(len(sessions), dtype=bool)
+        minute = time_rule.minute if time_rule is not None else 1
+        self.scheduled.append((minute, len(self.scheduled), func, mask))
+        if self.profiler is not None:
+            self.profiler.scheduled(func)
+        self.scheduled.sort(key=lambda item: item[:2])
+
+    def lookup(self, asset):
+        self.referenced[asset] = True
+        return asset
+
+    def symbol(self, symbol_str):
+        try:
+            return self.lookup(self.bars.by_symbol[symbol_str])
+        except KeyError:
+            raise KeyError('symbol %r is not in the local bars' % symbol_str)
+
+    def sid(self, sid):
+        try:
+            return self.lookup(self.bars.by_sid[sid])
+        except KeyError:
+            raise KeyError('sid %r is not in the local bars' % sid)
+
+    def attach_pipeline(self, pipeline, name, chunks=None):
+        if self.engine is None:
+            self.engine = PipelineEngine(self.bars, self.pipeline_cache, self.streaming_pipeline)
+            if self.profiler is not None:
+                self.engine.compute = self.profiler.wrap(self.engine.compute, 'pipeline.compute', 'pipeline')
+        chunk_size = chunks if isinstance(chunks, int) else 1 if self.streaming_pipeline else 126
+        self.pipelines[name] = PipelineOutput(self.engine, pipeline, chunk_size)
+        return pipeline
+
+    def pipeline_output(self, name):
+        # the pipeline as of the open of the current session, from data up to the previous close
+        try:
+            output = self.pipelines[name]
+        except KeyError:
+            raise KeyError('no pipeline named %r is attached' % name)
+        return output.frame(self.session)
+
+    def fetch_csv(self, url, symbol=None, **kwargs):
+        # a local path in place of the url; without `symbol` the table needs a symbol column
+        table = read_csv(url, **kwargs)
+        if symbol is not None:
+            self.fetched.add(self.symbol(symbol) if isinstance(symbol, str) else symbol, table)
+            return table
+        if 'symbol' not in table.columns:
+            raise ValueError('fetch_csv of %s needs symbol= or a symbol column' % url)
+        for name, rows in table.groupby('symbol', sort=False):
+            self.fetched.add(self.symbol(name), rows.drop(columns='symbol'))
+        return table
+
+    def record(self, **values):
+        day = self.recorded.setdefault(self.index, {})
+        day.update(values)
+
+    # bars of the current minute
+
+    def current_row(self, field):
+        # the row of `field` at the current minute in minute mode, else at the current session
+        minute_bars = self.minute_bars
+        if minute_bars is not None and field in minute_bars.fields:
+            return minute_bars.fields[field][self.minute_row]
+        return self.bars.row(field, self.index)
+
+    def partial_bar(self, field):
+        # the row of the partial daily bar for a history window in minute mode, None otherwise
+        if self.minute_bars is None:
+            return None
+        return self.minute_bars.partial(field, self.minute_row)
+
+    # orders
+
+    def price(self, asset):
+        return self.current_row('price')[asset.column]
+
+    def order(self, asset, amount):
+        index = self.index
+        if self.minute_bars is not None:
+            price = self.minute_bars.fields['price'][self.minute_row, asset.column]
+            volume = self.minute_bars.fields['volume'][self.minute_row, asset.column]
+        else:
+            price = self.bars.fields['price'][index, asset.column]
+            volume = self.volume[index, asset.column] if self.volume is not None else np.nan
+        if not price == price or amount == 0:
+            return None
+        return self.ledger.fill(self.dates[index], asset, int(amount), price, volume)
+
+    def order_value(self, asset, value):
+        price = self.price(asset)
+        return self.order(asset, int(value / price)) if price == price and price > 0 else None
+
+    def order_percent(self, asset, percent):
+        return self.order_value(asset, percent * self.ledger.portfolio.portfolio_value)
+
+    def order_target(self, asset, target):
+        return self.order(asset, self.ledger.target_amount(asset, target))
+
+    def order_target_value(self, asset, target):
+        price = self.price(asset)
+        if not price == price or price <= 0:
+            return None
+        return self.order_target(asset, target / price)
+
+    def order_target_percent(self, asset, target):
+        return self.order_target_value(asset, target * self.ledger.portfolio.portfolio_value)
+
+    def order_optimal_portfolio(self, objective, constraints):
+        # solve from the previous solution, then trade to the weights; the results stay in optimizations
+        portfolio = self.ledger.portfolio
+        current = pd.Series(dict((asset, position.amount * position.last_sale_price / portfolio.portfolio_value)
+                                 for asset, position in portfolio.positions.items() if position.amount),
+                            dtype=float)
+        warm_start = self.optimizations[-1][1] if self.optimizations else None
+        result = run_optimization(objective, constraints, current, warm_start)
+        self.optimizations.append((self.dates[self.index], result))
+        for asset, weight in result.weights.items():
+            self.order_target_percent(asset, weight if abs(weight) > 1e-6 else 0.0)
+        return result
+
+    # run loop
+
+    def initialize(self):
+        """
+        Run the algorithm's initialize. A pinned context attribute that initialize does not set is
+        not one of the algorithm's constants (often a typo) and raises ValueError.
+        """
+        initialize = self.callback('initialize')
+        if initialize is not None:
+            initialize(self.context, self.data)
+        unknown = set(self.context.pinned) - self.context.assigned
+        if unknown:
+            raise ValueError('%s sets no context.%s in initialize, so there is nothing to override' % (
+                getattr(self.module, '__name__', 'the algorithm'), ', context.'.join(sorted(unknown))))
+
+    def run(self):
+        previous = api.set_algorithm(self)
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.instrument(self)
+        try:
+            self.initialize()
+            before_trading_start = self.callback('before_trading_start')
+            handle_data = self.callback('handle_data')
+            if self.feed is None:
+                rows = [self.trade_session(day, index, before_trading_start, handle_data)
+                        for day, index in enumerate(range(self.first, self.last + 1))]
+            else:
+                rows = asyncio.run(self.stream_sessions(before_trading_start, handle_data))
+        finally:
+            api.set_algorithm(previous)
+            if profiler is not None:
+                profiler.release()
+
+        perf = pd.DataFrame(rows, columns=['portfolio_value', 'cash', 'positions_value', 'gross_leverage'],
+                            index=self.bars.sessions[self.first:self.last + 1])
+        perf['returns'] = perf['portfolio_value'].pct_change().fillna(
+            perf['portfolio_value'].iloc[0] / self.ledger.portfolio.starting_cash - 1.0)
+        if self.recorded:
+            recorded = pd.DataFrame.from_dict(self.recorded, orient='index')
+            recorded.index = self.bars.sessions[recorded.index]
+            perf = perf.drop(columns=[name for name in recorded.columns if name in perf.columns]).join(recorded)
+        if self.optimizations:
+            perf.attrs['optimizations'] = optimization_report(self.optimizations)
+        return perf
+
+    async def stream_sessions(self, before_trading_start, handle_data):
+        # minute mode: each session is read with the minutes on which a callback is due
+        every = range(1, MINUTES_PER_SESSION + 1) if handle_data is not None else ()
+        plan = [(index, sorted(set(every).union(minute for minute, _, _, mask in self.scheduled if mask[day])))
+                for day, index in enumerate(range(self.first, self.last + 1))]
+        rows = []
+        async for index, minute_bars in self.feed.sessions(self.bars, plan):
+            rows.append(self.trade_session(index - self.first, index, before_trading_start, handle_data, minute_bars))
+        return rows
+
+    def trade_session(self, day, index, before_trading_start, handle_data, minute_bars=None):
+        # one session of the run loop, returning its performance row
+        profiler = self.profiler
+        price = self.bars.fields['price']
+        self.session = index
+        if profiler is not None:
+            profiler.begin_day(index)
+        if before_trading_start is not None:
+            # the portfolio is still marked at the previous close
+            self.index, self.minute = max(index - 1, 0), -45
+            before_trading_start(self.context, self.data)
+
+        self.index = index
+        if minute_bars is None:
+            # fills happen at the same price row, so this mark already holds at the close
+            self.ledger.mark(price[index])
+            for minute, _, func, mask in self.scheduled:
+                if mask[day]:
+                    self.minute = minute
+                    func(self.context, self.data)
+            if handle_data is not None:
+                self.minute = 390
+                handle_data(self.context, self.data)
+        else:
+            due = {}
+            for minute, _, func, mask in self.scheduled:
+                if mask[day]:
+                    due.setdefault(minute, []).append(func)
+            self.minute_bars = minute_bars
+            try:
+                for row, minute in enumerate(minute_bars.minutes):
+                    self.minute, self.minute_row = minute, row
+                    self.ledger.mark(minute_bars.fields['price'][row])
+                    if handle_data is not None:
+                        handle_data(self.context, self.data)
+                    for func in due.get(minute, ()):
+                        func(self.context, self.data)
+            finally:
+                self.minute_bars = None
+            self.ledger.mark(price[index])
+
+        portfolio = self.ledger.portfolio
+        if profiler is not None:
+            profiler.end_day()
+        return (portfolio.portfolio_value, portfolio.cash, portfolio.positions_value, self.ledger.account.leverage)
+
+
+def load_algorithm(path, name=None):
+    """
+    Execute an algorithm file as a module whose globals hold the Quantopian API
+    (schedule_function, order_target_percent, symbol, ...). The module is registered in
+    sys.modules so that its functions can be pickled into worker processes.
+    """
+    from . import compat
+
+    compat.install()
+    name = name or os.path.splitext(os.path.basename(path))[0]
+    module = types.ModuleType(name)
+    module.__file__ = os.path.abspath(path)
+    module.__dict__.update(api.namespace())
+    sys.modules[name] = module
+    with open(path) as source:
+        exec(compile(source.read(), module.__file__, 'exec'), module.__dict__)
+    return module
+
+
+def run_algorithm(algorithm, bars, start=None, end=None, capital_base=1e6, context_attrs=None, pipeline_cache=None,
+                  profiler=None, streaming_pipeline=False, minute_feed=None):
+    """
+    Backtest an algorithm (a module or the path of an algorithm file) and return the daily
+    performance DataFrame.
+    """
+    module = load_algorithm(algorithm) if isinstance(algorithm, str) else algorithm
+    return TradingAlgorithm(module, bars, start, end, capital_base, context_attrs, pipeline_cache, profiler,
+                            streaming_pipeline, minute_feed).run()
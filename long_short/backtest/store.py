@@ -0,0 +1,115 @@
+"""
+On-disk columnar store for daily bars: one raw float64 file per field, laid out session-major
+(sessions x assets), plus a small meta.json with the session and asset indexes. The files are
+memory-mapped, so a history window is a view of consecutive rows and only the pages it touches
+are read. New sessions are appended to the end of every file without rewriting them.
+
+    python -m backtest.store data/bars.csv data/bars.store
+"""
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from .assets import Asset
+from .bars import DailyBars
+
+META = 'meta.json'
+DTYPE = np.dtype('<f8')
+
+
+class ColumnStore(DailyBars):
+    """
+    DailyBars whose field arrays are memory maps of the store files at `path`.
+    stats counts the history requests served and the bytes their windows cover.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META)) as meta_file:
+            meta = json.load(meta_file)
+        self.names = meta['fields']
+        assets = [Asset(sid, symbol) for sid, symbol in meta['assets']]
+        sessions = pd.DatetimeIndex(meta['sessions'])
+        DailyBars.__init__(self, sessions, assets, self.map(len(sessions), len(assets)))
+        self.stats = {'requests': 0, 'bytes_read': 0, 'last_bytes': 0}
+
+    def map(self, rows, width):
+        fields = {}
+        for name in self.names:
+            if rows:
+                fields[name] = np.memmap(self.file(name), dtype=DTYPE, mode='r', shape=(rows, width))
+            else:
+                fields[name] = np.empty((0, width), dtype=DTYPE)
+        return fields
+
+    def file(self, name):
+        return os.path.join(self.path, name + '.f8')
+
+    @classmethod
+    def write(cls, path, bars):
+        """
+        Create a store at `path` from DailyBars (or overwrite the one there) and open it.
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        for name, values in bars.fields.items():
+            np.ascontiguousarray(values, dtype=DTYPE).tofile(os.path.join(path, name + '.f8'))
+        write_meta(path, bars.sessions, bars.assets, sorted(bars.fields))
+        return cls(path)
+
+    def append(self, sessions, fields):
+        """
+        Add sessions after the last stored one. fields: {field: (new sessions x assets) array} with the
+        store's asset columns; a missing 'price' is forward filled from the last stored price.
+        """
+        sessions = pd.DatetimeIndex(sessions)
+        if len(self.sessions) and sessions[0] <= self.sessions[-1]:
+            raise ValueError('appended sessions must start after %s' % self.sessions[-1].date())
+        shape = (len(sessions), len(self.assets))
+        fields = dict((name, np.asarray(values, dtype=DTYPE).reshape(shape)) for name, values in fields.items())
+        if 'price' not in fields:
+            previous = self.fields['price'][-1:] if len(self.sessions) else np.full((1, shape[1]), np.nan)
+            fields['price'] = pd.DataFrame(np.vstack((previous, fields['close']))).ffill().values[1:]
+        missing = set(self.names) - set(fields)
+        if missing:
+            raise ValueError('append is missing fields %s' % sorted(missing))
+
+        for name in self.names:
+            with open(self.file(name), 'ab') as data_file:
+                np.ascontiguousarray(fields[name]).tofile(data_file)
+        self.sessions = self.sessions.append(sessions)
+        # the meta file is replaced last, so an interrupted append leaves the previous sessions readable
+        write_meta(self.path, self.sessions, self.assets, self.names)
+        self.fields = self.map(len(self.sessions), len(self.assets))
+
+    def window(self, field, end, bar_count, columns=None):
+        values = DailyBars.window(self, field, end, bar_count, columns)
+        stats = self.stats
+        stats['requests'] += 1
+        stats['last_bytes'] = values.nbytes
+        stats['bytes_read'] += values.nbytes
+        return values
+
+
+def write_meta(path, sessions, assets, fields):
+    meta = {'sessions': [session.strftime('%Y-%m-%d') for session in sessions],
+            'assets': [[asset.sid, asset.symbol] for asset in assets],
+            'fields': list(fields)}
+    temporary = os.path.join(path, META + '.tmp')
+    with open(temporary, 'w') as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(temporary, os.path.join(path, META))
+
+
+def is_store(path):
+    return os.path.isfile(os.path.join(path, META))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit('usage: python -m backtest.store BARS_CSV STORE_DIR')
+    store = ColumnStore.write(sys.argv[2], DailyBars.from_csv(sys.argv[1]))
+    print('%d sessions x %d assets, fields %s' % (len(store.sessions), len(store.assets), ', '.join(store.names)))
@@ -0,0 +1,212 @@
+"""
+Parameter sweeps: one backtest per point of a grid of context attributes, run on a process pool.
+The bar arrays are placed in shared memory once (a ColumnStore is shared through its memory-mapped
+files) and every worker builds its DailyBars on views of them. Summaries are streamed as runs finish.
+
+    python -m backtest.sweep algorithms/elastic_asset_allocation.py --bars data/bars.store \\
+        --grid '{"leverage": [0.5, 1.0], "score_weights": [[2, 1, 0.25, 1, 1e-6, 4], [1, 1, 0, 0.5, 1e-6, 0]]}'
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from . import api
+from .assets import Asset
+from .bars import DailyBars
+from .runtime import TradingAlgorithm, load_algorithm, run_algorithm
+from .store import ColumnStore, is_store
+
+WORKER = {}
+
+
+def expand(grid):
+    """
+    {name: [values]} -> list of {name: value}, in product order.
+    """
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def check_grid(algorithm, bars, grid):
+    """
+    Run the algorithm's initialize once with the first grid point, which raises ValueError when a
+    grid name is not a context attribute that initialize sets (a typo would sweep nothing).
+    """
+    points = expand(grid)
+    if not points:
+        return
+    algo = TradingAlgorithm(load_algorithm(algorithm), bars, context_attrs=points[0])
+    previous = api.set_algorithm(algo)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            algo.initialize()
+    finally:
+        api.set_algorithm(previous)
+
+
+def summarize(perf, capital_base):
+    returns = perf['returns']
+    value = perf['portfolio_value']
+    years = len(perf) / 252.0
+    total = value.iloc[-1] / capital_base - 1.0
+    volatility = returns.std() * np.sqrt(252)
+    return {'total_return': total,
+            'annual_return': (1.0 + total) ** (1.0 / years) - 1.0 if years > 0 and total > -1 else np.nan,
+            'annual_volatility': volatility,
+            'sharpe': returns.mean() / returns.std() * np.sqrt(252) if returns.std() > 0 else np.nan,
+            'max_drawdown': (value / value.cummax() - 1.0).min(),
+            'mean_leverage': perf['gross_leverage'].mean()}
+
+
+def share(bars):
+    """
+    Copy the bar fields into shared memory: (blocks to unlink, spec a worker rebuilds the bars from).
+    """
+    assets = [(asset.sid, asset.symbol) for asset in bars.assets]
+    if isinstance(bars, ColumnStore):
+        return [], {'store': bars.path, 'sessions': None, 'assets': assets, 'fields': {}}
+    blocks, fields = [], {}
+    for name, values in bars.fields.items():
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=np.float64, buffer=block.buf)[...] = values
+        blocks.append(block)
+        fields[name] = (block.name, values.shape)
+    return blocks, {'store': None, 'sessions': bars.sessions, 'assets': assets, 'fields': fields}
+
+
+def attach(spec):
+    if spec['store'] is not None:
+        return ColumnStore(spec['store']), []
+    blocks, fields = [], {}
+    for name, (block_name, shape) in spec['fields'].items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        fields[name] = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+    assets = [Asset(sid, symbol) for sid, symbol in spec['assets']]
+    return DailyBars(spec['sessions'], assets, fields), blocks
+
+
+def init_worker(spec, settings):
+    bars, blocks = attach(spec)
+    # keep the attached blocks referenced for the life of the worker
+    WORKER.update(bars=bars, blocks=blocks, settings=settings)
+
+
+def run_point(point):
+    params, number = point
+    settings = WORKER['settings']
+    started = time.time()
+    try:
+        perf = run_algorithm(settings['algorithm'], WORKER['bars'], settings['start'], settings['end'],
+                             settings['capital_base'], context_attrs=params,
+                             pipeline_cache=settings['pipeline_cache'])
+        summary = summarize(perf, settings['capital_base'])
+        error = None
+    except Exception as exception:
+        summary, error = {}, '%s: %s' % (type(exception).__name__, exception)
+    summary.update(run=number, seconds=time.time() - started, pid=os.getpid(), error=error)
+    return params, summary
+
+
+def iter_sweep(algorithm, bars, grid, start=None, end=None, capital_base=1e6, processes=None,
+              pipeline_cache=None):
+    """
+    Yield (params, summary) per grid point in completion order. processes=1 runs in this process.
+    """
+    check_grid(algorithm, bars, grid)
+    points = [(params, number) for number, params in enumerate(expand(grid))]
+    settings = {'algorithm': os.path.abspath(algorithm), 'start': start, 'end': end,
+                'capital_base': capital_base, 'pipeline_cache': pipeline_cache}
+    processes = min(processes or os.cpu_count() or 1, len(points))
+    if processes <= 1:
+        WORKER.update(bars=bars, blocks=[], settings=settings)
+        for point in points:
+            yield run_point(point)
+        return
+
+    blocks, spec = share(bars)
+    try:
+        pool = multiprocessing.Pool(processes, initializer=init_worker, initargs=(spec, settings))
+        try:
+            for result in pool.imap_unordered(run_point, points):
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def sweep(algorithm, bars, grid, start=None, end=None, capital_base=1e6, processes=None, output=None,
+          pipeline_cache=None, verbose=True):
+    """
+    Run the whole grid and return the summary table, one row per run sorted by run number.
+    output: CSV that receives each row as soon as its run finishes.
+    """
+    rows = []
+    names = sorted(grid)
+    stream = None
+    if output:
+        stream = open(output, 'w')
+    try:
+        for params, summary in iter_sweep(algorithm, bars, grid, start, end, capital_base, processes, pipeline_cache):
+            row = dict(summary)
+            row.update((name, json.dumps(params[name]) if isinstance(params[name], (list, tuple, dict))
+                        else params[name]) for name in names)
+            rows.append(row)
+            frame = pd.DataFrame([row])
+            if stream is not None:
+                frame.to_csv(stream, header=len(rows) == 1, index=False)
+                stream.flush()
+            if verbose:
+                print(frame.to_string(index=False, header=len(rows) == 1))
+    finally:
+        if stream is not None:
+            stream.close()
+    table = pd.DataFrame(rows)
+    return table.sort_values('run').set_index('run') if len(table) else table
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m backtest.sweep', description='Backtest an algorithm over a parameter grid.')
+    parser.add_argument('algorithm')
+    parser.add_argument('--bars', required=True, help='column store directory, long CSV or directory of per-symbol CSVs')
+    parser.add_argument('--grid', required=True, help='JSON object {context attribute: [values]} or a path to one')
+    parser.add_argument('--start', default=None)
+    parser.add_argument('--end', default=None)
+    parser.add_argument('--capital', type=float, default=1e6)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--pipeline-cache', default=None)
+    parser.add_argument('--output', default=None, help='CSV receiving one summary row per finished run')
+    args = parser.parse_args()
+
+    if os.path.isfile(args.grid):
+        with open(args.grid) as grid_file:
+            grid = json.load(grid_file)
+    else:
+        grid = json.loads(args.grid)
+    bars = ColumnStore(args.bars) if is_store(args.bars) else DailyBars.from_csv(args.bars)
+    started = time.time()
+    table = sweep(args.algorithm, bars, grid, args.start, args.end, args.capital, args.processes, args.output,
+                  args.pipeline_cache)
+    print('%d runs in %.1fs' % (len(table), time.time() - started))
+    if len(table) and 'sharpe' in table:
+        print(table.sort_values('sharpe', ascending=False).head(10).to_string())
+    return 0 if len(table) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,4 @@
+"""
+Offline benchmarks for the optimizers in long_short/algorithms.
+Run them from the long_short directory, e.g. `python -m benchmarks.factor_covariance`.
+"""
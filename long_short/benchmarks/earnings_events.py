@@ -0,0 +1,171 @@
+"""
+EarningsEvents, the incremental earnings signal of algorithms/factset_estimates.py, against the
+full pipeline it replaced (BusinessDaysSincePreviousEvent over the Actuals asof_date, longs,
+shorts and old_announcement recomputed for the whole universe), on seeded synthetic bars with
+quarterly EPS actuals and consensus, and daily news sentiment. For the same random positions,
+the alphas to open and to hold must be the same on every session, also when a reported asof_date
+is withdrawn for a session (a share of the names each session). Also times both signals and
+backtests the algorithm end to end; exits with status 1 on a mismatch.
+
+    python -m benchmarks.earnings_events --assets 500 --days 400
+"""
+import argparse
+import contextlib
+import io
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from backtest import DailyBars, api
+from backtest.pipeline import Actuals, BusinessDaysSincePreviousEvent, Pipeline, PipelineEngine, PipelineOutput, \
+    PeriodicConsensus, QTradableStocksUS, sentiment
+from backtest.runtime import TradingAlgorithm, load_algorithm, run_algorithm
+
+from .synthetic import factor_prices
+
+EPOCH = np.datetime64('1970-01-01', 'D')
+
+
+def earnings_bars(n_assets, days, seed=0):
+    """
+    Factor-model closes plus, per asset, an EPS report about every quarter: the actual and its
+    asof_date (the report session or up to two calendar days before it, sometimes a weekend) on
+    the report session, a consensus mean a week before, and a daily sentiment signal with gaps.
+    A tenth of the assets never report.
+    """
+    rng = np.random.RandomState(seed)
+    close = factor_prices(n_assets, days, seed=seed)
+    shape = close.shape
+    actual, asof, mean = np.full(shape, np.nan), np.full(shape, np.nan), np.full(shape, np.nan)
+    session_days = (close.index.values.astype('datetime64[D]') - EPOCH).astype(float)
+    for column in range(n_assets):
+        if rng.rand() < 0.1:
+            continue
+        row = rng.randint(0, 63)
+        while row < days:
+            value = rng.normal(1.0, 0.5)
+            actual[row, column] = value
+            asof[row, column] = session_days[row] - rng.randint(0, 3)
+            mean[max(row - 5, 0), column] = value * (1.0 + rng.normal(0.0, 0.05))
+            row += 63 + rng.randint(-5, 6)
+    signal = rng.normal(0.0, 2.0, shape)
+    signal[rng.rand(*shape) < 0.2] = np.nan
+    fields = {'volume': np.full(shape, 1e6), 'actuals_eps_qf0_actual_value': actual,
+              'actuals_eps_qf0_asof_date': asof, 'periodic_consensus_eps_qf0_mean': mean, 'sentiment_signal': signal}
+    frames = dict((name, pd.DataFrame(values, index=close.index, columns=close.columns))
+                  for name, values in fields.items())
+    frames['close'] = close
+    return DailyBars.from_frames(frames)
+
+
+def reference_pipeline(context):
+    # the screens of factset_estimates before EarningsEvents, computed for the whole universe
+    fq0_eps_cons = PeriodicConsensus.slice('EPS', 'qf', 0)
+    fq0_eps_act = Actuals.slice('EPS', 'qf', 0)
+    surprise = (fq0_eps_act.actual_value.latest - fq0_eps_cons.mean.latest) / fq0_eps_cons.mean.latest
+    days_since_announcement = BusinessDaysSincePreviousEvent(inputs=[fq0_eps_act.asof_date])
+    recent_announcement = days_since_announcement <= context.MAX_DAYS_AFTER_EARNINGS_TO_OPEN
+    old_announcement = days_since_announcement > context.MAX_DAYS_AFTER_EARNINGS_TO_HOLD
+    news_sentiment = sentiment.sentiment_signal.latest
+    shorts = (recent_announcement & (surprise > context.MIN_SHORT_SURPRISE) &
+              (news_sentiment > context.MIN_SHORT_SENTIMENT))
+    longs = (recent_announcement & (surprise < context.MAX_LONG_SURPRISE) &
+             (news_sentiment < context.MAX_LONG_SENTIMENT))
+    return Pipeline(columns={'longs': longs, 'shorts': shorts, 'surprise': surprise,
+                             'old_announcement': old_announcement}, screen=QTradableStocksUS())
+
+
+def reference_alphas(output, current_positions):
+    # place_orders before EarningsEvents
+    long_alphas = -output.query('index not in @current_positions and longs').surprise
+    short_alphas = -output.query('index not in @current_positions and shorts').surprise
+    hold_these_alphas = -output.query('index in @current_positions and not old_announcement').surprise
+    return pd.concat([long_alphas, short_alphas, hold_these_alphas])
+
+
+def same_alphas(left, right):
+    left, right = left.sort_index(key=sid_key), right.sort_index(key=sid_key)
+    return left.index.equals(right.index) and np.array_equal(left.values, right.values, equal_nan=True)
+
+
+def sid_key(index):
+    return pd.Index([asset.sid for asset in index])
+
+
+def initialized(module, bars):
+    # a TradingAlgorithm with initialize run, for the context and its EarningsEvents
+    algo = TradingAlgorithm(module, bars)
+    previous = api.set_algorithm(algo)
+    try:
+        module.initialize(algo.context)
+    finally:
+        api.set_algorithm(previous)
+    return algo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--assets', type=int, default=500)
+    parser.add_argument('--days', type=int, default=400)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--held', type=float, default=0.05, help='share of the assets held on each session')
+    parser.add_argument('--withdrawn', type=float, default=0.02,
+                        help='share of the assets whose asof_date is missing on each session')
+    args = parser.parse_args()
+
+    module = load_algorithm('algorithms/factset_estimates.py')
+    bars = earnings_bars(args.assets, args.days, args.seed)
+    algo = initialized(module, bars)
+    context = algo.context
+    engine = PipelineEngine(bars)
+    reference = PipelineOutput(engine, reference_pipeline(context))
+    incremental = PipelineOutput(engine, module.make_pipeline(context))
+
+    rng = np.random.RandomState(args.seed)
+    timings = {'reference': 0.0, 'incremental': 0.0}
+    mismatches = []
+    counts = {'opens': 0, 'holds': 0}
+    for index in range(1, len(bars.sessions)):
+        positions = set(asset for asset in bars.assets if rng.rand() < args.held)
+        expected_frame, frame = reference.frame(index), incremental.frame(index)
+        withdrawn = frame.index[rng.rand(len(frame)) < args.withdrawn]
+        if len(withdrawn):
+            # without an asof_date a name is neither recent nor old
+            expected_frame, frame = expected_frame.copy(), frame.copy()
+            expected_frame.loc[withdrawn, ['longs', 'shorts', 'old_announcement']] = False
+            frame.loc[withdrawn, 'asof_date'] = np.nan
+
+        started = time.perf_counter()
+        expected = reference_alphas(expected_frame, list(positions))
+        timings['reference'] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        context.events.update(bars.sessions[index].date(), frame)
+        opens, holds = context.events.candidates(positions)
+        timings['incremental'] += time.perf_counter() - started
+
+        counts['opens'] += len(opens)
+        counts['holds'] += len(holds)
+        if not same_alphas(expected, pd.concat([opens, holds])):
+            mismatches.append(bars.sessions[index].date())
+
+    sessions = len(bars.sessions) - 1
+    print('%d sessions x %d assets: %d opens, %d holds, %d mismatching sessions' % (
+        sessions, args.assets, counts['opens'], counts['holds'], len(mismatches)))
+    for name, seconds in timings.items():
+        print('%-12s %8.2f ms/session' % (name, 1e3 * seconds / sessions))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        perf = run_algorithm(module, bars, start=bars.sessions[1])
+    print('backtest: total return %.2f%%, max leverage %.2f' % (
+        100 * (perf['portfolio_value'].iloc[-1] / perf['portfolio_value'].iloc[0] - 1), perf['gross_leverage'].max()))
+    if mismatches:
+        print('mismatches on %s' % ', '.join(str(day) for day in mismatches[:10]))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
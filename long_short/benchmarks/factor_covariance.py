@@ -0,0 +1,49 @@
+"""
+Dense versus factor covariance in the GA fitness: Evolve wall time and the out-of-sample
+Sharpe of the resulting weights on the quarter following the training window.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from .synthetic import factor_prices, load_algorithm
+
+
+def realized_sharpe(weights, prices):
+    returns = np.diff(prices.values, axis=0) / prices.values[:-1]
+    portfolio = returns.dot(weights)
+    return np.sqrt(252) * portfolio.mean() / portfolio.std(ddof=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--assets', type=int, nargs='+', default=[50, 200, 500])
+    parser.add_argument('--factors', type=int, default=5)
+    parser.add_argument('--pop-size', type=int, default=200)
+    parser.add_argument('--generations', type=int, default=50)
+    parser.add_argument('--seeds', type=int, default=3)
+    args = parser.parse_args()
+
+    ga = load_algorithm('genetic_default.py')
+    train_days, test_days = 252 * 3, 63
+    print('%8s %8s %10s %10s %10s' % ('assets', 'backend', 'seconds', 'in-sample', 'oos sharpe'))
+    for n_assets in args.assets:
+        for backend in ('dense', 'factor'):
+            seconds, fitness, oos = [], [], []
+            for seed in range(args.seeds):
+                prices = factor_prices(n_assets, train_days + test_days, seed=seed)
+                train, test = prices.iloc[:train_days], prices.iloc[train_days - 1:]
+                np.random.seed(seed)
+                started = time.time()
+                hof, pop, result, stats = ga.Evolve(train, pop_size=args.pop_size, generations=args.generations,
+                                                    covariance=backend, factors=args.factors)
+                seconds.append(time.time() - started)
+                fitness.append(hof['Fitness'])
+                oos.append(realized_sharpe(np.array([result[asset] for asset in test.columns]), test))
+            print('%8d %8s %10.3f %10.3f %10.3f' % (n_assets, backend, np.mean(seconds), np.mean(fitness),
+                                                    np.mean(oos)))
+
+
+if __name__ == '__main__':
+    main()
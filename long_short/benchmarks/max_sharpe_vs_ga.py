@@ -0,0 +1,46 @@
+"""
+Max-Sharpe solver versus the GA on seeded synthetic prices: wall time and the Sharpe ratio
+(the GA fitness) each optimizer reaches for the same price window.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from .synthetic import factor_prices, load_algorithm
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--assets', type=int, nargs='+', default=[4, 50, 200, 500, 1000])
+    parser.add_argument('--days', type=int, default=252 * 3)
+    parser.add_argument('--pop-size', type=int, default=200)
+    parser.add_argument('--generations', type=int, default=50)
+    parser.add_argument('--max-weight', type=float, default=1.0)
+    parser.add_argument('--seeds', type=int, default=3)
+    args = parser.parse_args()
+
+    ga = load_algorithm('genetic_default.py')
+    print('%8s %12s %12s %12s %12s' % ('assets', 'solver s', 'GA s', 'solver sharpe', 'GA sharpe'))
+    for n_assets in args.assets:
+        timings, sharpes = {'max_sharpe': [], 'ga': []}, {'max_sharpe': [], 'ga': []}
+        for seed in range(args.seeds):
+            prices = factor_prices(n_assets, args.days, seed=seed)
+            moments = ga.portfolioMoments(prices)
+            for method in ('max_sharpe', 'ga'):
+                # the GA's own settings, which the solver does not take
+                options = {'pop_size': args.pop_size, 'generations': args.generations} if method == 'ga' else {}
+                np.random.seed(seed)
+                started = time.time()
+                hof, pop, result, stats = ga.Allocate(prices, method=method, moments=moments,
+                                                      max_weight=args.max_weight, **options)
+                timings[method].append(time.time() - started)
+                weights = np.array([result[asset] for asset in prices.columns])
+                fitness, ER = ga.EvaluatePopulation(weights, moments[0], moments[1], max_weight=args.max_weight + 1e-9)
+                sharpes[method].append(fitness[0])
+        print('%8d %12.3f %12.3f %12.3f %12.3f' % (n_assets, np.mean(timings['max_sharpe']), np.mean(timings['ga']),
+                                                   np.mean(sharpes['max_sharpe']), np.mean(sharpes['ga'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Checks order_optimal_portfolio's optimizer on problems of the long-short algorithms' shape:
+MaximizeAlpha under PositionConcentration +-0.01, MaxGrossExposure(1.0), DollarNeutral() and
+MaxTurnover(0.5), from an empty portfolio. Seeds 7 and 13 at 100 assets stall the ADMM on this
+linear objective and must still be solved, through the HiGHS fallback. Every result must
+satisfy the constraints and match the objective of the same LP solved directly by HiGHS.
+Exits with status 1 on a failed check.
+
+    python -m benchmarks.optimizer_lp --assets 100 500 --seeds 24
+"""
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.optimize import linprog
+
+from backtest import optimize as opt
+
+MAX_WEIGHT = 0.01
+TURNOVER = 0.5
+REGRESSIONS = [(100, 7), (100, 13)]
+
+
+def long_short_problem(n_assets, seed):
+    alphas = pd.Series(np.random.RandomState(seed).randn(n_assets), index=['ASSET%d' % i for i in range(n_assets)])
+    constraints = [opt.PositionConcentration.with_equal_bounds(-MAX_WEIGHT, MAX_WEIGHT), opt.MaxGrossExposure(1.0),
+                   opt.DollarNeutral(), opt.MaxTurnover(TURNOVER)]
+    return alphas, constraints
+
+
+def reference_objective(alphas):
+    # the same LP over [w, g, t], g >= |w| and t >= |w|, with MaximizeAlpha's scaling of the alphas
+    n = len(alphas)
+    identity, zero = sparse.identity(n), sparse.csr_matrix((n, n))
+    q = -alphas.values / np.abs(alphas.values).max()
+    rows = [sparse.hstack([identity, -identity, zero]), sparse.hstack([-identity, -identity, zero]),
+            sparse.hstack([identity, zero, -identity]), sparse.hstack([-identity, zero, -identity]),
+            sparse.csr_matrix(np.concatenate([np.zeros(n), np.ones(n), np.zeros(n)])),
+            sparse.csr_matrix(np.concatenate([np.zeros(2 * n), np.ones(n)])),
+            sparse.csr_matrix(np.concatenate([np.ones(n), np.zeros(2 * n)])),
+            sparse.csr_matrix(np.concatenate([-np.ones(n), np.zeros(2 * n)]))]
+    limits = np.concatenate([np.zeros(4 * n), [1.0, TURNOVER, 1e-4, 1e-4]])
+    result = linprog(np.concatenate([q, np.zeros(2 * n)]), A_ub=sparse.vstack(rows, format='csr'), b_ub=limits,
+                     bounds=[(-MAX_WEIGHT, MAX_WEIGHT)] * n + [(0, None)] * (2 * n), method='highs')
+    return q, result.fun
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--assets', type=int, nargs='+', default=[100, 500])
+    parser.add_argument('--seeds', type=int, default=24)
+    args = parser.parse_args()
+
+    failures = []
+    cases = sorted(set(REGRESSIONS + [(n, seed) for n in args.assets for seed in range(args.seeds)]))
+    for n_assets, seed in cases:
+        alphas, constraints = long_short_problem(n_assets, seed)
+        try:
+            result = opt.run_optimization(opt.MaximizeAlpha(alphas), constraints)
+        except opt.OptimizationFailed as error:
+            failures.append('%d assets, seed %d: %s' % (n_assets, seed, error))
+            continue
+        weights = result.weights.reindex(alphas.index).fillna(0.0).values
+        q, expected = reference_objective(alphas)
+        violation = max(np.abs(weights).max() - MAX_WEIGHT, np.abs(weights).sum() - 1.0, abs(weights.sum()) - 1e-4)
+        if violation > 1e-7 or abs(q.dot(weights) - expected) > 1e-7:
+            failures.append('%d assets, seed %d: objective %.10f instead of %.10f, violation %.2g' % (
+                n_assets, seed, q.dot(weights), expected, violation))
+    print('%d problems, %d failed' % (len(cases), len(failures)))
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Checks the pipeline cache on mean_reversion's pipeline: two adjacent chunks computed through a
+FactorCache must extend one entry per column, so that a rerun on the same directory, with a new
+FactorCache as a new process would have, serves every row from the cache and returns the same
+values as an uncached engine. Two caches opened on one directory before either saves, as the
+workers of a sweep, must leave the entries of both in the index. Then backtests mean_reversion
+twice on one cache directory, the second run computing no rows. Exits with status 1 on a failed
+check.
+
+    python -m benchmarks.pipeline_cache --assets 300
+"""
+import argparse
+import contextlib
+import io
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from backtest.pipeline import FactorCache, PipelineEngine
+from backtest.runtime import run_algorithm
+
+from .suite import algorithm, synthetic_bars
+
+CHUNK = 126
+
+
+def computed_rows(cache):
+    return int(cache.report()['computed_rows'].sum())
+
+
+def chunked(bars, terms, path, start):
+    # the terms over two adjacent chunks through a new FactorCache on path, as the runtime computes them
+    cache = FactorCache(path)
+    engine = PipelineEngine(bars, cache)
+    chunks = [engine.compute(terms, lo, lo + CHUNK) for lo in (start, start + CHUNK)]
+    return dict((name, np.concatenate([chunk[name] for chunk in chunks])) for name in terms), cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--assets', type=int, default=300)
+    args = parser.parse_args()
+
+    mean_reversion = algorithm('mean_reversion')
+    bars = synthetic_bars(args.assets, 300 + 2 * CHUNK)
+    terms = mean_reversion.make_pipeline().terms()
+    expected = PipelineEngine(bars).compute(terms, 300, 300 + 2 * CHUNK)
+    failures = []
+    directory = tempfile.mkdtemp()
+    try:
+        first, cache = chunked(bars, terms, directory, 300)
+        print('first run:  %d rows computed' % computed_rows(cache))
+        rerun, cache = chunked(bars, terms, directory, 300)
+        print('rerun:      %d rows computed' % computed_rows(cache))
+        print(cache.report())
+        if computed_rows(cache) or (cache.report()['hits'] != 2).any():
+            failures.append('the rerun computed rows')
+        for name in terms:
+            for label, values in (('first run', first), ('rerun', rerun)):
+                if not np.array_equal(values[name], expected[name], equal_nan=True):
+                    failures.append('%s %s differs from the uncached engine' % (label, name))
+
+        # each worker computes half of the columns with the index it read at start
+        names = sorted(terms)
+        workers = [PipelineEngine(bars, FactorCache(directory + '/shared')) for _ in range(2)]
+        for engine, half in zip(workers, (names[::2], names[1::2])):
+            engine.compute(dict((name, terms[name]) for name in half), 300, 300 + CHUNK)
+        cache = FactorCache(directory + '/shared')
+        PipelineEngine(bars, cache).compute(terms, 300, 300 + CHUNK)
+        print('workers:    %d entries, %d rows computed after' % (len(cache.entries), computed_rows(cache)))
+        if computed_rows(cache):
+            failures.append('a worker lost the entries of the other')
+
+        runs = []
+        for run in range(2):
+            cache = FactorCache(directory + '/backtest')
+            with contextlib.redirect_stdout(io.StringIO()):
+                runs.append(run_algorithm(mean_reversion, bars, start=bars.sessions[300], pipeline_cache=cache))
+            print('backtest %d: %d rows computed' % (run + 1, computed_rows(cache)))
+        if computed_rows(cache):
+            failures.append('the second backtest computed rows')
+        if not runs[0]['portfolio_value'].equals(runs[1]['portfolio_value']):
+            failures.append('the backtests differ')
+    finally:
+        shutil.rmtree(directory)
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,299 @@
+"""
+Timing suite for the optimizer and allocation hot paths on seeded synthetic prices: EvaluationFunction,
+EvaluatePopulation (also chunked to a memory budget in float32), tournamentSelection, Evolve,
+genetic_default.Optimize, EAA reallocate, the batched EAA scorer, the order_optimal_portfolio optimizer
+and the mean_reversion pipeline advanced one session at a time on a streaming engine, at 4, 50, 500 and
+2,000 assets. Records the best wall time, throughput and peak
+traced memory of every case and compares them with a stored baseline; exits with status 1 when a case
+regressed.
+
+    python -m benchmarks.suite --save-baseline          # on the reference commit
+    python -m benchmarks.suite                          # after the change
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from backtest import DailyBars
+from backtest import api
+from backtest import optimize as opt
+from backtest.pipeline import PipelineEngine
+from backtest.pipeline.risk import SECTORS, STYLES
+from backtest.runtime import TradingAlgorithm, load_algorithm
+
+from .synthetic import ALGORITHMS_DIR, factor_prices
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DAYS = 252 * 3
+GA_SYMBOLS = ['GLD', 'LQD', 'AGG', 'SPY']
+EAA_SIDS = [22739, 22972, 22446, 23921, 23870]
+
+
+def algorithm(name):
+    module = sys.modules.get(name)
+    if module is None or not hasattr(module, 'schedule_function'):
+        module = load_algorithm(os.path.join(ALGORITHMS_DIR, name + '.py'))
+    return module
+
+
+def synthetic_bars(n_assets, days, symbols=(), sids=()):
+    # factor-model closes plus a high/low band; the first columns take the given symbols and sids
+    close = factor_prices(n_assets, days, seed=n_assets)
+    names = list(symbols) + ['ASSET%d' % i for i in range(len(symbols), n_assets)]
+    close.columns = names[:n_assets]
+    spread = close * np.random.RandomState(n_assets).uniform(0.002, 0.02, close.shape)
+    frames = {'close': close, 'high': close + spread, 'low': close - spread,
+              'volume': pd.DataFrame(1e6, index=close.index, columns=close.columns)}
+    numbers = dict(zip(close.columns, list(sids) + [100000 + i for i in range(n_assets)]))
+    return DailyBars.from_frames(frames, numbers)
+
+
+def start_algorithm(module, bars, context_attrs):
+    # a TradingAlgorithm positioned on the last session with initialize already run
+    algo = TradingAlgorithm(module, bars, context_attrs=context_attrs)
+    algo.index = algo.session = len(bars.sessions) - 1
+    previous = api.set_algorithm(algo)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            algo.callback('initialize')(algo.context, algo.data)
+    finally:
+        api.set_algorithm(previous)
+    return algo
+
+
+def run_in(algo, func):
+    def call():
+        previous = api.set_algorithm(algo)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                return func(algo.context, algo.data)
+        finally:
+            api.set_algorithm(previous)
+    return call
+
+
+'''
+Cases: setup(n_assets) returns (callable, units of work per call, unit name)
+'''
+
+
+def evaluation_function(n_assets):
+    ga = algorithm('genetic_default')
+    prices = factor_prices(n_assets, DAYS, seed=n_assets)
+    individual = {'Genome': list(np.random.RandomState(0).uniform(0, 100, n_assets)), 'Fitness': 0, 'ER': 0}
+    return lambda: ga.EvaluationFunction(individual, prices), 1, 'evaluations'
+
+
+def evaluate_population(n_assets):
+    ga = algorithm('genetic_default')
+    P, C = ga.portfolioMoments(factor_prices(n_assets, DAYS, seed=n_assets))
+    genomes = np.random.RandomState(0).uniform(0, 100, (200, n_assets))
+    return lambda: ga.EvaluatePopulation(genomes, P, C), 200, 'evaluations'
+
+
+def chunked_evaluation(n_assets):
+    # a population in the thousands scored in float32 within a 16 MB budget for the chunk arrays
+    ga = algorithm('genetic_default')
+    P, C = ga.portfolioMoments(factor_prices(n_assets, DAYS, seed=n_assets))
+    P, C = P.astype(np.float32), C.astype(np.float32)
+    genomes = np.random.RandomState(0).uniform(0, 100, (2000, n_assets))
+    return lambda: ga.EvaluatePopulation(genomes, P, C, memory_budget=16 * 2 ** 20), 2000, 'evaluations'
+
+
+def tournament_selection(n_assets):
+    ga = algorithm('genetic_default')
+    pop = ga.Population.random(200, n_assets)
+    pop.fitness = np.random.RandomState(0).normal(size=200)
+    individuals = pop.toIndividuals()
+
+    def generation():
+        # one generation's worth of parent picks
+        for _ in range(200):
+            ga.tournamentSelection(individuals, 5)
+    return generation, 200, 'tournaments'
+
+
+def evolve(n_assets):
+    ga = algorithm('genetic_default')
+    prices = factor_prices(n_assets, DAYS, seed=n_assets)
+    state = {}
+
+    def run():
+        np.random.seed(0)
+        hof, pop, result, stats = ga.Evolve(prices, pop_size=100, generations=20)
+        state['evaluations'] = stats['evaluations']
+    run()
+    return run, state['evaluations'], 'evaluations'
+
+
+def optimize(n_assets):
+    ga = algorithm('genetic_default')
+    bars = synthetic_bars(max(n_assets, 4), DAYS + 1, symbols=GA_SYMBOLS)
+    # full-length GA runs (no stagnation or time stop) so that the work per call is fixed; 'auto'
+    # would hand every universe up to 500 names to the max-Sharpe solver
+    algo = start_algorithm(ga, bars, {'assets': bars.assets[:n_assets], 'optimizer': 'ga', 'ga_stagnation': None,
+                                      'ga_time_budget': None})
+
+    def run(context, data):
+        np.random.seed(0)
+        context.moments = ga.RollingMoments()
+        ga.Optimize(context, data)
+    return run_in(algo, run), 1, 'rebalances'
+
+
+def reallocate(n_assets):
+    # EAA needs its four risky sids plus the cash/bill sid, so the 4-asset case runs on those 5
+    eaa = algorithm('elastic_asset_allocation')
+    bars = synthetic_bars(max(n_assets, 5), 320, sids=EAA_SIDS)
+    active = bars.assets[:max(n_assets, 5)]
+    algo = start_algorithm(eaa, bars, {'active': active})
+    # the old history() API covers the referenced assets, which are the whole active list here
+    algo.referenced.update((asset, True) for asset in active)
+    return run_in(algo, eaa.reallocate), 1, 'rebalances'
+
+
+def eaa_allocations(n_assets):
+    # a decade of month ends for n_assets / 5 five-asset universes and 20 score-weight variants
+    eaa = algorithm('elastic_asset_allocation')
+    universes = max(n_assets // 5, 1)
+    rng = np.random.RandomState(n_assets)
+    monthly = np.exp(np.cumsum(rng.normal(0.004, 0.04, (universes, 132, 5)), axis=1))
+    bill = np.exp(np.cumsum(rng.normal(0.001, 0.001, (universes, 132, 1)), axis=1))
+    ivol = rng.uniform(0.5, 2.0, (universes, 120, 5))
+    score_weights = np.column_stack([rng.choice([0.0, 1.0, 2.0], 20), rng.choice([0.0, 1.0], 20),
+                                     rng.choice([0.0, 0.25, 0.5], 20), rng.choice([0.5, 1.0], 20),
+                                     np.full(20, 1e-6), rng.choice([0.0, 1.0, 4.0], 20)])
+    windows = eaa.monthly_windows(monthly)
+    bills = eaa.monthly_windows(bill)[..., 0]
+    return lambda: eaa.eaa_allocations(windows, bills, ivol, score_weights, 4), 20 * universes * 120, 'allocations'
+
+
+def order_optimal_portfolio(n_assets):
+    # MaximizeAlpha under the constraints of the long-short algorithms, from a held portfolio
+    rng = np.random.RandomState(n_assets)
+    assets = pd.Index(['S%04d' % i for i in range(n_assets)])
+    alphas = pd.Series(rng.randn(n_assets), index=assets)
+    loadings = pd.DataFrame(rng.randn(n_assets, len(SECTORS + STYLES)) * 0.1, index=assets,
+                            columns=SECTORS + STYLES)
+    current = pd.Series(rng.uniform(-1.0, 1.0, n_assets), index=assets)
+    current = current - current.mean()
+    current = current / current.abs().sum()
+    limit = max(1.5 / n_assets, 0.015)
+    constraints = [opt.PositionConcentration.with_equal_bounds(-limit, limit), opt.MaxGrossExposure(1.0),
+                   opt.DollarNeutral(), opt.MaxTurnover(0.5), opt.RiskModelExposure(loadings)]
+    return lambda: opt.run_optimization(opt.MaximizeAlpha(alphas), constraints, current), 1, 'optimizations'
+
+
+def streaming_pipeline(n_assets):
+    # a quarter of sessions of mean_reversion's pipeline, one session per call as a live feed would
+    mean_reversion = algorithm('mean_reversion')
+    bars = synthetic_bars(n_assets, 300 + 63)
+    pipeline = mean_reversion.make_pipeline()
+
+    def run():
+        engine = PipelineEngine(bars, streaming=True)
+        for index in range(300, 300 + 63):
+            engine.compute(pipeline.terms(), index, index + 1)
+    return run, 63, 'sessions'
+
+
+CASES = [('EvaluationFunction', evaluation_function), ('EvaluatePopulation', evaluate_population),
+         ('chunked_evaluation', chunked_evaluation),
+         ('tournamentSelection', tournament_selection), ('Evolve', evolve), ('Optimize', optimize),
+         ('reallocate', reallocate), ('eaa_allocations', eaa_allocations),
+         ('order_optimal_portfolio', order_optimal_portfolio), ('streaming_pipeline', streaming_pipeline)]
+
+
+def measure(call, repeat, max_seconds):
+    # best of `repeat` wall times, fewer repeats for calls slower than max_seconds; then one traced run
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+        if timings[-1] > max_seconds:
+            break
+    tracemalloc.start()
+    try:
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return min(timings), peak / 2.0 ** 20
+
+
+def compare(results, baseline, tolerance):
+    rows = []
+    for key, result in results.items():
+        row = dict(result)
+        base = baseline.get(key)
+        if base:
+            row['base_s'] = base['seconds']
+            row['change'] = result['seconds'] / base['seconds'] - 1.0
+            slower = result['seconds'] > base['seconds'] * (1 + tolerance)
+            # a megabyte of slack keeps the tiny cases from flagging on allocator noise
+            bigger = result['peak_mb'] > base['peak_mb'] * (1 + tolerance) + 1.0
+            row['flag'] = ' '.join(flag for flag, hit in (('SLOWER', slower), ('MEMORY', bigger)) if hit)
+        rows.append(row)
+    return pd.DataFrame(rows).set_index('case')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--assets', type=int, nargs='+', default=[4, 50, 500, 2000])
+    parser.add_argument('--cases', nargs='+', default=[name for name, _ in CASES])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=2.0, help='stop repeating a case slower than this')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown or memory growth')
+    args = parser.parse_args()
+
+    results = {}
+    for name, setup in CASES:
+        if name not in args.cases:
+            continue
+        for n_assets in args.assets:
+            call, units, unit = setup(n_assets)
+            seconds, peak = measure(call, args.repeat, args.max_seconds)
+            key = '%s/%d' % (name, n_assets)
+            results[key] = {'case': key, 'seconds': seconds, 'per_sec': units / seconds, 'unit': unit,
+                            'peak_mb': peak}
+            print('%-28s %10.4fs %14.1f %-12s %9.1f MB' % (key, seconds, units / seconds, unit + '/s', peak))
+            sys.stdout.flush()
+
+    baseline = {}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=1, sort_keys=True)
+        print('baseline saved to %s' % args.baseline)
+        return 0
+    if not baseline:
+        print('no baseline at %s: timings are per machine, so record one with --save-baseline on the reference '
+              'commit first' % args.baseline)
+        return 0
+
+    table = compare(results, baseline, args.tolerance)
+    with pd.option_context('display.width', 200, 'display.float_format', '{:.4g}'.format):
+        print(table.to_string())
+    regressions = table.index[table.get('flag', pd.Series('', index=table.index)).fillna('') != '']
+    if len(regressions):
+        print('regressions: %s' % ', '.join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
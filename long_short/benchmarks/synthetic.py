@@ -0,0 +1,45 @@
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+ALGORITHMS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'algorithms')
+
+
+def load_algorithm(relative_path):
+    """
+    Import one of the algorithm files by path, registered in sys.modules under its file name
+    so the island workers can find it.
+    """
+    name = os.path.splitext(os.path.basename(relative_path))[0]
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(ALGORITHMS_DIR, relative_path))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+
+def factor_returns(n_assets, n_days, factors=3, seed=0):
+    """
+    Daily returns with a k-factor structure: market-like factors plus idiosyncratic noise,
+    and a small positive drift that differs per asset.
+    """
+    rng = np.random.RandomState(seed)
+    loadings = rng.normal(1.0 / factors, 0.5, (n_assets, factors))
+    factor_paths = rng.normal(0.0003, 0.008, (n_days, factors))
+    noise = rng.normal(0.0, 1.0, (n_days, n_assets)) * rng.uniform(0.005, 0.02, n_assets)
+    drift = rng.normal(0.0002, 0.0003, n_assets)
+    return factor_paths.dot(loadings.T) + noise + drift
+
+
+def factor_prices(n_assets, n_days, factors=3, seed=0, start='2010-01-04'):
+    """
+    Seeded price history (business days x assets) generated from factor_returns.
+    """
+    returns = factor_returns(n_assets, n_days - 1, factors, seed)
+    prices = 100.0 * np.vstack((np.ones(n_assets), np.cumprod(1.0 + returns, axis=0)))
+    return pd.DataFrame(prices, index=pd.bdate_range(start, periods=n_days),
+                        columns=['ASSET%d' % i for i in range(n_assets)])